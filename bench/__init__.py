@@ -0,0 +1,7 @@
+"""Offline benchmarks.
+
+Harnesses for measuring the app's request pipelines without live Twitter,
+PayPal or App Engine services. Run them from the project root, e.g.
+
+  python -m bench.replay bench/data/sample_captures.jsonl
+"""
@@ -0,0 +1,115 @@
+"""Cold Start Benchmark.
+
+Measures what a cold instance pays to import the script that serves each
+route (see app.yaml) before it can handle its first request: for every route
+the script is imported in a fresh interpreter, several times over, and the
+import time and the number of modules it loaded are reported, along with
+which of the slow stacks (OAuth, PayPal's client, the template stack, the
+ranking stack) came with it. The "all" row imports every script, which is
+what the single main.py that used to serve every route cost.
+
+Unlike the other benchmarks this one imports the app's real modules, so it
+needs the App Engine SDK (pass its directory with --sdk unless it's already
+on the path) and a config.py.
+
+  python -m bench.coldstart --sdk ~/google_appengine -n 10
+"""
+
+import os
+import sys
+import optparse
+import subprocess
+
+try:
+  import json
+except ImportError:
+  from django.utils import simplejson as json
+
+from bench.replay import percentile
+
+# (route, scripts that serve it)
+
+ROUTES = [('/data', ['datahandler']),
+          ('/app', ['main']),
+          ('/set_ec', ['payments']),
+          ('/_ah/warmup', ['warmup']),
+          ('all', ['main', 'datahandler', 'payments', 'warmup'])]
+
+# Modules that mark a slow stack as loaded
+
+STACKS = [('oauth', 'oauth'),
+          ('paypal', 'paypal.interface'),
+          ('templates', 'django.template'),
+          ('ranking', 'relevance')]
+
+# Run in a fresh interpreter: sets up the SDK's paths, then times importing the scripts
+
+CHILD = """
+import sys, time
+sdk = %(sdk)r
+if sdk:
+  sys.path.insert(0, sdk)
+  import dev_appserver
+  dev_appserver.fix_sys_path()
+sys.path.insert(0, %(root)r)
+before = len(sys.modules)
+start = time.time()
+for name in %(scripts)r:
+  __import__(name)
+elapsed = time.time() - start
+print repr((elapsed, len(sys.modules) - before, [m for m in %(stacks)r if sys.modules.get(m)]))
+"""
+
+
+def measure(scripts, sdk=None, python=sys.executable):
+  """Imports scripts in a fresh interpreter and returns (seconds, modules
+  loaded, the STACKS modules among them)."""
+
+  code = CHILD % {'sdk' : sdk, 'root' : os.getcwd(), 'scripts' : scripts,
+                  'stacks' : [module for (name, module) in STACKS]}
+
+  child = subprocess.Popen([python, '-c', code], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+  out, err = child.communicate()
+  if child.returncode != 0:
+    raise RuntimeError("Importing %s failed:\n%s" % (', '.join(scripts), err))
+
+  return eval(out.strip().splitlines()[-1])
+
+
+def main(argv=None):
+  parser = optparse.OptionParser(usage="%prog [options]")
+  parser.add_option("-n", "--iterations", type="int", default=5,
+                    help="fresh interpreters per route")
+  parser.add_option("--sdk", help="App Engine SDK directory")
+  parser.add_option("--python", default=sys.executable,
+                    help="interpreter to import with (the SDK's Python 2)")
+  parser.add_option("--json", action="store_true", help="print the results as JSON")
+  options, args = parser.parse_args(argv)
+
+  sdk = options.sdk and os.path.expanduser(options.sdk)
+  names = dict([(module, name) for (name, module) in STACKS])
+
+  results = []
+  if not options.json:
+    print "%-12s %10s %10s %10s %8s  %s" % ('route', 'p50 ms', 'max ms', 'min ms', 'modules', 'stacks')
+
+  for route, scripts in ROUTES:
+    samples = [measure(scripts, sdk, options.python) for i in range(options.iterations)]
+    seconds = [s[0] for s in samples]
+    modules = samples[-1][1]
+    stacks = [names[m] for m in samples[-1][2]]
+
+    results.append({'route' : route, 'scripts' : scripts, 'p50' : percentile(seconds, 50),
+                    'max' : max(seconds), 'min' : min(seconds), 'modules' : modules, 'stacks' : stacks})
+
+    if not options.json:
+      print "%-12s %10.1f %10.1f %10.1f %8d  %s" % (route, percentile(seconds, 50) * 1000,
+            max(seconds) * 1000, min(seconds) * 1000, modules, ', '.join(stacks) or '-')
+      sys.stdout.flush()
+
+  if options.json:
+    print json.dumps(results, indent=2)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,128 @@
+"""Term Counting Benchmark.
+
+Counts the terms of synthetic favorites histories of increasing size (see
+bench.synthetic) exactly, the way relevance.top_terms does by default, and
+with topk.SpaceSaving at a few capacities, and reports how well the
+approximate top N matches the exact one:
+
+  recall    the fraction of the exact top N terms that are in the approximate
+            top N (leaving out terms tied with the first term after the top
+            N, which could go either way)
+  max err   the largest overestimate of a top N term's count, as a fraction
+            of its true count
+  bytes     the size of the exact frequency map pickled, or of the encoded
+            SpaceSaving state
+
+It exits with a non-zero status if any capacity of at least 10 * N (the
+default capacity for the default N) recalls less than MIN_RECALL of the top
+N, so it can be run as an accuracy check.
+
+  python -m bench.counting --sizes 100,1000,10000,100000 --capacities 1000,2000,4000
+"""
+
+import sys
+import time
+import optparse
+
+try:
+  import cPickle as pickle
+except ImportError:
+  import pickle
+
+import topk
+import relevance
+
+from bench.synthetic import TimelineGenerator
+
+MIN_RECALL = 0.95
+
+
+def exact_counts(term_lists):
+  freqs = {}
+  for terms in term_lists:
+    for term in terms:
+      freqs[term] = freqs.get(term, 0) + 1
+  return freqs
+
+
+def exact_top(freqs, n):
+  """Returns the terms that are in the top n by freqs however ties are
+  broken."""
+
+  counts = sorted(freqs.values(), reverse=True)
+  if len(counts) <= n:
+    return set(freqs)
+
+  return set([term for (term, count) in freqs.iteritems() if count > counts[n]])
+
+
+def compare(term_lists, capacity, n, freqs, expected):
+  """Returns (recall, max relative error, state bytes, seconds) for
+  counting term_lists with a SpaceSaving of capacity."""
+
+  start = time.time()
+  counter = topk.SpaceSaving(capacity)
+  counter.update(term_lists)
+  top = counter.top(n)
+  elapsed = time.time() - start
+
+  found = set([term for (term, count, error) in top])
+  recall = expected and 1.0 * len(found & expected) / len(expected) or 1.0
+  max_error = max([1.0 * (count - freqs[term]) / freqs[term] for (term, count, error) in top] or [0.0])
+
+  return recall, max_error, len(counter.encode()), elapsed
+
+
+def main(argv=None):
+  parser = optparse.OptionParser(usage="%prog [options]")
+  parser.add_option("--sizes", default="100,1000,10000,100000",
+                    help="comma separated numbers of favorites")
+  parser.add_option("--capacities", default="1000,2000,4000",
+                    help="comma separated SpaceSaving capacities")
+  parser.add_option("-n", "--top", type="int", default=relevance.TOP_N,
+                    help="number of top terms compared")
+  parser.add_option("--vocabulary", type="int", default=50000,
+                    help="synthetic vocabulary size")
+  parser.add_option("--zipf", type="float", default=1.1,
+                    help="skew of the term distribution")
+  parser.add_option("--seed", type="int", default=1)
+  options, args = parser.parse_args(argv)
+
+  generator = TimelineGenerator(vocabulary_size=options.vocabulary, zipf_s=options.zipf, seed=options.seed)
+  capacities = [int(c) for c in options.capacities.split(',')]
+  n = options.top
+
+  print "%10s %10s %10s %8s %8s %10s %10s" % ('favorites', 'capacity', 'terms', 'recall', 'max err',
+                                              'bytes', 'ms')
+
+  failed = False
+  for size in [int(s) for s in options.sizes.split(',')]:
+    term_lists = [terms for (terms, tweet) in relevance.tokenize_statuses(generator.statuses(size))]
+
+    start = time.time()
+    freqs = exact_counts(term_lists)
+    relevance.top_terms(term_lists, n)
+    elapsed = time.time() - start
+
+    expected = exact_top(freqs, n)
+
+    print "%10d %10s %10d %8s %8s %10d %10.1f" % (size, 'exact', len(freqs), '-', '-',
+          len(pickle.dumps(freqs, pickle.HIGHEST_PROTOCOL)), elapsed * 1000)
+
+    for capacity in capacities:
+      recall, max_error, size_bytes, elapsed = compare(term_lists, capacity, n, freqs, expected)
+      print "%10d %10d %10d %8.3f %8.3f %10d %10.1f" % (size, capacity, min(capacity, len(freqs)),
+            recall, max_error, size_bytes, elapsed * 1000)
+
+      if capacity >= 10 * n and recall < MIN_RECALL:
+        failed = True
+
+    sys.stdout.flush()
+
+  if failed:
+    print "FAILED: recall under %.2f with a capacity of at least 10 * N" % MIN_RECALL
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+  main()
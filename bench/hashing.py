@@ -0,0 +1,124 @@
+"""Term Hashing Benchmark.
+
+Normalizes synthetic timelines (see bench.synthetic) with terms kept as
+strings and hashed to a few widths (see normalize.py), and reports for each
+width how often terms collide and what that does to the ranking, to help
+pick TERM_HASH_BITS:
+
+  colliding  the fraction of distinct terms that share their hash with another
+             term (expected is the same for a uniformly random hash)
+  top N      the fraction of the top N favorite terms that hashing left in the
+             top N
+  rescored   the fraction of home timeline tweets whose score changed
+  rank ms    the time rank() took over the normalized timelines
+  term bytes the memory taken by the normalized terms (or hashes) of every
+             tweet, as held by the tweet cache
+
+N is lowered to the number of terms that are in the top N whichever way ties
+are broken, so that only collisions (not tie breaking) change the results.
+
+  python -m bench.hashing --bits 16,20,24,32 --home 2000 --favorites 2000
+"""
+
+import sys
+import time
+import optparse
+
+import dedup
+import normalize
+import relevance
+
+from bench.synthetic import TimelineGenerator
+
+
+def normalized(statuses, normalizer):
+  return [(tuple(normalizer(status['text'])), status) for status in statuses]
+
+
+def term_bytes(entries):
+  return sum([sys.getsizeof(terms) + sum([sys.getsizeof(term) for term in terms]) for (terms, status) in entries])
+
+
+def measure(home, favorites, bits, n):
+  """Ranks home against favorites with terms hashed to bits bits (or kept
+  as strings if bits is 0) and returns the normalized entries and timings."""
+
+  normalizer = normalize.Normalizer(stem=False, hash_bits=bits)
+  home = normalized(home, normalizer)
+  favorites = normalized(favorites, normalizer)
+
+  start = time.time()
+  relevant, top_n_terms = relevance.rank(home, favorites, n)
+  elapsed = time.time() - start
+
+  return home, favorites, top_n_terms, relevant, elapsed
+
+
+def main(argv=None):
+  parser = optparse.OptionParser(usage="%prog [options]")
+  parser.add_option("--bits", default="16,18,20,24,32",
+                    help="comma separated hash widths")
+  parser.add_option("--home", type="int", default=2000, help="home timeline size")
+  parser.add_option("--favorites", type="int", default=2000, help="favorites size")
+  parser.add_option("-n", "--top", type="int", default=relevance.TOP_N,
+                    help="number of top terms compared")
+  parser.add_option("--vocabulary", type="int", default=50000,
+                    help="synthetic vocabulary size")
+  parser.add_option("--zipf", type="float", default=1.1,
+                    help="skew of the term distribution")
+  parser.add_option("--seed", type="int", default=1)
+  options, args = parser.parse_args(argv)
+
+  # Collapsing would group tweets differently as hashes collide; leave it out of the comparison
+
+  dedup.configure(enabled=False)
+
+  generator = TimelineGenerator(vocabulary_size=options.vocabulary, zipf_s=options.zipf, seed=options.seed)
+  home = list(generator.statuses(options.home))
+  favorites = list(generator.statuses(options.favorites, first_id=80000000000000000))
+  n = options.top
+
+  normalizer = normalize.Normalizer(stem=False)
+  freqs = {}
+  for status in favorites:
+    for term in normalizer(status['text']):
+      freqs[term] = freqs.get(term, 0) + 1
+  counts = sorted(freqs.values(), reverse=True)
+  if len(counts) > n:
+    n = len([count for count in counts if count > counts[n]])
+
+  home_terms, favorite_terms, top_n_terms, relevant, elapsed = measure(home, favorites, 0, n)
+  vocabulary = set()
+  for terms, status in home_terms + favorite_terms:
+    vocabulary.update(terms)
+  scores = dict([(tweet['id'], tweet['relevance']) for tweet in relevant])
+
+  print "%d distinct terms, top %d compared" % (len(vocabulary), n)
+  print "%6s %10s %10s %8s %10s %10s %12s" % ('bits', 'colliding', 'expected', 'top N', 'rescored',
+                                              'rank ms', 'term bytes')
+  print "%6s %10s %10s %8s %10s %10.2f %12d" % ('-', '-', '-', '-', '-', elapsed * 1000,
+        term_bytes(home_terms + favorite_terms))
+
+  for bits in [int(b) for b in options.bits.split(',')]:
+    hashed_home, hashed_favorites, hashed_top, hashed_relevant, elapsed = measure(home, favorites, bits, n)
+
+    buckets = {}
+    for term in vocabulary:
+      h = normalize.hash_term(term, bits)
+      buckets[h] = buckets.get(h, 0) + 1
+    colliding = sum([count for count in buckets.values() if count > 1])
+    expected = 1 - (1 - 1.0 / 2 ** bits) ** (len(vocabulary) - 1)
+
+    kept = len(set([normalize.hash_term(term, bits) for term in top_n_terms]) & hashed_top)
+
+    hashed_scores = dict([(tweet['id'], tweet['relevance']) for tweet in hashed_relevant])
+    rescored = len([i for i in set(scores) | set(hashed_scores) if scores.get(i) != hashed_scores.get(i)])
+
+    print "%6d %10.5f %10.5f %8.3f %10.5f %10.2f %12d" % (bits, 1.0 * colliding / len(vocabulary), expected,
+          1.0 * kept / max(len(top_n_terms), 1), 1.0 * rescored / len(home), elapsed * 1000,
+          term_bytes(hashed_home + hashed_favorites))
+    sys.stdout.flush()
+
+
+if __name__ == '__main__':
+  main()
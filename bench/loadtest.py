@@ -0,0 +1,562 @@
+"""Load Test.
+
+Drives the app's WSGI applications in-process from many threads, each a user
+going around the app's main loop: logging in (/login, /app), polling /data
+for their ranked tweets and, once they're out of logins, recharging through
+the PayPal payflow (/set_ec, /get_ec_details, /do_ec_payment). A fraction of
+the logins and payments are double tapped (sent twice at once), the way
+impatient users and flaky networks send them. It reports throughput, latency
+percentiles and errors per route, and correctness violations.
+
+Requests go to main.py, datahandler.py or payments.py the way app.yaml routes
+them, and the services those use are replaced with local ones that inject
+latency and failures:
+
+  memcache, datastore  the SDK's in-memory stubs (set up with testbed); every
+                       RPC takes --<service>-latency seconds and fails with a
+                       DeadlineExceededError at --<service>-failure-rate
+  Twitter              bench.stubs.Twitter, serving synthetic timelines (see
+                       bench.synthetic) in place of oauth.TwitterClient
+  PayPal               bench.stubs.PayPal, in place of PayPal's client (see
+                       payments.load_paypal)
+  task queue           worker threads that POST the refreshes /app enqueues
+                       to /tasks/refresh, the way App Engine runs the tasks
+
+The violations checked for:
+
+  negative balance     a user's requests_remaining went below zero
+  double metered       a double tapped login was metered twice
+  double credit        a recharge was credited more than once, or without
+                       PayPal charging for it
+  uncredited payment   PayPal charged for a recharge that wasn't credited
+  metering mismatch    a user's requests_remaining at the end isn't what the
+                       logins they were served and the recharges credited
+                       to them leave (with failures injected, requests that
+                       failed after metering show up here too)
+  wrong user           /data answered a session with another user's tweets
+
+It exits with a non-zero status if there were any.
+
+All the threads share one process, so this models a single (threadsafe)
+instance: the in-process caches in front of memcache and the tweet and
+SimHash caches (see cache.py, relevance.tweet_cache and dedup.py) are shared
+by every simulated user, and are as warm as one busy instance's would be.
+With more instances each has its own, colder, caches and only memcache and
+the datastore are shared.
+
+Like bench.coldstart this needs the App Engine SDK (pass its directory with
+--sdk unless it's already on the path). config.py is used if there is one,
+and config.template.py otherwise, since none of the stand-ins check
+credentials.
+
+  python -m bench.loadtest --sdk ~/google_appengine --users 50 --duration 60 \\
+      --datastore-latency 0.02 --datastore-failure-rate 0.01 --double-tap 0.2
+"""
+
+from __future__ import with_statement
+
+import os
+import re
+import sys
+import cgi
+import imp
+import time
+import Queue
+import random
+import urllib
+import logging
+import optparse
+import urlparse
+import threading
+
+from StringIO import StringIO
+
+try:
+  import json
+except ImportError:
+  from django.utils import simplejson as json
+
+# The app's modules, and the bench modules that import them, pick their fallbacks for missing
+# App Engine APIs when they're imported, so they're only imported once load() has set up the SDK
+
+# (path pattern, script that serves it), as in app.yaml
+
+ROUTES = [(r'/data$', 'datahandler'),
+          (r'/(set_ec|get_ec_details|do_ec_payment|cancel_ec)$', 'payments'),
+          (r'.*', 'main')]
+
+HOST = 'localhost:8080'
+
+# Logins a recharge buys (see PaymentHandler._getProduct)
+
+RECHARGE_QUANTITY = 100
+
+SID_FIELD = re.compile(r"name='sid' value='(\d+)'")
+
+VIOLATIONS = ('negative balance', 'double metered', 'double credit', 'uncredited payment',
+              'metering mismatch', 'wrong user')
+
+
+def load(sdk=None):
+  """Puts the SDK on the path and config in place, and returns an active
+  testbed with in-memory datastore and memcache stubs."""
+
+  if sdk:
+    sys.path.insert(0, sdk)
+    import dev_appserver
+    dev_appserver.fix_sys_path()
+
+  try:
+    import config
+  except ImportError:
+    config = imp.new_module('config')
+    execfile('config.template.py', config.__dict__)
+    sys.modules['config'] = config
+
+  from google.appengine.ext import testbed
+
+  bed = testbed.Testbed()
+  bed.activate()
+  bed.init_datastore_v3_stub()
+  bed.init_memcache_stub()
+
+  return bed
+
+
+class FaultInjector(object):
+  """Fault Injector.
+
+  Takes over the RPCs of an API stub: each is delayed by latency seconds and
+  fails at failure_rate, and is otherwise run on the stub under a lock, since
+  the real services apply each call atomically and not every stub is thread
+  safe. Calls pass straight through while enabled is False.
+  """
+
+  def __init__(self, stub, latency=0.0, failure_rate=0.0):
+    from google.appengine.runtime import apiproxy_errors
+
+    self.error = apiproxy_errors.DeadlineExceededError
+    self.latency = latency
+    self.failure_rate = failure_rate
+    self.enabled = True
+    self.calls = 0
+    self.failures = 0
+    self.lock = threading.Lock()
+
+    self.make_call = stub.MakeSyncCall
+    stub.MakeSyncCall = self.call
+
+  def call(self, service, call, request, response, *args):
+    if self.enabled:
+      if self.latency:
+        time.sleep(self.latency)
+      if self.failure_rate and random.random() < self.failure_rate:
+        with self.lock:
+          self.failures += 1
+        raise self.error("Injected failure of %s.%s" % (service, call))
+
+    with self.lock:
+      self.calls += 1
+      return self.make_call(service, call, request, response, *args)
+
+
+class Stats(object):
+  """Collects request latencies and errors per route, and violations."""
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.latencies = {} # route -> [seconds]
+    self.errors = {} # route -> count
+    self.violations = {} # kind -> [details]
+
+  def record(self, route, elapsed, status):
+    with self.lock:
+      self.latencies.setdefault(route, []).append(elapsed)
+      if status is None or status >= 500:
+        self.errors[route] = self.errors.get(route, 0) + 1
+
+  def violation(self, kind, detail):
+    with self.lock:
+      self.violations.setdefault(kind, []).append(detail)
+
+
+class App(object):
+  """The handler scripts' WSGI applications as one, routed like app.yaml."""
+
+  def __init__(self, stats):
+    import main
+    import datahandler
+    import payments
+
+    self.routes = [(re.compile(pattern), sys.modules[script].application) for (pattern, script) in ROUTES]
+    self.stats = stats
+
+  def request(self, method, path, params=None):
+    """Sends a request and returns its (status, headers, body). The status
+    is None if the application raised."""
+
+    query = urllib.urlencode(params or {})
+    body = ''
+    if method == 'POST':
+      body, query = query, ''
+
+    environ = {'REQUEST_METHOD' : method, 'SCRIPT_NAME' : '', 'PATH_INFO' : path, 'QUERY_STRING' : query,
+               'CONTENT_TYPE' : 'application/x-www-form-urlencoded', 'CONTENT_LENGTH' : str(len(body)),
+               'SERVER_NAME' : HOST.split(':')[0], 'SERVER_PORT' : HOST.split(':')[1], 'HTTP_HOST' : HOST,
+               'SERVER_PROTOCOL' : 'HTTP/1.1', 'wsgi.version' : (1, 0), 'wsgi.url_scheme' : 'http',
+               'wsgi.input' : StringIO(body), 'wsgi.errors' : sys.stderr, 'wsgi.multithread' : True,
+               'wsgi.multiprocess' : False, 'wsgi.run_once' : False}
+
+    for pattern, application in self.routes:
+      if pattern.match(path):
+        break
+
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+      response['status'] = int(status.split()[0])
+      response['headers'] = dict([(name.lower(), value) for (name, value) in headers])
+      return StringIO().write
+
+    start = time.time()
+    try:
+      content = ''.join(application(environ, start_response))
+    except Exception:
+      logging.exception("%s %s raised" % (method, path))
+      response = {'status' : None, 'headers' : {}}
+      content = ''
+
+    self.stats.record(path, time.time() - start, response['status'])
+    return response['status'], response['headers'], content
+
+
+def location_params(headers):
+  """Returns the query parameters of a redirect's location."""
+
+  query = urlparse.urlparse(headers.get('location', ''))[4]
+  return dict([(name, values[0]) for (name, values) in cgi.parse_qs(query).items()])
+
+
+class TaskQueue(object):
+  """Task Queue.
+
+  Stand-in for refresh.TaskQueue that runs the tasks too: workers POST each
+  username added to /tasks/refresh, the way App Engine runs the refresh
+  tasks. As with the named tasks, a user is only added once per
+  dedup_window seconds.
+  """
+
+  def __init__(self, app, workers, dedup_window):
+    self.app = app
+    self.dedup_window = dedup_window
+    self.tasks = Queue.Queue()
+    self.names = set()
+    self.lock = threading.Lock()
+
+    self.threads = [threading.Thread(target=self.work) for i in range(workers)]
+    for thread in self.threads:
+      thread.setDaemon(True)
+      thread.start()
+
+  def add(self, username, dedup=True):
+    name = (username, int(time.time() / self.dedup_window))
+    with self.lock:
+      if dedup and name in self.names:
+        return False
+      self.names.add(name)
+
+    self.tasks.put(username)
+    return True
+
+  def work(self):
+    while True:
+      username = self.tasks.get()
+      if username is None:
+        return
+      self.app.request('POST', '/tasks/refresh', {'username' : username})
+
+  def stop(self):
+    """Waits for the tasks already added to run, then stops the workers."""
+
+    for thread in self.threads:
+      self.tasks.put(None)
+    for thread in self.threads:
+      thread.join()
+
+
+class VirtualUser(object):
+  """Virtual User.
+
+  A user going around the app's main loop (see the module docstring), who
+  keeps track of what their requests_remaining should be.
+  """
+
+  def __init__(self, app, paypal, stats, username, logins, polls=3, double_tap=0.0, think=0.0):
+    self.app = app
+    self.paypal = paypal
+    self.stats = stats
+    self.username = username
+    self.remaining = logins
+    self.sids = set() # of the metered sessions so far
+    self.polls = polls
+    self.double_tap = double_tap
+    self.think = think
+
+  def request(self, method, path, params=None):
+    if self.think:
+      time.sleep(self.think)
+    return self.app.request(method, path, params)
+
+  def tap(self, method, path, params):
+    """Sends a request, or at the double tap rate two of them at once, and
+    returns their responses."""
+
+    if not (self.double_tap and random.random() < self.double_tap):
+      return [self.request(method, path, params)]
+
+    responses = [None, None]
+
+    def send(i):
+      responses[i] = self.app.request(method, path, params)
+
+    threads = [threading.Thread(target=send, args=(i,)) for i in range(len(responses))]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+
+    return responses
+
+  def login(self):
+    """Logs in and returns the sids of the metered sessions, and the sid of
+    the session to recharge if the user was out of logins. A login that was
+    coalesced with an earlier one (see main.login) gets that one's session,
+    so only new sessions were metered."""
+
+    self.request('GET', '/login')
+
+    metered = set()
+    unmetered = None
+    for status, headers, content in self.tap('GET', '/app', {'oauth_token' : self.username,
+                                                             'oauth_verifier' : 'verifier'}):
+      if status == 302:
+        metered.add(location_params(headers).get('sid'))
+      elif status == 200:
+        match = SID_FIELD.search(content)
+        if match:
+          unmetered = match.group(1)
+
+    new = metered - self.sids
+    if len(new) > 1:
+      self.stats.violation('double metered', "%s was metered %d times for one double tapped login" %
+                           (self.username, len(new)))
+
+    self.sids.update(new)
+    self.remaining -= len(new)
+    return metered, unmetered
+
+  def poll(self, sid):
+    for i in range(self.polls):
+      status, headers, content = self.request('GET', '/data', {'sid' : sid})
+      if status != 200:
+        continue
+
+      user = json.loads(content)['user']
+      if user != self.username:
+        self.stats.violation('wrong user', "%s's session %s was answered with %s's tweets" % (self.username, sid, user))
+
+  def recharge(self, sid):
+    status, headers, content = self.request('POST', '/set_ec', {'sid' : sid})
+    if status != 302:
+      return
+
+    params = {'sid' : sid, 'token' : location_params(headers).get('token'), 'PayerID' : 'PAYER' + self.username}
+    status, headers, content = self.request('GET', '/get_ec_details', params)
+    if status != 200:
+      return
+
+    credited = len([status for (status, headers, content) in self.tap('GET', '/do_ec_payment', params)
+                    if status == 200 and 'Successful Payment' in content])
+
+    paid = self.paypal.paid(params['token'])
+    if credited > 1 or (credited and not paid):
+      self.stats.violation('double credit', "%s was credited %d times for %s, which PayPal %s" %
+                           (self.username, credited, params['token'], paid and "charged once" or "didn't charge"))
+    elif paid and not credited:
+      self.stats.violation('uncredited payment', "%s paid for %s but wasn't credited" % (self.username, params['token']))
+
+    if credited:
+      self.remaining = RECHARGE_QUANTITY
+
+  def run(self, until):
+    while time.time() < until:
+      metered, unmetered = self.login()
+      if metered:
+        self.poll(sorted(metered)[0])
+      elif unmetered:
+        self.recharge(unmetered)
+
+
+def run(options):
+  """Runs the load test described by options (see main()) and returns the
+  results."""
+
+  bed = load(options.sdk)
+
+  from google.appengine.api import apiproxy_stub_map
+  from google.appengine.api import urlfetch
+
+  import main
+  import oauth
+  import refresh
+  import payments
+
+  from models import User
+  from bench import stubs
+  from bench.replay import percentile
+  from bench.synthetic import TimelineGenerator
+
+  stats = Stats()
+  app = App(stats)
+
+  usernames = ['load%d' % i for i in range(options.users)]
+  for username in usernames:
+    User(twitter_username=username, requests_remaining=options.logins).put()
+
+  injectors = [('memcache', FaultInjector(apiproxy_stub_map.apiproxy.GetStub('memcache'),
+                                          options.memcache_latency, options.memcache_failure_rate)),
+               ('datastore', FaultInjector(apiproxy_stub_map.apiproxy.GetStub('datastore_v3'),
+                                           options.datastore_latency, options.datastore_failure_rate))]
+
+  # The stand-ins' timed out fetches have to raise urlfetch's error for the scheduler to retry them
+
+  stubs.DeadlineExceededError = urlfetch.DeadlineExceededError
+
+  generator = TimelineGenerator(seed=options.seed)
+  captures = [generator.capture(options.tweets, options.tweets) for i in range(options.captures)]
+  twitter = oauth.TwitterClient = stubs.Twitter(captures, options.twitter_latency, options.twitter_failure_rate)
+
+  paypal = stubs.PayPal(options.paypal_latency, options.paypal_failure_rate)
+  payments.load_paypal = lambda: paypal
+
+  queue = refresh.queue = TaskQueue(app, options.workers, refresh.DEDUP_WINDOW)
+
+  main.LOGIN_WINDOW = options.login_window
+
+  users = [VirtualUser(app, paypal, stats, username, options.logins, options.polls, options.double_tap, options.think)
+           for username in usernames]
+
+  start = time.time()
+  threads = [threading.Thread(target=user.run, args=(start + options.duration,)) for user in users]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  elapsed = time.time() - start
+
+  backlog = queue.tasks.qsize()
+  queue.stop()
+
+  # Check the balances with no more failures injected
+
+  for name, injector in injectors:
+    injector.enabled = False
+
+  balances = dict([(user.twitter_username, user.requests_remaining) for user in User.all()])
+  for user in users:
+    balance = balances[user.username]
+    if balance < 0:
+      stats.violation('negative balance', "%s has %d logins left" % (user.username, balance))
+    if balance != user.remaining:
+      stats.violation('metering mismatch', "%s has %d logins left, %d expected" %
+                      (user.username, balance, user.remaining))
+
+  bed.deactivate()
+
+  routes = []
+  for route in sorted(stats.latencies):
+    values = stats.latencies[route]
+    routes.append({'route' : route, 'n' : len(values), 'errors' : stats.errors.get(route, 0),
+                   'p50' : percentile(values, 50), 'p95' : percentile(values, 95),
+                   'p99' : percentile(values, 99), 'max' : max(values)})
+
+  services = [{'service' : name, 'calls' : injector.calls, 'failures' : injector.failures}
+              for (name, injector) in injectors]
+  services.append({'service' : 'twitter', 'calls' : sum([client.requests for client in twitter.clients])})
+  services.append({'service' : 'paypal', 'calls' : paypal.calls})
+
+  return {'users' : options.users, 'seconds' : elapsed, 'requests' : sum([route['n'] for route in routes]),
+          'backlog' : backlog, 'routes' : routes, 'services' : services, 'violations' : stats.violations}
+
+
+def report(results, out=sys.stdout):
+  seconds = results['seconds']
+
+  out.write("%d users for %.1f s: %d requests, %.1f requests/s, %d refreshes still queued\n\n" %
+            (results['users'], seconds, results['requests'], results['requests'] / seconds, results['backlog']))
+
+  out.write("%-16s %8s %8s %10s %10s %10s %10s %10s\n" % ('route', 'n', 'errors', 'p50 ms', 'p95 ms', 'p99 ms',
+                                                        'max ms', 'req/s'))
+  for route in results['routes']:
+    out.write("%-16s %8d %8d %10.1f %10.1f %10.1f %10.1f %10.1f\n" % (route['route'], route['n'],
+              route['errors'], route['p50'] * 1000, route['p95'] * 1000, route['p99'] * 1000,
+              route['max'] * 1000, route['n'] / seconds))
+
+  out.write("\n%-16s %8s %8s\n" % ('service', 'calls', 'failed'))
+  for service in results['services']:
+    out.write("%-16s %8d %8s\n" % (service['service'], service['calls'], service.get('failures', '-')))
+
+  out.write("\n%-20s %8s  %s\n" % ('violation', 'n', 'example'))
+  for kind in VIOLATIONS:
+    details = results['violations'].get(kind, [])
+    out.write("%-20s %8d  %s\n" % (kind, len(details), details and details[0] or '-'))
+
+
+def main(argv=None):
+  parser = optparse.OptionParser(usage="%prog [options]")
+  parser.add_option("--sdk", help="App Engine SDK directory")
+  parser.add_option("-u", "--users", type="int", default=20, help="concurrent virtual users")
+  parser.add_option("-d", "--duration", type="float", default=30.0, help="seconds to run for")
+  parser.add_option("--logins", type="int", default=3,
+                    help="logins each user starts with, so that they soon need to recharge")
+  parser.add_option("--polls", type="int", default=3, help="/data requests per login")
+  parser.add_option("--double-tap", type="float", default=0.1,
+                    help="fraction of logins and payments sent twice at once")
+  parser.add_option("--think", type="float", default=0.0, help="seconds a user waits between requests")
+  parser.add_option("--login-window", type="float", default=0.0,
+                    help="seconds a login's outcome is reused for (main.LOGIN_WINDOW), lower than the "
+                         "app's so that a short run's users get through their logins")
+  parser.add_option("--workers", type="int", default=4, help="threads running refresh tasks")
+  parser.add_option("--tweets", type="int", default=100, help="tweets per synthetic timeline")
+  parser.add_option("--captures", type="int", default=5, help="distinct synthetic users' timelines")
+  parser.add_option("--seed", type="int", default=1)
+
+  for service in ('memcache', 'datastore', 'twitter', 'paypal'):
+    parser.add_option("--%s-latency" % service, type="float", default=0.0,
+                      help="seconds each %s call takes" % service)
+    parser.add_option("--%s-failure-rate" % service, type="float", default=0.0,
+                      help="fraction of %s calls that fail" % service)
+
+  parser.add_option("--json", action="store_true", help="print the results as JSON")
+  parser.add_option("-v", "--verbose", action="store_true", help="show the app's logging")
+  options, args = parser.parse_args(argv)
+
+  if not options.verbose:
+    logging.getLogger().setLevel(logging.CRITICAL)
+
+  options.sdk = options.sdk and os.path.expanduser(options.sdk)
+  random.seed(options.seed)
+
+  results = run(options)
+
+  if options.json:
+    print json.dumps(results, indent=2)
+  else:
+    report(results)
+
+  if results['violations']:
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,181 @@
+"""Replay Benchmark.
+
+Replays recorded timeline and favorites payloads through the same
+fetch -> tokenize -> rank -> stash pipeline that AppHandler runs for /app,
+using the in-memory stand-ins in bench.stubs, and reports p50/p95/p99
+latency and throughput per stage.
+
+Captures are JSONL: one object per line with "home_timeline" and
+"favorites_timeline" lists of Twitter statuses (as returned by the API) and
+an optional "username".
+
+  python -m bench.replay bench/data/sample_captures.jsonl -n 50
+  python -m bench.replay --synthetic 2000 -n 5
+"""
+
+import sys
+import time
+import random
+import optparse
+
+try:
+  import json
+except ImportError:
+  from django.utils import simplejson as json
+
+import relevance
+import ratelimit
+import instrumentation
+
+from bench import stubs
+
+STAGES = ('fetch', 'tokenize', 'dedup', 'rank', 'stash', 'total')
+
+DEFAULT_CAPTURES = 'bench/data/sample_captures.jsonl'
+
+
+def load_captures(path):
+  """Returns the list of captures in the JSONL file at path."""
+
+  captures = []
+  for line in open(path):
+    line = line.strip()
+    if line:
+      captures.append(json.loads(line))
+
+  return captures
+
+
+def percentile(values, p):
+  """Nearest-rank percentile of a list of values."""
+
+  if not values:
+    return 0.0
+
+  values = sorted(values)
+  k = int(round(p / 100.0 * (len(values) - 1)))
+  return values[k]
+
+
+class Timings(object):
+  """Collects elapsed seconds per stage."""
+
+  def __init__(self):
+    self.samples = dict([(stage, []) for stage in STAGES])
+
+  def add(self, stage, elapsed):
+    self.samples.setdefault(stage, []).append(elapsed)
+
+  def report(self, out=sys.stdout):
+    out.write("%-10s %8s %10s %10s %10s %12s\n" % ('stage', 'n', 'p50 ms', 'p95 ms', 'p99 ms', 'ops/sec'))
+    for stage in STAGES:
+      values = self.samples.get(stage, [])
+      total = sum(values)
+      out.write("%-10s %8d %10.3f %10.3f %10.3f %12.1f\n" % (stage, len(values),
+                percentile(values, 50) * 1000, percentile(values, 95) * 1000,
+                percentile(values, 99) * 1000, total and len(values) / total or 0.0))
+
+
+def replay(capture, memcache, datastore, timings, client=None, num_pages=relevance.NUM_PAGES, deadline=None):
+  """Runs one /app request's worth of work for capture, recording timings."""
+
+  if client is None:
+    client = stubs.ReplayClient(capture)
+
+  username = capture.get('username', 'replay')
+
+  # fetch_timelines parses and tokenizes each page as it arrives, so its time is split into
+  # the fetch and tokenize stages using its tokenize spans: fetch is the rest of its wall time.
+  # (Its fetch:<timeline> spans are each page's latency, and pages are fetched concurrently, so
+  # their sum isn't a share of the total)
+
+  timer = instrumentation.Timer(username)
+
+  # Each replay starts with fresh rate limits, so that injected failures don't back off the
+  # replays that follow
+
+  start = time.time()
+  data = relevance.fetch_timelines(client, 'token', 'secret', num_pages, timer=timer,
+                                   limits=ratelimit.RateLimits(), deadline=deadline)
+  fetched = time.time() - start
+  relevant_tweets, top_n_terms = relevance.rank(data['home_timeline'], data['favorites_timeline'], timer=timer)
+
+  stages = {}
+  for name, (count, elapsed, longest) in timer.spans.items():
+    stage = name.split(':')[0]
+    if stage != 'fetch':
+      stages[stage] = stages.get(stage, 0.0) + elapsed
+
+  stages['fetch'] = max(fetched - stages.get('tokenize', 0.0), 0.0)
+
+  for stage, elapsed in stages.items():
+    timings.add(stage, elapsed)
+
+  t = time.time()
+  sid = str(random.random())[5:]
+  memcache.set(sid, {'username' : username, 'refresh_requested' : start}, time=60*10)
+  ranked = relevance.ranked_entry(relevant_tweets, data['home_timeline'])
+  memcache.set('ranked_' + username, ranked, time=60*60*24)
+  datastore.put('User', username, {'twitter_username' : username, 'requests_remaining' : 25})
+  timings.add('stash', time.time() - t)
+
+  timings.add('total', time.time() - start)
+
+  return sid
+
+
+def run(captures, iterations=10, latency=0.0, failure_rate=0.0, num_pages=relevance.NUM_PAGES,
+        slow_rate=0.0, slow_latency=1.0, deadline=None):
+  """Replays every capture iterations times and returns the Timings."""
+
+  memcache = stubs.Memcache()
+  datastore = stubs.Datastore()
+  timings = Timings()
+
+  clients = [stubs.ReplayClient(capture, latency=latency, failure_rate=failure_rate,
+                                slow_rate=slow_rate, slow_latency=slow_latency)
+             for capture in captures]
+
+  for i in range(iterations):
+    for capture, client in zip(captures, clients):
+      replay(capture, memcache, datastore, timings, client, num_pages, deadline)
+
+  return timings
+
+
+def main(argv=None):
+  parser = optparse.OptionParser(usage="%prog [options] [captures.jsonl]")
+  parser.add_option("-n", "--iterations", type="int", default=10,
+                    help="number of times to replay each capture")
+  parser.add_option("--latency", type="float", default=0.0,
+                    help="seconds of simulated latency per upstream request")
+  parser.add_option("--failure-rate", type="float", default=0.0,
+                    help="fraction of upstream requests that fail")
+  parser.add_option("--slow-rate", type="float", default=0.0,
+                    help="fraction of upstream requests that take --slow-latency instead")
+  parser.add_option("--slow-latency", type="float", default=1.0,
+                    help="seconds taken by slow upstream requests")
+  parser.add_option("--deadline", type="float", default=None,
+                    help="overall seconds allowed for fetching a user's pages")
+  parser.add_option("--pages", type="int", default=relevance.NUM_PAGES,
+                    help="pages of 20 tweets to fetch per timeline")
+  parser.add_option("--synthetic", type="int", default=0,
+                    help="replay a synthetic capture with this many tweets per timeline instead")
+  options, args = parser.parse_args(argv)
+
+  if options.synthetic:
+    from bench.synthetic import TimelineGenerator
+    captures = [TimelineGenerator(seed=1).capture(options.synthetic, options.synthetic)]
+    options.pages = max(options.pages, (options.synthetic + 19) // 20)
+  else:
+    captures = load_captures(args and args[0] or DEFAULT_CAPTURES)
+
+  timings = run(captures, options.iterations, options.latency, options.failure_rate, options.pages,
+                options.slow_rate, options.slow_latency, options.deadline)
+
+  print "%d captures x %d iterations" % (len(captures), options.iterations)
+  timings.report()
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,97 @@
+"""Scale Benchmark.
+
+Runs the relevance stages over synthetic timelines of increasing size (see
+bench.synthetic) and reports how the cost of each stage grows. Pass --plot to
+also write a log-log chart of cost against size (requires matplotlib).
+
+  python -m bench.scale --sizes 100,1000,10000,100000,1000000 --plot scale.png
+"""
+
+import sys
+import time
+import optparse
+
+import relevance
+
+from bench.synthetic import TimelineGenerator
+
+STAGES = ('tokenize', 'top_terms', 'score')
+
+
+def measure(generator, size):
+  """Returns {stage: seconds} for ranking a size tweet home timeline against
+  size favorites."""
+
+  favorites = list(generator.statuses(size, first_id=80000000000000000))
+  home = list(generator.statuses(size))
+
+  costs = {}
+
+  t = time.time()
+  favorite_terms = [relevance.tokenize(tweet['text']) for tweet in favorites]
+  home_terms = [relevance.tokenize(tweet['text']) for tweet in home]
+  costs['tokenize'] = time.time() - t
+
+  t = time.time()
+  top_n_terms = relevance.top_terms(favorite_terms)
+  costs['top_terms'] = time.time() - t
+
+  t = time.time()
+  relevance.relevant_tweets(relevance.score_tweets(home, home_terms, top_n_terms))
+  costs['score'] = time.time() - t
+
+  return costs
+
+
+def plot(results, path):
+  try:
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib import pyplot
+  except ImportError:
+    sys.stderr.write("matplotlib is not installed; skipping --plot\n")
+    return
+
+  sizes = [size for (size, costs) in results]
+  for stage in STAGES:
+    pyplot.loglog(sizes, [costs[stage] for (size, costs) in results], marker='o', label=stage)
+
+  pyplot.xlabel('tweets per timeline')
+  pyplot.ylabel('seconds')
+  pyplot.legend(loc='upper left')
+  pyplot.savefig(path)
+
+
+def main(argv=None):
+  parser = optparse.OptionParser(usage="%prog [options]")
+  parser.add_option("--sizes", default="100,1000,10000,100000",
+                    help="comma separated timeline sizes (up to 1000000)")
+  parser.add_option("--vocabulary", type="int", default=20000,
+                    help="synthetic vocabulary size")
+  parser.add_option("--zipf", type="float", default=1.1,
+                    help="skew of the term distribution")
+  parser.add_option("--mean-words", type="float", default=11,
+                    help="mean tweet length in words")
+  parser.add_option("--seed", type="int", default=1)
+  parser.add_option("--plot", help="write a chart of the results to this file")
+  options, args = parser.parse_args(argv)
+
+  generator = TimelineGenerator(vocabulary_size=options.vocabulary, zipf_s=options.zipf,
+                                mean_words=options.mean_words, seed=options.seed)
+
+  print "%10s %12s %12s %12s %14s" % (('size',) + STAGES + ('us/tweet',))
+
+  results = []
+  for size in [int(s) for s in options.sizes.split(',')]:
+    costs = measure(generator, size)
+    results.append((size, costs))
+    print "%10d %12.4f %12.4f %12.4f %14.2f" % (size, costs['tokenize'], costs['top_terms'],
+          costs['score'], sum(costs.values()) / size * 1e6)
+    sys.stdout.flush()
+
+  if options.plot:
+    plot(results, options.plot)
+
+
+if __name__ == '__main__':
+  main()
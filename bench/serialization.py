@@ -0,0 +1,84 @@
+"""Packing Benchmark.
+
+Compares the size and encode/decode time of packing.encode (with and
+without zlib) against pickle (what memcache does with a list of dicts) and
+JSON for ranked tweets, i.e. the value refresh.py stashes for /data.
+
+  python -m bench.serialization [captures.jsonl] [-n 200]
+  python -m bench.serialization --synthetic 1000
+"""
+
+import time
+import optparse
+
+try:
+  import cPickle as pickle
+except ImportError:
+  import pickle
+
+try:
+  import json
+except ImportError:
+  from django.utils import simplejson as json
+
+import packing
+import relevance
+
+from bench import replay
+
+
+def _codecs():
+  return [
+    ('pickle', lambda t: pickle.dumps(t, pickle.HIGHEST_PROTOCOL), pickle.loads),
+    ('json', json.dumps, json.loads),
+    ('packed', lambda t: packing.encode(t, compress=False), packing.decode),
+    ('packed+zlib', packing.encode, packing.decode),
+  ]
+
+
+def measure(tweets, iterations):
+  """Returns [(codec, bytes, encode ms, decode ms)] for tweets."""
+
+  results = []
+  for name, encode, decode in _codecs():
+    t = time.time()
+    for i in xrange(iterations):
+      data = encode(tweets)
+    encode_ms = (time.time() - t) / iterations * 1000
+
+    t = time.time()
+    for i in xrange(iterations):
+      decode(data)
+    decode_ms = (time.time() - t) / iterations * 1000
+
+    results.append((name, len(data), encode_ms, decode_ms))
+
+  return results
+
+
+def main(argv=None):
+  parser = optparse.OptionParser(usage="%prog [options] [captures.jsonl]")
+  parser.add_option("-n", "--iterations", type="int", default=200)
+  parser.add_option("--synthetic", type="int", default=0,
+                    help="use a synthetic timeline with this many tweets instead")
+  options, args = parser.parse_args(argv)
+
+  if options.synthetic:
+    from bench.synthetic import TimelineGenerator
+    captures = [TimelineGenerator(seed=1).capture(options.synthetic, options.synthetic)]
+  else:
+    captures = replay.load_captures(args and args[0] or replay.DEFAULT_CAPTURES)
+
+  for capture in captures:
+    tweets, top_n_terms = relevance.rank(relevance.tokenize_statuses(capture['home_timeline']),
+                                         relevance.tokenize_statuses(capture['favorites_timeline']))
+
+    print "%s: %d ranked tweets" % (capture.get('username', 'capture'), len(tweets))
+    print "%-12s %10s %12s %12s" % ('codec', 'bytes', 'encode ms', 'decode ms')
+    for name, size, encode_ms, decode_ms in measure(tweets, options.iterations):
+      print "%-12s %10d %12.3f %12.3f" % (name, size, encode_ms, decode_ms)
+    print
+
+
+if __name__ == '__main__':
+  main()
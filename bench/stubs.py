@@ -0,0 +1,354 @@
+"""In-memory stand-ins for the App Engine services used by the app.
+
+These implement just enough of the memcache, datastore and urlfetch APIs
+(and of oauth.OAuthClient and PayPal's client) for the request pipelines to
+run offline. Values that would cross an RPC boundary are pickled so that
+serialization costs show up in the measurements.
+"""
+
+from __future__ import with_statement
+
+import time
+import random
+import threading
+
+try:
+  import cPickle as pickle
+except ImportError:
+  import pickle
+
+try:
+  import json
+except ImportError:
+  from django.utils import simplejson as json
+
+import relevance
+
+_now = time.time
+
+
+class Memcache(object):
+  """Stand-in for google.appengine.api.memcache."""
+
+  def __init__(self):
+    self._data = {}
+
+  def _live(self, key):
+    entry = self._data.get(key)
+    if entry is None:
+      return None
+    if entry[1] and entry[1] < _now():
+      del self._data[key]
+      return None
+    return entry
+
+  def get(self, key):
+    entry = self._live(key)
+    if entry is None:
+      return None
+    return pickle.loads(entry[0])
+
+  def get_multi(self, keys, key_prefix=''):
+    result = {}
+    for key in keys:
+      value = self.get(key_prefix + key)
+      if value is not None:
+        result[key] = value
+    return result
+
+  def set(self, key, value, time=0):
+    expires = 0
+    if time:
+      expires = _now() + time
+    self._data[key] = (pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires)
+    return True
+
+  def set_multi(self, mapping, time=0, key_prefix=''):
+    for key, value in mapping.items():
+      self.set(key_prefix + key, value, time)
+    return []
+
+  def add(self, key, value, time=0):
+    if self._live(key) is not None:
+      return False
+    return self.set(key, value, time)
+
+  def delete(self, key):
+    if self._data.pop(key, None) is None:
+      return 1
+    return 2
+
+  def incr(self, key, delta=1, initial_value=None):
+    entry = self._live(key)
+    if entry is None:
+      if initial_value is None:
+        return None
+      value = initial_value
+    else:
+      value = pickle.loads(entry[0])
+    value += delta
+    self._data[key] = (pickle.dumps(value, pickle.HIGHEST_PROTOCOL), entry and entry[1] or 0)
+    return value
+
+  def flush_all(self):
+    self._data.clear()
+    return True
+
+
+class Datastore(object):
+  """Stand-in for the handful of db calls the app makes.
+
+  Entities are plain dicts keyed by (kind, key name).
+  """
+
+  def __init__(self):
+    self._data = {}
+
+  def get(self, kind, key_name):
+    value = self._data.get((kind, key_name))
+    if value is None:
+      return None
+    return pickle.loads(value)
+
+  def put(self, kind, key_name, entity):
+    self._data[(kind, key_name)] = pickle.dumps(entity, pickle.HIGHEST_PROTOCOL)
+    return (kind, key_name)
+
+
+class Response(object):
+  """Stand-in for a urlfetch response."""
+
+  def __init__(self, status_code, content, headers=None):
+    self.status_code = status_code
+    self.content = content
+    self.headers = headers or {}
+
+
+class DeadlineExceededError(IOError):
+  """Stand-in for urlfetch.DeadlineExceededError."""
+
+
+class RPC(object):
+  """Stand-in for a urlfetch RPC whose result is already known.
+
+  The result is ready latency seconds after the RPC is made, so RPCs that
+  are in flight at the same time overlap like real ones. If that's after
+  the RPC's deadline, get_result raises DeadlineExceededError at the
+  deadline instead.
+  """
+
+  def __init__(self, response, latency=0.0, deadline=None):
+    self.response = response
+    self.ready = _now() + latency
+    self.timed_out = deadline is not None and latency > deadline
+    if self.timed_out:
+      self.ready = _now() + deadline
+
+  def done(self):
+    return self.ready <= _now()
+
+  @classmethod
+  def wait_any(cls, rpcs):
+    rpc = min(rpcs, key=lambda rpc: rpc.ready)
+    rpc.wait()
+    return rpc
+
+  def wait(self):
+    delay = self.ready - _now()
+    if delay > 0:
+      time.sleep(delay)
+
+  def get_result(self):
+    self.wait()
+    if self.timed_out:
+      raise DeadlineExceededError("Deadline exceeded")
+    return self.response
+
+
+class ReplayClient(object):
+  """Stand-in for oauth.TwitterClient.
+
+  Serves pages of a recorded capture (a dict of timeline name -> list of
+  statuses) for the relevance.DATA_URLS. Pages are encoded up front so that
+  only the app's own parsing is measured. latency (seconds) and failure_rate
+  (0.0 - 1.0) are injected per request, and slow_rate of the requests take
+  slow_latency seconds instead, to model a latency tail. If rate_limit is
+  given, responses carry Twitter's rate limit headers for a token allowed
+  that many calls an hour, and calls beyond it get a 400.
+  """
+
+  def __init__(self, capture, page_size=20, latency=0.0, failure_rate=0.0, rate_limit=None,
+               slow_rate=0.0, slow_latency=1.0):
+    self.latency = latency
+    self.failure_rate = failure_rate
+    self.slow_rate = slow_rate
+    self.slow_latency = slow_latency
+    self.rate_limit = rate_limit
+    self.reset = int(time.time()) + 60*60
+    self.requests = 0
+    self._pages = {}
+
+    for name, url in relevance.DATA_URLS.items():
+      statuses = capture.get(name, [])
+      for i in range(0, max(len(statuses), 1), page_size):
+        self._pages[(url, i//page_size + 1)] = json.dumps(statuses[i:i+page_size])
+
+  def _respond(self, url, additional_params):
+    self.requests += 1
+
+    headers = {}
+    if self.rate_limit is not None:
+      remaining = max(self.rate_limit - self.requests, 0)
+      headers = {'X-RateLimit-Limit' : str(self.rate_limit), 'X-RateLimit-Remaining' : str(remaining),
+                 'X-RateLimit-Reset' : str(self.reset)}
+      if self.requests > self.rate_limit:
+        return Response(400, '{"error":"Rate limit exceeded."}', headers)
+
+    if self.failure_rate and random.random() < self.failure_rate:
+      return Response(503, '', headers)
+
+    page = int((additional_params or {}).get('page', 1))
+    return Response(200, self._pages.get((url, page), '[]'), headers)
+
+  def make_async_request(self, url, token="", secret="", additional_params=None,
+                         protected=False, method=None, headers={}, deadline=10.0):
+    latency = self.latency
+    if self.slow_rate and random.random() < self.slow_rate:
+      latency = self.slow_latency
+
+    return RPC(self._respond(url, additional_params), latency, deadline)
+
+  def make_request(self, url, token="", secret="", additional_params=None,
+                   protected=False, method=None, headers={}):
+    return self.make_async_request(url, token, secret, additional_params,
+                                   protected, method, headers).get_result()
+
+
+
+class OAuthException(Exception):
+  """Stand-in for oauth.OAuthException."""
+
+
+class Twitter(object):
+  """Stand-in for oauth.TwitterClient serving many users at once.
+
+  Calling it (the way oauth.TwitterClient is constructed) returns it, so it
+  can take the class's place in the oauth module. The OAuth dance is short
+  circuited: the authorization URL carries no token, and get_user_info takes
+  the auth token to be the username. Each user's timelines are served by
+  the ReplayClient of one of captures, picked by their access token, with
+  latency and failure_rate injected into every call, the two of the OAuth
+  exchange included.
+  """
+
+  def __init__(self, captures, latency=0.0, failure_rate=0.0, page_size=20):
+    self.latency = latency
+    self.failure_rate = failure_rate
+    self.clients = [ReplayClient(capture, page_size, latency=latency, failure_rate=failure_rate)
+                    for capture in captures]
+
+  def __call__(self, consumer_key=None, consumer_secret=None, callback_url=None):
+    return self
+
+  def _client(self, token):
+    return self.clients[hash(token) % len(self.clients)]
+
+  def get_authorization_url(self):
+    return "http://api.twitter.com/oauth/authorize?oauth_token="
+
+  def get_user_info(self, auth_token, auth_verifier=""):
+
+    # Exchanging the token and looking the user up are a round trip each
+
+    for call in ('access_token', 'verify_credentials'):
+      if self.latency:
+        time.sleep(self.latency)
+      if self.failure_rate and random.random() < self.failure_rate:
+        raise OAuthException("Problem talking to the service")
+
+    return {'id' : abs(hash(auth_token)), 'username' : auth_token, 'name' : auth_token, 'picture' : '',
+            'lang' : 'en', 'token' : 'token-' + auth_token, 'secret' : 'secret-' + auth_token}
+
+  def make_async_request(self, url, token="", secret="", additional_params=None,
+                         protected=False, method=None, headers={}, deadline=10.0):
+    return self._client(token).make_async_request(url, token, secret, additional_params,
+                                                  protected, method, headers, deadline)
+
+  def make_request(self, url, token="", secret="", additional_params=None,
+                   protected=False, method=None, headers={}):
+    return self._client(token).make_request(url, token, secret, additional_params,
+                                            protected, method, headers)
+
+
+class PayPalResponse(object):
+  """Stand-in for paypal.response.PayPalResponse."""
+
+  def __init__(self, ack='Success', **fields):
+    self.__dict__.update(fields)
+    self.ACK = ack
+    self.success = ack == 'Success'
+
+
+class PayPal(object):
+  """Stand-in for paypal.interface.PayPalInterface.
+
+  Calling it (the way PayPalInterface is constructed) returns it, so it can
+  be returned by payments.load_paypal. Every call takes latency seconds and
+  fails (with a Failure ack, as PayPal's API does) at failure_rate. As with
+  PayPal, a checkout token can only be paid once: paying it again fails with
+  error 10415. paid() tells whether a token was paid, so that callers can
+  check what was credited against what was charged.
+  """
+
+  def __init__(self, latency=0.0, failure_rate=0.0):
+    self.latency = latency
+    self.failure_rate = failure_rate
+    self.lock = threading.Lock()
+    self.tokens = {} # token -> paid
+    self.calls = 0
+
+  def __call__(self, **credentials):
+    return self
+
+  def _call(self):
+    with self.lock:
+      self.calls += 1
+    if self.latency:
+      time.sleep(self.latency)
+    return not (self.failure_rate and random.random() < self.failure_rate)
+
+  def set_express_checkout(self, **fields):
+    if not self._call():
+      return PayPalResponse('Failure', L_ERRORCODE0='10001')
+
+    token = "EC-%017X" % random.getrandbits(68)
+    with self.lock:
+      self.tokens[token] = False
+    return PayPalResponse(TOKEN=token)
+
+  def generate_express_checkout_redirect_url(self, token):
+    return "https://www.sandbox.paypal.com/webscr?cmd=_express-checkout&token=" + token
+
+  def get_express_checkout_details(self, token):
+    if not self._call():
+      return PayPalResponse('Failure', L_ERRORCODE0='10001')
+    if token not in self.tokens:
+      return PayPalResponse('Failure', L_ERRORCODE0='10410')
+
+    return PayPalResponse(TOKEN=token, EMAIL='buyer@example.com', AMT='10.00')
+
+  def do_express_checkout_payment(self, token, **fields):
+    if not self._call():
+      return PayPalResponse('Failure', L_ERRORCODE0='10001')
+
+    with self.lock:
+      if token not in self.tokens:
+        return PayPalResponse('Failure', L_ERRORCODE0='10410')
+      if self.tokens[token]:
+        return PayPalResponse('Failure', L_ERRORCODE0='10415')
+      self.tokens[token] = True
+
+    return PayPalResponse(TOKEN=token, PAYMENTINFO_0_PAYMENTSTATUS='Completed')
+
+  def paid(self, token):
+    return self.tokens.get(token, False)
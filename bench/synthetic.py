@@ -0,0 +1,122 @@
+"""Synthetic Timelines.
+
+Generates realistic-looking Twitter status dicts with the fields the ranker
+and the client use (id, id_str, text, created_at, user), so the relevance code
+can be exercised with timelines far larger than the 5 x 20 tweet pages that
+AppHandler fetches.
+
+Terms are drawn from a Zipf distribution over a synthetic vocabulary, with a
+configurable share of stopwords, links and @mentions, and tweet lengths (in
+words) are normally distributed and clipped to fit in 140 characters.
+"""
+
+import time
+import random
+import bisect
+
+import normalize
+
+_SYLLABLES = ('ka', 'lo', 'mi', 'ne', 'ru', 'sa', 'ti', 'vo', 'ze', 'pa', 'do', 'gu',
+              'ha', 'ji', 'be', 'fo', 'ry', 'wu', 'xi', 'qo', 'an', 'el', 'in', 'ost')
+
+_STOPWORDS = sorted(normalize.STOPWORDS[normalize.DEFAULT_LANGUAGE])
+
+_SCREEN_NAMES = ['user%d' % i for i in range(500)]
+
+
+class TimelineGenerator(object):
+  """Timeline Generator.
+
+  vocabulary_size: number of distinct (non-stopword) terms
+  zipf_s: skew of the term distribution (1.0 is roughly natural language)
+  mean_words, sd_words: tweet length distribution, in words
+  stopword_rate, url_rate, mention_rate: how often those show up
+  """
+
+  def __init__(self, vocabulary_size=20000, zipf_s=1.1, mean_words=11, sd_words=4,
+               stopword_rate=0.35, url_rate=0.25, mention_rate=0.2, seed=None):
+    self.random = random.Random(seed)
+    self.vocabulary = self._make_vocabulary(vocabulary_size)
+    self.mean_words = mean_words
+    self.sd_words = sd_words
+    self.stopword_rate = stopword_rate
+    self.url_rate = url_rate
+    self.mention_rate = mention_rate
+
+    # Cumulative Zipf weights so that a term can be drawn with one bisect
+
+    total = 0.0
+    self._cumulative = []
+    for rank in range(1, vocabulary_size + 1):
+      total += 1.0 / rank ** zipf_s
+      self._cumulative.append(total)
+    self._total = total
+
+  def _make_vocabulary(self, size):
+    vocabulary = []
+    seen = set()
+    n = 2
+    while len(vocabulary) < size:
+      word = ''.join([self.random.choice(_SYLLABLES) for i in range(n)])
+      if word not in seen:
+        seen.add(word)
+        vocabulary.append(word)
+      elif len(seen) > len(_SYLLABLES) ** n / 2:
+        n += 1
+
+    return vocabulary
+
+  def term(self):
+    r = self.random
+    if r.random() < self.stopword_rate:
+      return r.choice(_STOPWORDS)
+
+    return self.vocabulary[bisect.bisect_left(self._cumulative, r.random() * self._total)]
+
+  def text(self):
+    r = self.random
+    length = max(1, int(r.gauss(self.mean_words, self.sd_words)))
+    words = [self.term() for i in range(length)]
+
+    if r.random() < self.mention_rate:
+      words.insert(0, '@' + r.choice(_SCREEN_NAMES))
+    if r.random() < self.url_rate:
+      words.append('http://bit.ly/%x' % r.getrandbits(28))
+
+    return ' '.join(words)[:140]
+
+  def statuses(self, count, first_id=90000000000000000, now=None):
+    """Yields count statuses, newest first."""
+
+    r = self.random
+    if now is None:
+      now = time.time()
+
+    status_id = first_id
+    created = now
+    for i in xrange(count):
+      status_id -= r.randint(1, 10000)
+      created -= r.expovariate(1 / 30.0)
+      screen_name = r.choice(_SCREEN_NAMES)
+
+      yield {
+        'id' : status_id,
+        'id_str' : str(status_id),
+        'text' : self.text(),
+        'created_at' : time.strftime('%a %b %d %H:%M:%S +0000 %Y', time.gmtime(created)),
+        'user' : {
+          'id' : hash(screen_name) & 0xffffffff,
+          'screen_name' : screen_name,
+          'name' : screen_name.title(),
+          'profile_image_url' : 'http://a0.twimg.com/profile_images/%s_normal.png' % screen_name,
+        },
+      }
+
+  def capture(self, home_count, favorites_count, username='synthetic'):
+    """Returns a capture (see bench.replay) with the given timeline sizes."""
+
+    return {
+      'username' : username,
+      'home_timeline' : list(self.statuses(home_count)),
+      'favorites_timeline' : list(self.statuses(favorites_count, first_id=80000000000000000)),
+    }
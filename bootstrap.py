@@ -0,0 +1,38 @@
+"""Bootstrap.
+
+Applies the optional settings in config.py to the modules that take them.
+Every script in app.yaml (main.py, datahandler.py, payments.py, warmup.py)
+imports this first, since whichever of them an instance happens to load
+first is the one that has to configure it, and so does tools/rerank.py, so
+that it ranks with the app's settings. Importing it again is a no-op.
+"""
+
+import config
+import topk
+import dedup
+import instrumentation
+import metrics
+import normalize
+import profiling
+
+# Older config.py files won't define these
+
+instrumentation.configure(enabled=getattr(config, 'TIMING_ENABLED', False),
+                          header=getattr(config, 'TIMING_HEADER', False))
+
+profiling.configure(enabled=getattr(config, 'PROFILING_ENABLED', False),
+                    top_n=getattr(config, 'PROFILE_TOP_N', 30))
+
+metrics.configure(flush_to=getattr(config, 'METRICS_FLUSH_TO', 'log'),
+                  flush_interval=getattr(config, 'METRICS_FLUSH_INTERVAL', 60))
+
+normalize.configure(language=getattr(config, 'DEFAULT_LANGUAGE', 'en'),
+                    stem=getattr(config, 'STEMMING', False),
+                    keep_mentions=getattr(config, 'KEEP_MENTIONS', False),
+                    hash_bits=getattr(config, 'TERM_HASH_BITS', 0))
+
+dedup.configure(enabled=getattr(config, 'COLLAPSE_DUPLICATES', True),
+                max_distance=getattr(config, 'NEAR_DUPLICATE_DISTANCE', 3))
+
+topk.configure(enabled=getattr(config, 'APPROXIMATE_TERM_COUNTS', False),
+               capacity=getattr(config, 'TERM_COUNT_CAPACITY', 2000))
@@ -0,0 +1,85 @@
+"""Two-level Cache.
+
+A small bounded in-process LRU (see lru.py) in front of memcache for hot keys
+like sessions, ranked results and OAuth request token secrets. Reads go to
+the local cache first and fall through to memcache, filling the local cache
+on the way back. Writes go to both. Local entries expire with the same time
+to live as the memcache ones.
+
+Other instances can't invalidate this instance's local copies, so callers
+that need to see another instance's writes (e.g. a background refresh) pass
+local=False to get() to go straight to memcache. Values read from the local
+cache are shared with other requests on this instance, so don't mutate them.
+"""
+
+from google.appengine.api import memcache
+
+import metrics
+
+from lru import LRUCache
+
+LOCAL_CAPACITY = 500
+
+# Used for local copies filled by a read when the caller doesn't give a ttl
+
+DEFAULT_TTL = 60*10 # seconds
+
+_local = LRUCache(LOCAL_CAPACITY, DEFAULT_TTL)
+
+
+def get(key, ttl=None, local=True):
+  """Get.
+
+  Returns the value for key, or None. ttl is the time to live of the local
+  copy made when the value has to be read from memcache.
+  """
+
+  # Each level counts its own hits and misses, so metrics.hit_rates() reports one rate for each
+
+  if local:
+    value = _local.get(key)
+    if value is not None:
+      metrics.incr("cache.local.hit")
+      return value
+    metrics.incr("cache.local.miss")
+
+  value = memcache.get(key)
+  if value is None:
+    metrics.incr("cache.memcache.miss")
+    return None
+
+  metrics.incr("cache.memcache.hit")
+  _local.set(key, value, ttl)
+  return value
+
+
+def set(key, value, time=0):
+  """Set.
+
+  Writes value to memcache and to the local cache, both with a time to live
+  of time seconds.
+  """
+
+  _local.set(key, value, time or None)
+  return memcache.set(key, value, time=time)
+
+
+def set_multi(mapping, time=0):
+  """Set Multi.
+
+  Like set() for every key and value in mapping, with one memcache RPC.
+  Returns the list of keys memcache didn't store.
+  """
+
+  for key, value in mapping.items():
+    _local.set(key, value, time or None)
+  return memcache.set_multi(mapping, time=time)
+
+
+def delete(key):
+  _local.delete(key)
+  return memcache.delete(key)
+
+
+def stats():
+  return _local.stats()
@@ -11,3 +11,56 @@ CONSUMER_SECRET = ''
 PP_API_USERNAME = ''
 PP_API_PASSWORD = ''
 PP_API_SIGNATURE = ''
+
+# Optional per-request timing. When TIMING_ENABLED is True, the spans for each request are
+# logged as a single "timing {...}" line; TIMING_HEADER also adds them as an X-Timing header
+
+TIMING_ENABLED = False
+TIMING_HEADER = False
+
+# With PROFILING_ENABLED, an app admin can add profile=1 (or an X-Profile: 1 header) to a request
+# to have it run under cProfile; the PROFILE_TOP_N costliest functions are kept for a day and
+# served by /admin/profiles (see profiling.py). When False, handlers aren't wrapped for it at all
+
+PROFILING_ENABLED = False
+PROFILE_TOP_N = 30
+
+# In-process metrics (see metrics.py) are flushed at most every METRICS_FLUSH_INTERVAL seconds
+# to "log", "datastore" (as MetricsSnapshot entities) or nowhere (None). /admin/metrics dumps them
+
+METRICS_FLUSH_TO = 'log'
+METRICS_FLUSH_INTERVAL = 60
+
+# Tweets are normalized into terms with the stopwords of each user's language (taken from their
+# Twitter account, falling back to DEFAULT_LANGUAGE). STEMMING strips common suffixes so that
+# e.g. "run" and "running" count as one term; KEEP_MENTIONS keeps @mentions as terms
+
+DEFAULT_LANGUAGE = 'en'
+STEMMING = False
+KEEP_MENTIONS = False
+
+# With TERM_HASH_BITS (up to 32), terms are hashed to ints of that many bits as they're normalized,
+# which makes them cheaper to count, intersect and cache at the cost of the occasional collision
+# (python -m bench.hashing reports the collision rates). 0 keeps terms as strings
+
+TERM_HASH_BITS = 0
+
+# Overall seconds allowed for fetching a user's timeline pages, retries and hedged requests
+# included (see scheduler.py). Whatever pages have arrived by then get ranked
+
+FETCH_DEADLINE = 8.0
+
+# Retweets of the same status and near-duplicate tweets (whose terms' 64 bit SimHashes differ in
+# at most NEAR_DUPLICATE_DISTANCE bits) are ranked and shown once, with a count of the others
+# (see dedup.py)
+
+COLLAPSE_DUPLICATES = True
+NEAR_DUPLICATE_DISTANCE = 3
+
+# With APPROXIMATE_TERM_COUNTS, the terms of a user's favorites are counted in a fixed amount of
+# memory (TERM_COUNT_CAPACITY terms, about 30KB stored per user, see topk.py) instead of exactly,
+# and the counts are kept between refreshes so that favorites older than the fetched pages still
+# count
+
+APPROXIMATE_TERM_COUNTS = False
+TERM_COUNT_CAPACITY = 2000
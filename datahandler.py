@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+##################################################################################################
+# Serves /data, the endpoint that the mobile client polls for a user's ranked tweets. It's
+# the app's hottest route, so it's a script of its own (see app.yaml) that loads only what
+# answering from the cached rankings takes: no OAuth, PayPal or template stack, which a cold
+# instance would otherwise have to import before serving its first poll. See main.py for the
+# rest of the app.
+##################################################################################################
+
+from __future__ import with_statement
+
+from google.appengine.ext import webapp
+from google.appengine.ext.webapp import util
+from django.utils import simplejson as json
+
+import bootstrap
+import instrumentation
+import refresh
+
+from sessions import get_session
+
+INFINITY = float("1e999")
+
+class DataHandler(webapp.RequestHandler):
+
+  # Serves up stashed data (which is computed in the background after a prior request to /app). A 
+  # ?refresh=true parameter could be built in to the /data request to charge the user for another 
+  # request handle associated details if so desired. This /data implementation simply returns the 
+  # most recently calculated data, with "stale" set if a refresh is still on its way.
+  #
+  # The response carries the ranking's version. A client that already has an earlier version
+  # can pass it as ?since= and get just the tweets that were added, removed and re-scored
+  # since then ("full" is false), as long as it's the version that client was last sent (only
+  # that one is kept per user, see refresh.mark_synced).
+  #
+  # ?q= (terms that must all appear) and ?min_score= filter the tweets using the index that's
+  # cached with them. Filtered responses are always full and carry no version, since they
+  # aren't something a client can sync from. A min_score that isn't a finite number is a 400.
+
+  @instrumentation.timed
+  def get(self):
+
+    user_info = get_session(self.request.get("sid"))
+    if user_info is None:
+      return self.error(404)
+
+    # This instance's copy of the ranked tweets may predate a refresh made elsewhere, so
+    # only go back to memcache while it looks stale
+
+    requested = user_info.get('refresh_requested', 0)
+
+    ranked = refresh.get_ranked(user_info['username'])
+    if ranked is None or ranked['updated'] < requested:
+      ranked = refresh.get_ranked(user_info['username'], local=False)
+
+    result = {'user' : user_info['username'], 'version' : None, 'full' : True, 'tweets' : []}
+
+    if ranked is None:
+      result['stale'] = True
+    else:
+      result['stale'] = ranked['updated'] < requested
+      result['version'] = ranked.get('version')
+
+      q = self.request.get("q")
+      min_score = self.request.get("min_score") or None
+      if min_score is not None:
+        try:
+          min_score = float(min_score)
+        except ValueError:
+          return self.error(400)
+
+        # float() takes "nan" and "inf", which no score compares usefully with
+
+        if min_score != min_score or min_score in (INFINITY, -INFINITY):
+          return self.error(400)
+
+      if (q or min_score is not None) and 'index' in ranked:
+        with self.timer.span("filter"):
+          result['tweets'] = refresh.filter_tweets(ranked, q, min_score)
+        result.update({'version' : None, 'q' : q, 'min_score' : min_score})
+
+      else:
+        tweets = refresh.ranked_tweets(ranked)
+
+        since = self.request.get("since")
+        if since and result['version']:
+          if since == result['version']:
+            old_packed = ranked['packed']
+          else:
+            old_packed = refresh.get_version(user_info['username'], since)
+        else:
+          old_packed = None
+
+        if old_packed is not None:
+          del result['tweets']
+          result.update(refresh.delta(old_packed, tweets))
+          result['since'] = since
+          result['full'] = False
+        else:
+          result['tweets'] = tweets
+
+        if result['version'] and since != result['version']:
+          refresh.mark_synced(user_info['username'], ranked)
+
+    self.response.headers.add_header('content-type', 'application/json', charset='utf-8')
+    self.response.out.write(json.dumps(result))
+
+# Built once per instance; App Engine caches this module (and so the application) between requests
+
+application = webapp.WSGIApplication([('/data', DataHandler)], debug=True)
+
+def main():
+  util.run_wsgi_app(application)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,222 @@
+"""Duplicate Collapsing.
+
+Home timelines are full of retweets of the same status and near-identical
+shares of the same link or headline. collapse() groups the entries of a
+timeline (as returned by relevance.fetch_timelines) before they're scored, so
+each group is scored, cached and sent to the client once, as its first
+(i.e. newest) entry, with a count of the entries collapsed into it.
+
+Entries are grouped when:
+
+  * they're the same status: a retweet (see retweeted_id in tweetcache.py)
+    goes with the status it retweets and with other retweets of it
+  * their terms are nearly the same: the 64 bit SimHashes of their term sets
+    differ in at most MAX_DISTANCE bits
+
+Candidate near-duplicates are found by splitting each SimHash into
+MAX_DISTANCE + 1 bands; two hashes that differ in at most MAX_DISTANCE bits
+must agree on at least one band, so only entries sharing a band are
+compared. Entries with fewer than MIN_TERMS terms are only grouped as
+retweets, since a SimHash of one or two terms says little.
+"""
+
+import hashlib
+
+import metrics
+
+BITS = 64
+
+# Most bits by which two entries' SimHashes may differ for them to be grouped
+
+MAX_DISTANCE = 3
+
+# Entries with fewer distinct terms than this are only grouped as retweets
+
+MIN_TERMS = 3
+
+# Set via configure(), normally from COLLAPSE_DUPLICATES and NEAR_DUPLICATE_DISTANCE in config.py
+
+ENABLED = True
+
+# SimHashes are summed with one big int per term, in which each bit of the term's hash gets an
+# 8 bit lane of its own: adding the terms' ints counts the terms with each bit set, all 64
+# lanes at once. A tweet has at most 70 terms, so the counts fit (MAX_TERMS are used at most)
+
+_LANE = 8
+_HIGH = sum([1 << (bit * _LANE + _LANE - 1) for bit in xrange(BITS)])
+_ONES = sum([1 << (bit * _LANE) for bit in xrange(BITS)])
+
+MAX_TERMS = (1 << (_LANE - 1)) - 1
+
+# Gathering the lanes' high bits into the SimHash works 8 lanes (64 bits of the big int) at a
+# time: multiplying a 64 bit chunk whose only set bits are its bytes' lowest by _GATHER moves
+# byte i's bit to bit 56 + i, with no carries into those 8 bits
+
+_CHUNK = 0x0101010101010101
+_GATHER = 0x0102040810204080
+
+# Set bits per byte value, for distance() (bin() needs Python 2.6)
+
+_POPCOUNT = [0] * 256
+for _i in xrange(1, 256):
+  _POPCOUNT[_i] = (_i & 1) + _POPCOUNT[_i >> 1]
+del _i
+
+# term -> its laned hash. Terms recur across timelines and users, so they're hashed once per
+# instance (up to _MAX_HASHES of them)
+
+_hashes = {}
+_MAX_HASHES = 100000
+
+# terms (a tweet cache entry's tuple) -> SimHash, since the same statuses are collapsed again for
+# every user who follows their authors and at every refresh
+
+_signatures = {}
+_MAX_SIGNATURES = 20000
+
+
+def configure(enabled=True, max_distance=MAX_DISTANCE):
+  global ENABLED, MAX_DISTANCE
+
+  ENABLED = enabled
+  MAX_DISTANCE = max_distance
+
+
+def _laned(term):
+  laned = _hashes.get(term)
+  if laned is None:
+    if len(_hashes) >= _MAX_HASHES:
+      _hashes.clear()
+    h = int(hashlib.md5(isinstance(term, unicode) and term.encode('utf-8') or str(term)).hexdigest()[:16], 16)
+    laned = _hashes[term] = sum([(h >> bit & 1) << (bit * _LANE) for bit in xrange(BITS)])
+  return laned
+
+
+def simhash(terms):
+  """Returns the 64 bit SimHash of a set of terms: bit i is set if it's set
+  in the hashes of more than half of the terms."""
+
+  terms = list(terms)[:MAX_TERMS]
+
+  # Biasing every lane so that a count of more than half the terms carries into the lane's
+  # high bit leaves just those high bits set under the mask. Shifted down to the lanes' lowest
+  # bits, they're gathered a byte of the SimHash at a time
+
+  bias = (MAX_TERMS - len(terms) // 2) * _ONES
+  counted = ((sum([_laned(term) for term in terms]) + bias) & _HIGH) >> (_LANE - 1)
+
+  signature = 0
+  for byte in xrange(BITS // 8):
+    chunk = (counted >> (byte * 64)) & _CHUNK
+    signature |= ((chunk * _GATHER) >> 56 & 0xff) << (byte * 8)
+  return signature
+
+
+def _signature(terms):
+  signature = _signatures.get(terms)
+  if signature is None:
+    if len(_signatures) >= _MAX_SIGNATURES:
+      _signatures.clear()
+    signature = _signatures[terms] = simhash(set(terms))
+  return signature
+
+
+def distance(a, b):
+  """Returns the number of bits in which a and b differ."""
+
+  x = a ^ b
+  count = 0
+  while x:
+    count += _POPCOUNT[x & 0xff]
+    x >>= 8
+  return count
+
+
+def _bands(signature, num_bands):
+  width = BITS // num_bands
+  mask = (1 << width) - 1
+  return [(band, signature >> (band * width) & mask) for band in xrange(num_bands)]
+
+
+def groups(entries, max_distance=None):
+  """Groups.
+
+  Returns the groups of duplicate entries (a list of (terms, projected
+  status) entries) as lists of indexes into entries, each group in
+  timeline order and the groups in the order of their first entries.
+  """
+
+  if max_distance is None:
+    max_distance = MAX_DISTANCE
+
+  parent = range(len(entries))
+
+  def find(i):
+    while parent[i] != i:
+      parent[i] = parent[parent[i]]
+      i = parent[i]
+    return i
+
+  def union(i, j):
+    i, j = find(i), find(j)
+    if i != j:
+      parent[max(i, j)] = min(i, j)
+
+  # Retweets of the same status, and the status itself
+
+  first = {}
+  for i, (terms, tweet) in enumerate(entries):
+    key = tweet.get('retweeted_id') or tweet.get('id')
+    if key is None:
+      continue
+    if key in first:
+      union(first[key], i)
+    else:
+      first[key] = i
+
+  # Near-duplicates
+
+  signatures = {}
+  buckets = {}
+  num_bands = max_distance + 1
+  for i, (terms, tweet) in enumerate(entries):
+    if len(terms) < MIN_TERMS or len(set(terms)) < MIN_TERMS:
+      continue
+
+    signature = signatures[i] = _signature(tuple(terms))
+    for band in _bands(signature, num_bands):
+      for j in buckets.setdefault(band, []):
+        if find(i) != find(j) and distance(signature, signatures[j]) <= max_distance:
+          union(i, j)
+      buckets[band].append(i)
+
+  grouped = {}
+  for i in xrange(len(entries)):
+    grouped.setdefault(find(i), []).append(i)
+
+  return [grouped[root] for root in sorted(grouped)]
+
+
+def collapse(entries, max_distance=None):
+  """Collapse.
+
+  Returns (representatives, counts): the first entry of each group of
+  duplicates in entries, in timeline order, and how many other entries were
+  collapsed into each. Returns entries as they are if collapsing is
+  disabled (see configure()).
+  """
+
+  if not ENABLED or not entries:
+    return entries, [0] * len(entries)
+
+  representatives = []
+  counts = []
+  for group in groups(entries, max_distance):
+    representatives.append(entries[group[0]])
+    counts.append(len(group) - 1)
+
+  collapsed = len(entries) - len(representatives)
+  if collapsed:
+    metrics.incr("dedup.collapsed", collapsed)
+
+  return representatives, counts
@@ -0,0 +1,181 @@
+"""Instrumentation.
+
+Lightweight per-request timing. Handler methods decorated with @timed get a
+self.timer whose spans are aggregated over the request and emitted as one
+structured log line (and, optionally, an X-Timing response header) when the
+method returns:
+
+  @instrumentation.timed
+  def get(self, mode=""):
+    with self.timer.span("oauth"):
+      ...
+
+When instrumentation is disabled, self.timer is a shared no-op timer whose
+span() hands back a shared no-op context manager, so instrumented code costs
+next to nothing.
+
+@timed is also where requests are profiled on demand (see profiling.py).
+"""
+
+import time
+import logging
+
+try:
+  from django.utils import simplejson as json
+except ImportError:
+  import json
+
+import metrics
+import profiling
+
+# Set via configure(), normally from TIMING_ENABLED/TIMING_HEADER in config.py
+
+ENABLED = False
+HEADER = False
+
+HEADER_NAME = "X-Timing"
+
+
+def configure(enabled=False, header=False):
+  global ENABLED, HEADER
+
+  ENABLED = enabled
+  HEADER = header
+
+
+class _Span(object):
+
+  __slots__ = ('timer', 'name', 'start')
+
+  def __init__(self, timer, name):
+    self.timer = timer
+    self.name = name
+
+  def __enter__(self):
+    self.start = time.time()
+    return self
+
+  def __exit__(self, exc_type, exc_value, tb):
+    self.timer.record(self.name, time.time() - self.start)
+    return False
+
+
+class Timer(object):
+  """Timer.
+
+  Collects the spans for a single request. Spans with the same name (e.g.
+  each page of a timeline fetch) are aggregated into a count, total and max.
+  """
+
+  def __init__(self, label):
+    self.label = label
+    self.start = time.time()
+    self.names = []
+    self.spans = {}
+
+  def span(self, name):
+    return _Span(self, name)
+
+  def record(self, name, elapsed):
+    stats = self.spans.get(name)
+    if stats is None:
+      self.names.append(name)
+      self.spans[name] = [1, elapsed, elapsed]
+    else:
+      stats[0] += 1
+      stats[1] += elapsed
+      if elapsed > stats[2]:
+        stats[2] = elapsed
+
+  def summary(self):
+    """Returns a dict suitable for logging: total and per-span ms."""
+
+    spans = []
+    for name in self.names:
+      count, total, longest = self.spans[name]
+      spans.append({'name' : name, 'count' : count, 'ms' : round(total * 1000, 2),
+                    'max_ms' : round(longest * 1000, 2)})
+
+    return {'request' : self.label, 'ms' : round((time.time() - self.start) * 1000, 2), 'spans' : spans}
+
+  def header(self):
+    parts = []
+    for name in self.names:
+      parts.append("%s;dur=%.2f" % (name, self.spans[name][1] * 1000))
+
+    return ", ".join(parts)
+
+  def emit(self, response=None):
+    logging.info("timing %s" % json.dumps(self.summary()))
+
+    if HEADER and response is not None:
+      response.headers[HEADER_NAME] = self.header()
+
+
+class _NullSpan(object):
+
+  __slots__ = ()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, tb):
+    return False
+
+
+class _NullTimer(object):
+
+  __slots__ = ()
+
+  def span(self, name):
+    return NULL_SPAN
+
+  def record(self, name, elapsed):
+    pass
+
+  def emit(self, response=None):
+    pass
+
+
+NULL_SPAN = _NullSpan()
+NULL_TIMER = _NullTimer()
+
+
+def start(label):
+  """Returns a new Timer for label, or NULL_TIMER if instrumentation is off."""
+
+  if ENABLED:
+    return Timer(label)
+
+  return NULL_TIMER
+
+
+def timed(method):
+  """Decorator for RequestHandler methods; see the module docstring.
+
+  Regardless of ENABLED, the request's latency is also added to the
+  "latency.<path>" histogram in metrics. If profiling is enabled, method
+  runs under the profiler when its request asks to be (see profiling.py).
+  """
+
+  if profiling.ENABLED:
+    method = profiling.profiled(method)
+
+  def wrapper(handler, *args, **kwargs):
+    start = time.time()
+
+    if ENABLED:
+      handler.timer = Timer("%s %s" % (handler.request.method, handler.request.path))
+    else:
+      handler.timer = NULL_TIMER
+
+    try:
+      return method(handler, *args, **kwargs)
+    finally:
+      metrics.observe("latency." + handler.request.path, (time.time() - start) * 1000)
+      handler.timer.emit(handler.response)
+      metrics.maybe_flush()
+
+  wrapper.__name__ = method.__name__
+  wrapper.__doc__ = method.__doc__
+  return wrapper
@@ -0,0 +1,123 @@
+"""LRU Cache.
+
+A small bounded in-process cache with least-recently-used eviction and an
+optional time to live per entry. It's a dict plus a circular doubly linked
+list, so get and set are O(1). Its operations hold a lock, so it can be
+shared by the threads of a threadsafe instance (or of bench.loadtest).
+"""
+
+from __future__ import with_statement
+
+import time
+import threading
+
+_PREV, _NEXT, _KEY, _VALUE, _EXPIRES = 0, 1, 2, 3, 4
+
+
+class LRUCache(object):
+
+  def __init__(self, capacity, ttl=None):
+    """Constructor.
+
+    capacity is the maximum number of entries; ttl is the default time to
+    live in seconds (None for entries that only expire by eviction).
+    """
+
+    self.capacity = capacity
+    self.ttl = ttl
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+    self._lock = threading.Lock()
+    self._map = {}
+    self._root = root = []
+    root[:] = [root, root, None, None, None]
+
+  def __len__(self):
+    return len(self._map)
+
+  def __contains__(self, key):
+    return self.get(key, self) is not self
+
+  def _unlink(self, link):
+    link[_PREV][_NEXT] = link[_NEXT]
+    link[_NEXT][_PREV] = link[_PREV]
+
+  def _push_front(self, link):
+    root = self._root
+    link[_PREV] = root
+    link[_NEXT] = root[_NEXT]
+    root[_NEXT][_PREV] = link
+    root[_NEXT] = link
+
+  def get(self, key, default=None):
+    with self._lock:
+      link = self._map.get(key)
+
+      if link is None:
+        self.misses += 1
+        return default
+
+      if link[_EXPIRES] is not None and link[_EXPIRES] < time.time():
+        self._unlink(link)
+        del self._map[key]
+        self.misses += 1
+        return default
+
+      self._unlink(link)
+      self._push_front(link)
+      self.hits += 1
+      return link[_VALUE]
+
+  def set(self, key, value, ttl=None):
+    if ttl is None:
+      ttl = self.ttl
+
+    expires = None
+    if ttl:
+      expires = time.time() + ttl
+
+    with self._lock:
+      link = self._map.get(key)
+      if link is not None:
+        self._unlink(link)
+        link[_VALUE] = value
+        link[_EXPIRES] = expires
+      else:
+        if len(self._map) >= self.capacity:
+          oldest = self._root[_PREV]
+          self._unlink(oldest)
+          del self._map[oldest[_KEY]]
+          self.evictions += 1
+
+        link = [None, None, key, value, expires]
+        self._map[key] = link
+
+      self._push_front(link)
+
+  def delete(self, key):
+    with self._lock:
+      link = self._map.pop(key, None)
+      if link is not None:
+        self._unlink(link)
+        return True
+
+      return False
+
+  def clear(self):
+    with self._lock:
+      self._map.clear()
+      root = self._root
+      root[:] = [root, root, None, None, None]
+
+  def stats(self):
+    lookups = self.hits + self.misses
+    return {
+      'size' : len(self._map),
+      'capacity' : self.capacity,
+      'hits' : self.hits,
+      'misses' : self.misses,
+      'evictions' : self.evictions,
+      'hit_rate' : lookups and round(1.0 * self.hits / lookups, 4) or 0.0,
+    }
@@ -18,207 +18,150 @@
 # project at http://dojotoolkit.org/documentation/tutorials/1.6/mobile/tweetview/packaging/ 
 # and is intended to be delivered to a mobile display like an iPhone, although development
 # works fine on a desktop browser like WebKit. The UI for the payflows is minimal.
+#
+# The app's routes are split across scripts (see app.yaml) so that a cold instance only imports
+# what the route it's started for needs: /data is served by datahandler.py, the payflow by
+# payments.py and App Engine's warmup requests by warmup.py. This script serves the rest.
 ##################################################################################################
 
-import os
+from __future__ import with_statement
+
+import time
 import random
-import operator
 import logging
+import datetime
 
-from google.appengine.api import memcache
 from google.appengine.ext import webapp
 from google.appengine.ext.webapp import util
 from google.appengine.ext import db
 from django.utils import simplejson as json
-from google.appengine.ext.webapp import template
 
+import bootstrap
 import oauth
-
-from paypal.interface import PayPalInterface
+import cache
+import rendering
+import instrumentation
+import metrics
+import profiling
+import refresh
+import normalize
+import singleflight
+
+from models import User
+from sessions import SESSION_TTL, get_session
 
 # Copy config.template.py to config.py and fill in these values in that file
 
 from config import CONSUMER_KEY,\
-                   CONSUMER_SECRET,\
-                   PP_API_USERNAME,\
-                   PP_API_PASSWORD,\
-                   PP_API_SIGNATURE
-
-# A simple (twitter_username, requests_remaining) tuple to track logins so that users can be
-# charged for access. By default, users get 25 free logins. No additional user information is 
-# stored in an attempt to keep this app as minimal and stateless as possible. (And memcache is
-# used to implement a minimalist session management scheme to keep track of the user between
-# requests.)
-
-class User(db.Model):
-  twitter_username = db.StringProperty(required=True)
-  requests_remaining = db.IntegerProperty(required=True, default=25)
+                   CONSUMER_SECRET
 
-# Logic for interacting wtih PayPal's ExpressCheckout product
+# Fetches and ranks a user's timelines with their stored access token. Runs in the
+# /tasks/refresh task, or inline when the task queue API isn't available
 
-class PaymentHandler(webapp.RequestHandler):
+def refresh_user(username, timer=instrumentation.NULL_TIMER):
+  user = User.all().filter("twitter_username =", username).get()
+  if user is None or not user.access_token:
+    logging.error("Can't refresh %s without a stored access token" % username)
+    return None
 
-  def _getPayPal(self):
+  client = oauth.TwitterClient(CONSUMER_KEY, CONSUMER_SECRET, None)
+  return refresh.refresh(client, username, user.access_token, user.access_secret, timer=timer,
+                         language=user.language)
 
-    return PayPalInterface(API_USERNAME=PP_API_USERNAME, API_PASSWORD=PP_API_PASSWORD, API_SIGNATURE=PP_API_SIGNATURE)
-
-  def _getProduct(self):
-
-    # The app only features a single product: 100 login requests for a fixed price
-
-    return {'price' : 10.00, 'quantity' : 100, 'units' : 'login requests'}
-
-  def post(self, mode=""):
+if isinstance(refresh.queue, refresh.LocalQueue):
+  refresh.queue.run = refresh_user
 
-    if mode == "set_ec":
+# Looks up (or creates) the user who just authorized the app with Twitter, stashes their session
+# and, if they have logins remaining, meters the login and kicks off a refresh. Returns the sid and
+# whether the login was metered. /app runs this through flights so that it happens once per burst
+# of logins by the same user
 
-      sid = self.request.get("sid")
-      user_info = memcache.get(sid)
+LOGIN_WINDOW = 30 # seconds
 
-      product = self._getProduct()
+flights = singleflight.SingleFlight()
 
-      pp = self._getPayPal()
-      response = pp.set_express_checkout(amt=str(product['price']), returnurl=self.request.host_url+"/get_ec_details?sid="+sid, \
-                 cancelurl=self.request.host_url+"/cancel_ec?sid="+sid, paymentaction='Order')
+def login(user_info, timer=instrumentation.NULL_TIMER):
+  twitter_username = user_info['username']
 
-      if not response.success:
-        logging.error("Failure for SetExpressCheckout")
+  # Has a user already used this webapp with twitter_username?
 
-        template_values = {
-          'title' : 'Error',
-          'operation' : 'SetExpressCheckout'
-        }
-        
-        path = os.path.join(os.path.dirname(__file__), 'templates', 'unknown_error.html')
-        return self.response.out.write(template.render(path, template_values))
+  query = User.all().filter("twitter_username =", twitter_username)
+  with timer.span("datastore:query"):
+    user = query.get()
 
-      # Redirect to PayPal and allow user to confirm payment details.
-      # Then PayPal redirects back to the /get_ec_details or /cancel_ec endpoints.
-      # Assuming /get_ec_details, we complete the transaction with pp.get_express_checkout_details
-      # and pp.do_express_checkout_payment
+  # If not, create a user (and give them some free logins to this app)
 
-      redirect_url = pp.generate_express_checkout_redirect_url(response.TOKEN)
-      return self.redirect(redirect_url)
+  if user is None:
+    user = User(twitter_username=twitter_username, )
+    user.put()
 
+  # Avoid a full-blown Session implementation for purposes of simplicity in this demo code. (See 
+  # http://stackoverflow.com/questions/2560022/simple-app-engine-sessions-implementation
+  # for some very pragmatic tips on how you might approach that in a very lightweight fashion.)
+  # Sessions will be needed in both the if and the else clause below, so go ahead and compute it
 
-    else:
-      logging.error("Unknown mode for POST request!")
+  sid = str(random.random())[5:] + str(random.random())[5:] + str(random.random())[5:]
 
-  def get(self, mode=""):
-    if mode == "get_ec_details":
-      pp = self._getPayPal()
-      response = pp.get_express_checkout_details(self.request.get("token"))
+  # Remember the access token so that the user's rankings can be refreshed in the background
 
-      if not response.success:
-        logging.error("Failure for GetExpressCheckoutDetails")
+  user.access_token = user_info['token']
+  user.access_secret = user_info['secret']
+  user.last_login = datetime.datetime.now()
 
-        template_values = {
-          'title' : 'Error',
-          'operation' : 'GetExpressCheckoutDetails'
-        }
-        
-        path = os.path.join(os.path.dirname(__file__), 'templates', 'unknown_error.html')
-        return self.response.out.write(template.render(path, template_values))
+  # Default to the language of the user's Twitter account; they can change it via /settings
 
-      product = self._getProduct()
+  if user.language is None:
+    user.language = user_info.get('lang')
 
-      template_values = {
-        'title' : 'Confirm Purchase',
-        'quantity' : product['quantity'], 
-        'units' : product['units'], 
-        'email' : response.EMAIL, 
-        'amount' : response.AMT,
-        'query_string_params' : self.request.query_string
-      }
+  # If yes and if they have some logins remaining, service their request
 
-      path = os.path.join(os.path.dirname(__file__), 'templates', 'confirm_purchase.html')
-      self.response.out.write(template.render(path, template_values))
+  if user.requests_remaining > 0:
 
-    elif mode == "do_ec_payment":
+    user.requests_remaining -= 1 # Meter the request
+    with timer.span("datastore:put"):
+      db.put(user)
 
-      if memcache.get(self.request.get("sid")) is not None: # Without an account reference, we can't credit the purchase
-        pp = self._getPayPal()
-        payerid = self.request.get("PayerID")
+    # Fetching and ranking tweets happens in the background (see refresh.py). Stash the
+    # session along with the time of this refresh request so that /data can tell the client
+    # whether the ranked tweets it serves predate this login and fresher ones are coming. If a
+    # refresh enqueued earlier in the same refresh.DEDUP_WINDOW stands in for this one, its
+    # ranking is the one to wait for, and it's no older than the start of the window
 
-        product = self._getProduct()
+    requested = time.time()
+    with timer.span("taskqueue:add"):
+      if not refresh.queue.add(twitter_username):
+        requested = int(requested / refresh.DEDUP_WINDOW) * refresh.DEDUP_WINDOW
 
-        response = pp.do_express_checkout_payment(self.request.get("token"), payerid=payerid, amt=str(product['price']), paymentaction='Sale')
+    user_info['refresh_requested'] = requested
 
-        if not response.success:
-          logging.error("Failure for DoExpressCheckoutPayment")
+    with timer.span("memcache:set"):
+      cache.set(sid, user_info, time=SESSION_TTL)
 
-          template_values = {
-            'title' : 'Error',
-            'operation' : 'DoExpressCheckoutPayment'
-          }
-        
-          path = os.path.join(os.path.dirname(__file__), 'templates', 'unknown_error.html')
-          return self.response.out.write(template.render(path, template_values))
+    return {'sid' : sid, 'metered' : True}
 
-        # Recharge the user's account with logins
+  # Store the user_info so we can retrieve it in the next request
 
-        user_info = memcache.get(self.request.get("sid"))
-        twitter_username = user_info['username']
-        query = User.all().filter("twitter_username =", twitter_username)
-        user = query.get()
-        product = self._getProduct()
-        user.requests_remaining = product['quantity']
-        db.put(user)
+  cache.set(sid, user_info, time=SESSION_TTL)
+  db.put(user)
 
-        template_values = {
-          'title' : 'Successful Payment',
-          'quantity' : product['quantity'],
-          'units' : product['units']
-        }
-        
-        path = os.path.join(os.path.dirname(__file__), 'templates', 'successful_payment.html')
-        self.response.out.write(template.render(path, template_values))
-
-      else:
-        logging.error("Invalid/expired session in /do_ec_payment")
-
-        template_values = {
-          'title' : 'Session Expired',
-        }
-
-        path = os.path.join(os.path.dirname(__file__), 'templates', 'session_expired.html')
-        self.response.out.write(template.render(path, template_values))
-
-    elif mode == "cancel_ec":
-      template_values = {
-        'title' : 'Cancel Purchase',
-      }
-
-      path = os.path.join(os.path.dirname(__file__), 'templates', 'cancel_purchase.html')
-      self.response.out.write(template.render(path, template_values))
+  return {'sid' : sid, 'metered' : False}
 
 # Logic for interacting with Twitter's API and serving up data, etc.
 
 class AppHandler(webapp.RequestHandler):
 
-  def _cleanupTerm(self, term):
-
-    # Strip some common punctuation from terms that are extracted from tweets
-
-    return term.strip(")").strip("(").strip("?").strip(":").strip(".")
-
-  def _getStopwords(self):
-
-    # This stopword list is adapted from nltk.corpus - See http://nltk.org
-
-    return ('i', 'me', 'my', 'myself', 'we', 'our', 'ours', 'ourselves', 'you', 'your', 'yours', 'yourself', 'yourselves', 'he', 'him', 'his', 'himself', 'she', 'her', 'hers', 'herself', 'it', 'its', 'itself', 'they', 'them', 'their', 'theirs', 'themselves', 'what', 'which', 'who', 'whom', 'this', 'that', 'these', 'those', 'am', 'is', 'are', 'was', 'were', 'be', 'been', 'being', 'have', 'has', 'had', 'having', 'do', 'does', 'did', 'doing', 'a', 'an', 'the', 'and', 'but', 'if', 'or', 'because', 'as', 'until', 'while', 'of', 'at', 'by', 'for', 'with', 'about', 'against', 'between', 'into', 'through', 'during', 'before', 'after', 'above', 'below', 'to', 'from', 'up', 'down', 'in', 'out', 'on', 'off', 'over', 'under', 'again', 'further', 'then', 'once', 'here', 'there', 'when', 'where', 'why', 'how', 'all', 'any', 'both', 'each', 'few', 'more', 'most', 'other', 'some', 'such', 'no', 'nor', 'not', 'only', 'own', 'same', 'so', 'than', 'too', 'very', 's', 't', 'can', 'will', 'just', 'don', 'should', 'now', 'via', 'rt', '-', '&', '')
-
-
-  # The get method takes care of all api endpoints in this app except for /set_ec
+  # The get method takes care of the login flow and the landing page (/data is served by
+  # datahandler.py and the payflow by payments.py)
 
+  @instrumentation.timed
   def get(self, mode=""):
     
     client = oauth.TwitterClient(CONSUMER_KEY, CONSUMER_SECRET, "%s/app" % self.request.host_url)
    
     # The /app context ensures that the user has remaining requests that 
-    # they've paid for, computes relevance for tweets from their home timeline, 
-    # stashes the data and serves up the app. The app then requests the stashed 
-    # data via /data.
+    # they've paid for, kicks off a background refresh that computes relevance 
+    # for tweets from their home timeline and stashes the data, and serves up 
+    # the app. The app then requests the stashed data via /data.
 
     if mode == "app":
 
@@ -228,181 +171,177 @@ class AppHandler(webapp.RequestHandler):
 
       auth_token = self.request.get("oauth_token")
       auth_verifier = self.request.get("oauth_verifier")
-      user_info = client.get_user_info(auth_token, auth_verifier=auth_verifier)
+      with self.timer.span("oauth"):
+        user_info = client.get_user_info(auth_token, auth_verifier=auth_verifier)
 
       twitter_username = user_info['username']
 
-      # Has a user already used this webapp with twitter_username?
+      # A double-tapped login (or the app opened in two tabs) would otherwise be metered, and
+      # refreshed, twice. Logins are coalesced per user instead (see singleflight.py): one that
+      # starts while another for the same user is in progress, or within LOGIN_WINDOW seconds
+      # of it, shares its session
 
-      query = User.all().filter("twitter_username =", twitter_username)
-      user = query.get()
+      outcome = flights.do("login_" + twitter_username, lambda: login(user_info, self.timer), window=LOGIN_WINDOW)
 
-      # If not, create a user (and give them some free logins to this app)
+      # Redirect to a mobile client application that will use sid to make a request for the 
+      # tweets that are being filtered and stashed away
+
+      if outcome['metered']:
+        return self.redirect('/tweetview/index.html?sid='+outcome['sid'])
+      
+      # If an account exists but no logins are remaining, then direct the user to ante up
+      # via a PayPal Express Checkout pay flow
 
-      if user is None:
-        user = User(twitter_username=twitter_username, )
-        user.put()
+      else: 
 
-      # Avoid a full-blown Session implementation for purposes of simplicity in this demo code. (See 
-      # http://stackoverflow.com/questions/2560022/simple-app-engine-sessions-implementation
-      # for some very pragmatic tips on how you might approach that in a very lightweight fashion.)
-      # Sessions will be needed in both the if and the else clause below, so go ahead and compute it
+        template_values = {
+          'title' : 'Recharge Account',
+          'sid' : outcome['sid']
+        }
 
-      sid = str(random.random())[5:] + str(random.random())[5:] + str(random.random())[5:]
+        self.response.out.write(rendering.render('recharge_account.html', template_values))
 
-      # If yes and if they have some logins remaining, service their request
+    elif mode == "login":
 
-      if user.requests_remaining > 0:
+      return self.redirect(client.get_authorization_url())
 
-        # A trivial relevance algorithm for ranking tweets:
-        # For this trivial algorithm, we'll compute the most frequent terms for the 
-        # logged in user's favorite tweets and rank tweets in the home timeline as
-        # being more relevant if they contain those terms. Obviously, you could be much
-        # more creative, but this basic idea should get you on your way.
+    else: # root URL context 
 
-        # Fetch some data to be displayed and used in the relevance ranking. See
-        # http://dev.twitter.com/doc for a full API listing
+      template_values = {
+        'title' : 'Tweet Relevance',
+      }
 
-        data_urls = {
-          "home_timeline" : "http://api.twitter.com/1/statuses/home_timeline.json",
-          "favorites_timeline" : "http://api.twitter.com/1/favorites.json",
-        }
+      self.response.out.write(rendering.render_static('root.html', template_values))
 
-        # Fetch the first 5 pages of results for the data urls. (More pages could be requested.)
-        # By default, there are 20 tweets per page for favorites and the home timeline
+# The settings a user can change from the client, for the session ?sid=. GET returns them along
+# with the languages there are stopword packs for (see normalize.py). POST ?language= changes the
+# language their tweets' terms are normalized for ('' goes back to their Twitter account's at
+# their next login) and re-ranks their timeline with it
 
-        num_pages = 5
-        data = {}
-        for name, url in data_urls.items():
-          data[name] = []
-          for page in range(1,num_pages+1):
-            result = client.make_request(url=url, token=user_info['token'], secret=user_info['secret'], additional_params={'page' : page})
-            if result.status_code == 200:
-              data[name] += json.loads(result.content)
-            else:
-              # Could do any number of useful things to actually handle this error
-              logging.error(("Expected 200 response but received %d for request " + url) % (result.status_code, page,))
+class SettingsHandler(webapp.RequestHandler):
 
-        # Split out the text of the tweets, remove some leading/trailing punctuation, and filter
-        # common stopwords 
+  def _user(self):
+    user_info = get_session(self.request.get("sid"))
+    if user_info is None:
+      return None, None
 
-        terms = [
-            self._cleanupTerm(term.lower())
-            for tweet in data['favorites_timeline']
-                for term in tweet['text'].split() 
-                    if self._cleanupTerm(term.lower()) not in self._getStopwords()
-        ]
+    with self.timer.span("datastore:query"):
+      user = User.all().filter("twitter_username =", user_info['username']).get()
+    return user_info, user
 
-        # Build a frequency map and sort by value
+  def _write(self, user):
+    self.response.headers.add_header('content-type', 'application/json', charset='utf-8')
+    self.response.out.write(json.dumps({'language' : user.language,
+                                        'languages' : sorted(normalize.LANGUAGES)}))
 
-        freqs = {}
-        for term in terms:
-          freqs[term] = freqs.get(term, 0) + 1           
+  @instrumentation.timed
+  def get(self, mode=""):
+    user_info, user = self._user()
+    if user is None:
+      return self.error(404)
 
-        sorted_terms = sorted(freqs.iteritems(), key=operator.itemgetter(1), reverse=True)
+    self._write(user)
 
-        # Iterate through each tweet in the home_timeline and assign a relevance score based upon 
-        # the ratio of how many of the top N frequent terms from the favorities appeared in the tweet
+  @instrumentation.timed
+  def post(self, mode=""):
+    user_info, user = self._user()
+    if user is None:
+      return self.error(404)
 
-        n = 200
-        top_n_terms = set([term for (term, freq) in sorted_terms[:n]])
+    language = self.request.get("language") or None
+    if language is not None and language not in normalize.LANGUAGES:
+      return self.error(400)
 
-        # Useful for gaining intuition into how the trivial algorithm works
+    if language != user.language:
+      user.language = language
+      with self.timer.span("datastore:put"):
+        db.put(user)
 
-        logging.info("\n\nTOP N TERMS FROM FAVORITES:")
-        logging.info(top_n_terms)
-        logging.info("\n\n")
+      # A refresh enqueued for the login ranked with the old language, so this one mustn't be
+      # deduped against it. The session then waits for its ranking, as after a login (cached
+      # sessions are shared, so it's copied rather than changed)
 
-        for tweet in data['home_timeline']:
-          tweet_terms = set([ self._cleanupTerm(term.lower())
-                              for term in tweet['text'].split() 
-                                if self._cleanupTerm(term.lower()) not in self._getStopwords()
-                        ])
+      requested = time.time()
+      with self.timer.span("taskqueue:add"):
+        refresh.queue.add(user.twitter_username, dedup=False)
 
-          num_frequent_terms = len(tweet_terms.intersection(top_n_terms))
+      with self.timer.span("memcache:set"):
+        cache.set(self.request.get("sid"), dict(user_info, refresh_requested=requested), time=SESSION_TTL)
 
-          tweet['relevance'] = 1.0*num_frequent_terms/len(tweet_terms)
+    self._write(user)
 
-          # You could optionally do any number of other things like normalize tweet scores at this point,
-          # boost relevance scores based upon additional criteria, throw in a random amount of serendipity 
-          # into scores, etc. We'll just be boring  and filter out any tweet with a relevance greater than 0.0
-          # so that only tweets with a relevance of 0.0 or higher are returned in the final response
-          # The sky is the limit
+# Background work, enqueued by /app and by cron (see cron.yaml). Restricted to admins in app.yaml,
+# which the task queue and cron satisfy
 
-        user_info['relevant_tweets'] = [tweet for tweet in data['home_timeline'] if tweet['relevance'] > 0]
+class TaskHandler(webapp.RequestHandler):
 
-        # For purposes of not frustrating users of this sample code who don't have any favorites (and would
-        # hence not have any "relevant tweets", check to make sure at least one relevant tweet exists and
-        # if it doesn't, just go ahead and assign all tweets as relevant since we have no information to 
-        # otherwise make a decision
-        if len(user_info['relevant_tweets']) == 0:
-          user_info['relevant_tweets'] = data['home_timeline']
+  @instrumentation.timed
+  def post(self, mode=""):
 
-        # Store the ranked tweets as to user_info as "relevant_tweets" and 
-        # stash the latest results from relevance algorithm so the client app can grab them
-        # from a subsequent request to /data 
-        memcache.set(sid, user_info, time=60*10) # seconds
+    if mode == "refresh":
+      refresh_user(self.request.get("username"), timer=self.timer)
 
-        user.requests_remaining -= 1 # Meter the request
-        db.put(user)
+  @instrumentation.timed
+  def get(self, mode=""):
 
-        # Redirect to a mobile client application that will use sid to make a request for the 
-        # tweets we just filtered and stashed away
+    # Keep every user who logged in recently warm
 
-        return self.redirect('/tweetview/index.html?sid='+sid)
-      
-      # If an account exists but no logins are remaining, then direct the user to ante up
-      # via a PayPal Express Checkout pay flow
+    if mode == "refresh_active":
+      since = datetime.datetime.now() - datetime.timedelta(days=refresh.ACTIVE_DAYS)
+      for user in User.all().filter("last_login >", since):
+        refresh.queue.add(user.twitter_username)
 
-      else: 
+# Operational endpoints. These are restricted to app admins in app.yaml
 
-        # Store the user_info so we can retrieve it in the next request
+class AdminHandler(webapp.RequestHandler):
 
-        memcache.set(sid, user_info, time=60*10) # seconds
+  def get(self, mode=""):
 
-        template_values = {
-          'title' : 'Recharge Account',
-          'sid' : sid
-        }
+    if mode == "metrics":
 
-        path = os.path.join(os.path.dirname(__file__), 'templates', 'recharge_account.html')
-        self.response.out.write(template.render(path, template_values))
+      # Dumps this instance's in-process aggregates along with the most recently flushed snapshots
 
-    # Serves up stashed data (which takes place in a prior request to /app). A ?refresh=true parameter could
-    # be built in to the /data request to charge the user for another request handle associated details if so
-    # desired. This /data implementation simply returns the most previously calculated data
+      snapshots = []
+      if self.request.get("recent"):
+        for snapshot in metrics.MetricsSnapshot.all().order("-created").fetch(int(self.request.get("recent"))):
+          snapshots.append(json.loads(snapshot.payload))
 
-    elif mode == "data":
+      if self.request.get("flush"):
+        metrics.flush()
 
-      user_info = memcache.get(self.request.get("sid"))
       self.response.headers.add_header('content-type', 'application/json', charset='utf-8')
-      self.response.out.write(json.dumps(user_info['relevant_tweets'], indent=2))
+      self.response.out.write(json.dumps({'current' : metrics.snapshot(), 'cache' : cache.stats(), 'recent' : snapshots}, indent=2))
 
-    elif mode == "login":
+    elif mode == "profiles":
 
-      return self.redirect(client.get_authorization_url())
+      # The profile of the request whose X-Profile-Id was ?id=, or a list of the recent ones
 
-    else: # root URL context 
+      if self.request.get("id"):
+        result = profiling.get(self.request.get("id"))
+        if result is None:
+          return self.error(404)
+      else:
+        result = {'enabled' : profiling.ENABLED, 'recent' : profiling.recent()}
 
-      template_values = {
-        'title' : 'Tweet Relevance',
-      }
+      self.response.headers.add_header('content-type', 'application/json', charset='utf-8')
+      self.response.out.write(json.dumps(result, indent=2))
 
-      path = os.path.join(os.path.dirname(__file__), 'templates', 'root.html')
-      self.response.out.write(template.render(path, template_values))
+# Built once per instance; App Engine caches this module (and so the application) between requests
 
-def main():
+application = webapp.WSGIApplication([('/(app)', AppHandler),
+                                      ('/(login)', AppHandler),
+                                      ('/', AppHandler),
+
+                                      ('/(settings)', SettingsHandler),
 
-  application = webapp.WSGIApplication([('/(set_ec)', PaymentHandler),
-                                        ('/(get_ec_details)', PaymentHandler),                                      
-                                        ('/(do_ec_payment)', PaymentHandler),                                      
-                                        ('/(cancel_ec)', PaymentHandler),                                      
+                                      ('/tasks/(refresh)', TaskHandler),
+                                      ('/tasks/(refresh_active)', TaskHandler),
 
-                                        ('/(app)', AppHandler),
-                                        ('/(data)', AppHandler),
-                                        ('/(login)', AppHandler),
-                                        ('/', AppHandler)],
-                                       debug=True)
+                                      ('/admin/(metrics)', AdminHandler),
+                                      ('/admin/(profiles)', AdminHandler)],
+                                     debug=True)
+
+def main():
   util.run_wsgi_app(application)
 
 if __name__ == '__main__':
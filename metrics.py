@@ -0,0 +1,154 @@
+"""Metrics.
+
+An in-process registry of counters and fixed-bucket latency histograms that
+aggregate across requests served by this instance:
+
+  metrics.incr("memcache.sid.miss")
+  metrics.observe("latency./app", elapsed_ms)
+
+Both are plain dict/list updates with no locking. (The app is served single
+threaded, and a rare lost increment under a threaded runtime is an acceptable
+price for keeping them this cheap.) maybe_flush() is called at the end of each
+request and, at most once every FLUSH_INTERVAL seconds, writes the aggregates
+to the log or to a MetricsSnapshot entity, per FLUSH_TO.
+"""
+
+import os
+import time
+import random
+import bisect
+import logging
+
+try:
+  from django.utils import simplejson as json
+except ImportError:
+  import json
+
+try:
+  from google.appengine.ext import db
+except ImportError:
+  db = None
+
+# Upper bounds (ms) of the histogram buckets; the last bucket is unbounded
+
+BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# Set via configure(), normally from METRICS_FLUSH_TO/METRICS_FLUSH_INTERVAL in config.py
+
+FLUSH_TO = "log"  # "log", "datastore" or None
+FLUSH_INTERVAL = 60  # seconds
+
+INSTANCE_ID = os.environ.get("INSTANCE_ID", "%08x" % random.getrandbits(32))
+
+_counters = {}
+_histograms = {}
+_started = time.time()
+_last_flush = time.time()
+
+
+def configure(flush_to="log", flush_interval=60):
+  global FLUSH_TO, FLUSH_INTERVAL
+
+  FLUSH_TO = flush_to
+  FLUSH_INTERVAL = flush_interval
+
+
+def incr(name, delta=1):
+  _counters[name] = _counters.get(name, 0) + delta
+
+
+def observe(name, value):
+  """Adds value (in ms) to the histogram called name."""
+
+  h = _histograms.get(name)
+  if h is None:
+    h = _histograms[name] = [0] * (len(BUCKETS) + 1) + [0.0]
+
+  h[bisect.bisect_left(BUCKETS, value)] += 1
+  h[-1] += value
+
+
+def counter(name):
+  return _counters.get(name, 0)
+
+
+def hit_rates():
+  """Returns the hit rate of every cache counted as a pair of "<name>.hit"
+  and "<name>.miss" counters (e.g. memcache.sid, tweetcache, rank.memo), as
+  a dict of name -> hits / (hits + misses)."""
+
+  rates = {}
+  for name, hits in _counters.items():
+    if name.endswith(".hit"):
+      name = name[:-len(".hit")]
+      misses = _counters.get(name + ".miss", 0)
+      rates[name] = round(1.0 * hits / (hits + misses), 4)
+
+  return rates
+
+
+def snapshot():
+  """Returns the current aggregates as a JSON-serializable dict."""
+
+  histograms = {}
+  for name, h in _histograms.items():
+    count = sum(h[:-1])
+    histograms[name] = {
+      'count' : count,
+      'mean_ms' : count and round(h[-1] / count, 2) or 0.0,
+      'buckets' : dict([("le_%s" % bound, n) for (bound, n) in zip(BUCKETS, h)] + [("inf", h[-2])]),
+    }
+
+  return {
+    'instance' : INSTANCE_ID,
+    'since' : _started,
+    'at' : time.time(),
+    'counters' : dict(_counters),
+    'hit_rates' : hit_rates(),
+    'histograms' : histograms,
+  }
+
+
+def reset():
+  global _started
+
+  _counters.clear()
+  _histograms.clear()
+  _started = time.time()
+
+
+if db is not None:
+
+  class MetricsSnapshot(db.Model):
+    """The aggregates of one instance over one flush interval."""
+
+    instance = db.StringProperty(required=True)
+    created = db.DateTimeProperty(auto_now_add=True)
+    payload = db.TextProperty(required=True)
+
+
+def flush():
+  """Writes the current aggregates to FLUSH_TO and starts a new interval."""
+
+  global _last_flush
+
+  data = snapshot()
+
+  if FLUSH_TO == "datastore" and db is not None:
+    try:
+      MetricsSnapshot(instance=INSTANCE_ID, payload=json.dumps(data)).put()
+    except Exception, e:
+      logging.error("Could not store metrics snapshot: %s" % e)
+      return
+  elif FLUSH_TO == "log":
+    logging.info("metrics %s" % json.dumps(data))
+  else:
+    return
+
+  _last_flush = time.time()
+  reset()
+
+
+def maybe_flush():
+  if FLUSH_TO and time.time() - _last_flush >= FLUSH_INTERVAL:
+    flush()
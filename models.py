@@ -0,0 +1,22 @@
+"""Models.
+
+The datastore models shared by the app's handler scripts.
+"""
+
+from google.appengine.ext import db
+
+# A simple (twitter_username, requests_remaining) tuple to track logins so that users can be
+# charged for access. By default, users get 25 free logins. The only other user information
+# stored is the access token/secret and the time of the last login, which the background
+# refresh (see refresh.py) needs in order to keep active users' rankings warm, and the language
+# their tweets' terms are normalized for (see normalize.py). (And memcache is
+# used to implement a minimalist session management scheme to keep track of the user between
+# requests, see sessions.py.)
+
+class User(db.Model):
+  twitter_username = db.StringProperty(required=True)
+  requests_remaining = db.IntegerProperty(required=True, default=25)
+  access_token = db.StringProperty()
+  access_secret = db.StringProperty()
+  last_login = db.DateTimeProperty()
+  language = db.StringProperty()
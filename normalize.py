@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+
+"""Normalization.
+
+Turns the text of a tweet into the terms that relevance.py ranks with. URLs,
+HTML entities and (by default) @mentions are removed before splitting, a
+"#" is dropped from hashtags so that they count as the plain word, and
+anything that isn't a word character (punctuation, emoji, symbols) never
+becomes part of a term. Terms are then filtered against the stopwords of a
+language pack and, optionally, stemmed with a light suffix stripper.
+
+Optionally, terms come out hashed to hash_bits bit ints (see hash_term())
+rather than as strings. Sets of small ints are cheaper to build, intersect
+and keep than sets of strings, and the vocabulary can't grow past 2 **
+hash_bits, at the cost of the terms that collide being counted as one (see
+bench/hashing.py for the collision rates).
+
+The language packs and regexes are compiled once at import. Pipelines are
+cached per (language, stem, keep_mentions, hash_bits) setting, so get() is
+cheap to call for every user.
+"""
+
+import re
+import zlib
+
+# Languages are Twitter's "lang" codes. Users whose language has no pack get DEFAULT_LANGUAGE's
+
+DEFAULT_LANGUAGE = 'en'
+
+# The stopword lists are adapted from nltk.corpus - See http://nltk.org. Apostrophes are
+# removed before terms are split out, so contractions are listed without them
+
+_STOPWORDS = {
+  'en' : u"""
+    i me my myself we our ours ourselves you your yours yourself yourselves he him his himself
+    she her hers herself it its itself they them their theirs themselves what which who whom
+    this that these those am is are was were be been being have has had having do does did
+    doing a an the and but if or because as until while of at by for with about against
+    between into through during before after above below to from up down in out on off over
+    under again further then once here there when where why how all any both each few more
+    most other some such no nor not only own same so than too very can will just should now
+    im ive id ill youre youve youll hes shes theyre weve isnt arent wasnt werent dont doesnt
+    didnt cant couldnt wont wouldnt shouldnt thats whats lets gonna
+  """,
+  'es' : u"""
+    de la que el en y a los del se las por un para con no una su al lo como mas pero sus le ya
+    o este si porque esta entre cuando muy sin sobre tambien me hasta hay donde quien desde
+    todo nos durante todos uno les ni contra otros ese eso ante ellos e esto mi antes algunos
+    que unos yo otro otras otra el tanto esa estos mucho quienes nada muchos cual poco ella
+    estar estas algunas algo nosotros mi mis tu te ti tu tus ellas nosotras vosotros
+    vosotras os mio mia mios mias tuyo tuya suyo suya nuestro nuestra vuestro vuestra es son
+    fue ha han soy eres está están estoy más también qué cómo sí
+  """,
+  'fr' : u"""
+    au aux avec ce ces dans de des du elle en et eux il je la le les leur lui ma mais me meme
+    mes moi mon ne nos notre nous on ou par pas pour qu que qui sa se ses son sur ta te tes toi
+    ton tu un une vos votre vous c d j l a m n s t y ete etee etes etais etait est suis es sont
+    ai as avons avez ont avait avais fait faire cest jai quil quelle nest sest cette cet
+    été être très plus où ça
+  """,
+  'de' : u"""
+    aber alle allem allen aller alles als also am an ander andere anderem anderen anderer
+    anderes auch auf aus bei bin bis bist da damit dann der den des dem die das dass du er ihn
+    ihm es ein eine einem einen einer eines euer eure fur gegen gewesen hab habe haben hat
+    hatte hatten hier hin hinter ich mich mir ihr ihre im in indem ins ist jede jedem jeden
+    jeder jedes jene jetzt kann kein keine machen man manche mein meine mit muss nach nicht
+    nichts noch nun nur ob oder ohne sehr sein seine sich sie sind so solche soll sondern um
+    und uns unser unter viel vom von vor war waren was weil weiter welche wenn werde werden
+    wie wieder will wir wird wo wollen zu zum zur uber für über daß
+  """,
+  'pt' : u"""
+    de a o que e do da em um para com nao uma os no se na por mais as dos como mas ao ele das
+    seu sua ou quando muito nos ja eu tambem so pelo pela ate isso ela entre depois sem mesmo
+    aos seus quem nas me esse eles voce essa num nem suas meu minha numa pelos elas qual nos
+    lhe deles essas esses pelas este dele tu te voces vos lhes meus minhas teu tua teus tuas
+    nosso nossa nossos nossas dela delas esta estes estas aquele aquela isto aquilo estou esta
+    estamos estao foi ser tem ter é não já também você só até está são
+  """,
+}
+
+# Twitter noise that's a stopword in every language
+
+_TWITTER_STOPWORDS = u"rt via mt cc ht amp"
+
+STOPWORDS = dict([(language, frozenset((words + " " + _TWITTER_STOPWORDS).split()))
+                  for (language, words) in _STOPWORDS.items()])
+
+LANGUAGES = frozenset(STOPWORDS)
+
+# Light stemming: the longest matching suffix is stripped as long as at least MIN_STEM
+# characters remain. This mostly conflates plurals and verb forms, which is all the
+# frequency counting needs
+
+MIN_STEM = 3
+
+# English doubles a final consonant before -ing/-ed ("running"), so the stem is undoubled
+
+_DOUBLED = re.compile(r'([bdfgmnprt])\1$')
+
+_SUFFIXES = {
+  'en' : u"ational ization fulness ousness iveness ingly edly ness ment ings ing ies ied es ed ly s",
+  'es' : u"amientos imientos amiento imiento aciones ación ando iendo mente ados idos adas idas es s",
+  'fr' : u"issements issement ations ation ement ments ment euses euse eaux aux es s x",
+  'de' : u"ungen ung heiten heit keiten keit lich isch ern em en er es e n s",
+  'pt' : u"amentos imentos amento imento ações ação mente ando endo indo ados idos adas idas es s",
+}
+
+SUFFIXES = dict([(language, tuple(sorted(suffixes.split(), key=len, reverse=True)))
+                 for (language, suffixes) in _SUFFIXES.items()])
+
+# One regex per language: the shortest stem of at least MIN_STEM characters, i.e. the longest
+# suffix, wins
+
+_STEMMERS = dict([(language, re.compile(u'^(.{%d,}?)(?:%s)$' % (MIN_STEM, '|'.join(suffixes)), re.UNICODE | re.DOTALL))
+                  for (language, suffixes) in SUFFIXES.items()])
+
+# Removed before splitting. Mentions are handled separately so that they can be kept
+
+_URL = re.compile(r'(?:https?://|www\.)\S+', re.IGNORECASE)
+_ENTITY = re.compile(r'&(?:#\d+|\w+);')
+_MENTION = re.compile(r'(?<!\w)@\w+', re.UNICODE)
+_APOSTROPHE = re.compile(u"['’]")
+
+# What's left of a term: a run of letters/digits (with a leading @ for kept mentions). Emoji
+# and punctuation aren't word characters, so they're dropped here
+
+_TERM = re.compile(r'(?<!\w)@\w+|[^\W_]+', re.UNICODE)
+_DIGITS = re.compile(r'^\d+$')
+
+# Terms are hashed with CRC-32, which is stable across processes and platforms (hashed terms end
+# up in memcache), so at most 32 bits are available
+
+MAX_HASH_BITS = 32
+
+
+def hash_term(term, bits):
+  """Returns term (a unicode string) hashed to a bits bit int."""
+
+  return zlib.crc32(term.encode('utf-8')) & ((1 << bits) - 1)
+
+
+class Normalizer(object):
+  """A compiled normalization pipeline; call it with a tweet's text."""
+
+  def __init__(self, language=DEFAULT_LANGUAGE, stem=False, keep_mentions=False, hash_bits=0):
+    if language not in LANGUAGES:
+      language = DEFAULT_LANGUAGE
+
+    self.language = language
+    self.stopwords = STOPWORDS[language]
+    self.stemmer = stem and _STEMMERS.get(language) or None
+    self.undouble = language == 'en'
+    self.keep_mentions = keep_mentions
+    self.hash_bits = min(hash_bits or 0, MAX_HASH_BITS)
+
+    # Identifies the pipeline's output, e.g. for caching terms per pipeline
+
+    self.name = "%s%s%s%s" % (language, stem and "+stem" or "", keep_mentions and "+mentions" or "",
+                              self.hash_bits and "+h%d" % self.hash_bits or "")
+
+  def stem(self, term):
+    match = self.stemmer.match(term)
+    if match is None:
+      return term
+
+    term = match.group(1)
+    if self.undouble:
+      term = _DOUBLED.sub(r'\1', term)
+
+    return term
+
+  def __call__(self, text):
+    text = _URL.sub(' ', text)
+    text = _ENTITY.sub(' ', text)
+    if not self.keep_mentions:
+      text = _MENTION.sub(' ', text)
+    text = _APOSTROPHE.sub('', text.lower())
+
+    stopwords = self.stopwords
+    stem = self.stemmer and self.stem
+
+    terms = []
+    for term in _TERM.findall(text):
+      if len(term) < 2 or term in stopwords or _DIGITS.match(term):
+        continue
+      if stem and term[0] != '@':
+        term = stem(term)
+      terms.append(term)
+
+    if self.hash_bits:
+      mask = (1 << self.hash_bits) - 1
+      crc32 = zlib.crc32
+      terms = [crc32(term.encode('utf-8')) & mask for term in terms]
+
+    return terms
+
+
+# Module wide defaults, set from config.py by bootstrap.py
+
+_default_language = DEFAULT_LANGUAGE
+_stem = False
+_keep_mentions = False
+_hash_bits = 0
+
+_pipelines = {}
+
+
+def configure(language=DEFAULT_LANGUAGE, stem=False, keep_mentions=False, hash_bits=0):
+  global _default_language, _stem, _keep_mentions, _hash_bits
+
+  _default_language = language in LANGUAGES and language or DEFAULT_LANGUAGE
+  _stem = stem
+  _keep_mentions = keep_mentions
+  _hash_bits = hash_bits
+
+
+def get(language=None):
+  """Get.
+
+  Returns the Normalizer for language (or the configured default language)
+  with the configured stemming, mention and hashing settings.
+  """
+
+  language = language in LANGUAGES and language or _default_language
+  key = (language, _stem, _keep_mentions, _hash_bits)
+
+  normalizer = _pipelines.get(key)
+  if normalizer is None:
+    normalizer = _pipelines[key] = Normalizer(language, _stem, _keep_mentions, _hash_bits)
+
+  return normalizer
@@ -43,7 +43,6 @@ A typical use case inside an AppEngine controller would be:
 note however this software is unsupported. Please don't email me about it. :)
 """
 
-from google.appengine.api import memcache
 from google.appengine.api import urlfetch
 from google.appengine.ext import db
 
@@ -59,6 +58,8 @@ from urllib import unquote as urlunquote
 
 import logging
 
+import cache
+
 
 TWITTER = "twitter"
 YAHOO = "yahoo"
@@ -173,14 +174,15 @@ class OAuthClient():
     return urlencode(params)
 
   def make_async_request(self, url, token="", secret="", additional_params=None,
-                         protected=False, method=urlfetch.GET, headers={}):
+                         protected=False, method=urlfetch.GET, headers={}, deadline=10.0):
     """Make Request.
 
     Make an authenticated request to any OAuth protected resource.
 
     If protected is equal to True, the Authorization: OAuth header will be set.
 
-    A urlfetch response object is returned.
+    A urlfetch RPC is returned; the request fails if it takes longer than
+    deadline seconds.
     """
 
     payload = self.prepare_request(url, token, secret, additional_params,
@@ -193,7 +195,7 @@ class OAuthClient():
     if protected:
       headers["Authorization"] = "OAuth"
 
-    rpc = urlfetch.create_rpc(deadline=10.0)
+    rpc = urlfetch.create_rpc(deadline=deadline)
     urlfetch.make_fetch_call(rpc, url, method=method, headers=headers,
                              payload=payload)
     return rpc
@@ -224,7 +226,7 @@ class OAuthClient():
     auth_token = urlunquote(auth_token)
     auth_verifier = urlunquote(auth_verifier)
 
-    auth_secret = memcache.get(self._get_memcache_auth_key(auth_token))
+    auth_secret = cache.get(self._get_memcache_auth_key(auth_token), ttl=20*60)
 
     if not auth_secret:
       result = AuthToken.gql("""
@@ -277,8 +279,8 @@ class OAuthClient():
     auth.put()
 
     # Add the secret to memcache as well.
-    memcache.set(self._get_memcache_auth_key(auth_token), auth_secret,
-                 time=20*60)
+    cache.set(self._get_memcache_auth_key(auth_token), auth_secret,
+              time=20*60)
 
     return auth_token
 
@@ -384,6 +386,7 @@ class TwitterClient(OAuthClient):
     user_info["username"] = data["screen_name"]
     user_info["name"] = data["name"]
     user_info["picture"] = data["profile_image_url"]
+    user_info["lang"] = data.get("lang")
 
     return user_info
 
@@ -0,0 +1,243 @@
+"""Packing.
+
+A compact serialized representation for ranked tweets (lists of the
+projected statuses produced by tweetcache.project plus a relevance score),
+which is smaller than a pickle of the same dicts.
+
+Layout (little endian), everything after the header optionally zlib
+compressed:
+
+  header   magic "TR", version, flags, tweet count, string count
+  strings  string count uint32 byte lengths, then the utf-8 bytes
+  ids      tweet count int64 status ids
+  scores   tweet count float32 relevance scores
+  columns  for each of STRING_FIELDS, tweet count uint32 1-based indexes into
+           the string table (MISSING, i.e. 0, when a tweet doesn't have the
+           field)
+  counts   with FLAG_COLLAPSED, tweet count uint32 counts of the duplicates
+           collapsed into each tweet (see dedup.py)
+
+Strings are interned, so e.g. a user's name and avatar url are stored once no
+matter how many of their tweets are in the list.
+"""
+
+import zlib
+import struct
+
+MAGIC = "TR"
+VERSION = 1
+
+FLAG_ZLIB = 1
+
+# Only set when some tweet has duplicates collapsed into it, so rankings packed before the counts
+# existed still decode
+
+FLAG_COLLAPSED = 2
+
+# Fields of the projected status, with user fields spelled "user.<field>"
+
+STRING_FIELDS = ('text', 'created_at', 'from_user', 'profile_image_url',
+                 'user.screen_name', 'user.name', 'user.profile_image_url')
+
+# String table index of missing values; the table proper starts at 1
+
+MISSING = 0
+
+_HEADER = struct.Struct('<2sBBII')
+
+
+class PackingError(Exception):
+  pass
+
+
+def _get(tweet, field):
+  if field.startswith('user.'):
+    return (tweet.get('user') or {}).get(field[5:])
+
+  return tweet.get(field)
+
+
+def encode(tweets, compress=True, level=6):
+  """Encode.
+
+  Returns tweets packed into a str.
+  """
+
+  strings = []
+  index = {}
+  columns = []
+
+  for field in STRING_FIELDS:
+    column = []
+    for tweet in tweets:
+      value = _get(tweet, field)
+      if value is None:
+        column.append(MISSING)
+        continue
+
+      i = index.get(value)
+      if i is None:
+        strings.append(value)
+        i = index[value] = len(strings)
+      column.append(i)
+    columns.append(column)
+
+  n = len(tweets)
+  encoded = [s.encode('utf-8') for s in strings]
+
+  parts = [
+    struct.pack('<%dI' % len(encoded), *[len(s) for s in encoded]),
+    ''.join(encoded),
+    struct.pack('<%dq' % n, *[int(tweet.get('id') or 0) for tweet in tweets]),
+    struct.pack('<%df' % n, *[tweet.get('relevance', 0.0) for tweet in tweets]),
+  ]
+  for column in columns:
+    parts.append(struct.pack('<%dI' % n, *column))
+
+  flags = 0
+
+  counts = [tweet.get('collapsed', 0) for tweet in tweets]
+  if any(counts):
+    parts.append(struct.pack('<%dI' % n, *counts))
+    flags |= FLAG_COLLAPSED
+
+  body = ''.join(parts)
+
+  if compress:
+    body = zlib.compress(body, level)
+    flags |= FLAG_ZLIB
+
+  return _HEADER.pack(MAGIC, VERSION, flags, n, len(strings)) + body
+
+
+def _unpack_header(data):
+  try:
+    magic, version, flags, n, num_strings = _HEADER.unpack_from(data)
+  except struct.error:
+    raise PackingError("Truncated header")
+
+  if magic != MAGIC or version != VERSION:
+    raise PackingError("Not a packed v%d ranking" % VERSION)
+
+  body = data[_HEADER.size:]
+  if flags & FLAG_ZLIB:
+    body = zlib.decompress(body)
+
+  return n, num_strings, flags, body
+
+
+def decode_scores(data):
+  """Decode Scores.
+
+  Returns just the (id_str, relevance) pairs packed into data by encode,
+  without building the tweet dicts.
+  """
+
+  n, num_strings, flags, body = _unpack_header(data)
+
+  offset = 4 * num_strings + sum(struct.unpack_from('<%dI' % num_strings, body))
+  ids = struct.unpack_from('<%dq' % n, body, offset)
+  scores = struct.unpack_from('<%df' % n, body, offset + 8 * n)
+
+  return [(str(i), round(score, 6)) for (i, score) in zip(ids, scores)]
+
+
+def decode_collapsed(data):
+  """Decode Collapsed.
+
+  Returns a dict of id_str -> collapsed count for the tweets packed into
+  data by encode that have duplicates collapsed into them.
+  """
+
+  n, num_strings, flags, body = _unpack_header(data)
+  if not flags & FLAG_COLLAPSED:
+    return {}
+
+  offset = 4 * num_strings + sum(struct.unpack_from('<%dI' % num_strings, body))
+  ids = struct.unpack_from('<%dq' % n, body, offset)
+  counts = struct.unpack_from('<%dI' % n, body, offset + (12 + 4 * len(STRING_FIELDS)) * n)
+
+  return dict([(str(i), count) for (i, count) in zip(ids, counts) if count])
+
+
+class _LazyStrings(object):
+  """The string table, decoding each string on first use."""
+
+  def __init__(self, body, offset, lengths):
+    self.body = body
+    self.starts = [None, offset]
+    for length in lengths:
+      offset += length
+      self.starts.append(offset)
+    self.decoded = {MISSING : None}
+
+  def __getitem__(self, i):
+    s = self.decoded.get(i, self)
+    if s is self:
+      s = self.decoded[i] = self.body[self.starts[i]:self.starts[i+1]].decode('utf-8')
+    return s
+
+
+def decode(data, positions=None):
+  """Decode.
+
+  Returns the list of tweet dicts packed into data by encode, or just the
+  ones at positions (a sequence of indexes into that list) if given.
+  """
+
+  n, num_strings, flags, body = _unpack_header(data)
+
+  offset = 0
+  lengths = struct.unpack_from('<%dI' % num_strings, body, offset)
+  offset += 4 * num_strings
+
+  # Index 0 of the string table is reserved for missing values. When only a few positions are
+  # wanted, only the strings they use are decoded
+
+  if positions is None:
+    strings = [None]
+    for length in lengths:
+      strings.append(body[offset:offset+length].decode('utf-8'))
+      offset += length
+  else:
+    strings = _LazyStrings(body, offset, lengths)
+    offset += sum(lengths)
+
+  ids = struct.unpack_from('<%dq' % n, body, offset)
+  offset += 8 * n
+  scores = struct.unpack_from('<%df' % n, body, offset)
+  offset += 4 * n
+
+  columns = []
+  for field in STRING_FIELDS:
+    columns.append(struct.unpack_from('<%dI' % n, body, offset))
+    offset += 4 * n
+
+  counts = None
+  if flags & FLAG_COLLAPSED:
+    counts = struct.unpack_from('<%dI' % n, body, offset)
+
+  text, created_at, from_user, profile_image_url, screen_name, name, user_image_url = columns
+
+  if positions is None:
+    positions = xrange(n)
+
+  tweets = []
+  for i in positions:
+    tweet = {'id' : ids[i], 'id_str' : str(ids[i]), 'relevance' : round(scores[i], 6),
+             'text' : strings[text[i]], 'created_at' : strings[created_at[i]],
+             'user' : {'screen_name' : strings[screen_name[i]], 'name' : strings[name[i]],
+                       'profile_image_url' : strings[user_image_url[i]]}}
+
+    # These are only present in search results, so only add them when they're there
+
+    if from_user[i]:
+      tweet['from_user'] = strings[from_user[i]]
+    if profile_image_url[i]:
+      tweet['profile_image_url'] = strings[profile_image_url[i]]
+    if counts and counts[i]:
+      tweet['collapsed'] = counts[i]
+
+    tweets.append(tweet)
+
+  return tweets
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+
+##################################################################################################
+# The PayPal (Mobile) Express Checkout flow that recharges a user's account with logins. See
+# main.py for the rest of the app. This script only serves the payflow's routes (see app.yaml),
+# and PayPal's client (which pulls in urllib2) is imported on first use, so most requests to
+# it don't pay for loading that either.
+##################################################################################################
+
+from __future__ import with_statement
+
+import logging
+
+from google.appengine.ext import webapp
+from google.appengine.ext.webapp import util
+from google.appengine.ext import db
+
+import bootstrap
+import rendering
+import instrumentation
+import metrics
+
+from models import User
+from sessions import get_session
+
+# Copy config.template.py to config.py and fill in these values in that file
+
+from config import PP_API_USERNAME,\
+                   PP_API_PASSWORD,\
+                   PP_API_SIGNATURE
+
+# Returns PayPal's client class, importing it on first use (warmup.py calls this too)
+
+def load_paypal():
+  from paypal.interface import PayPalInterface
+  return PayPalInterface
+
+# Logic for interacting wtih PayPal's ExpressCheckout product
+
+class PaymentHandler(webapp.RequestHandler):
+
+  def _getPayPal(self):
+
+    return load_paypal()(API_USERNAME=PP_API_USERNAME, API_PASSWORD=PP_API_PASSWORD, API_SIGNATURE=PP_API_SIGNATURE)
+
+  def _getProduct(self):
+
+    # The app only features a single product: 100 login requests for a fixed price
+
+    return {'price' : 10.00, 'quantity' : 100, 'units' : 'login requests'}
+
+  @instrumentation.timed
+  def post(self, mode=""):
+
+    if mode == "set_ec":
+
+      sid = self.request.get("sid")
+      user_info = get_session(sid)
+
+      product = self._getProduct()
+
+      pp = self._getPayPal()
+      with self.timer.span("paypal:SetExpressCheckout"):
+        response = pp.set_express_checkout(amt=str(product['price']), returnurl=self.request.host_url+"/get_ec_details?sid="+sid, \
+                   cancelurl=self.request.host_url+"/cancel_ec?sid="+sid, paymentaction='Order')
+
+      if not response.success:
+        logging.error("Failure for SetExpressCheckout")
+
+        template_values = {
+          'title' : 'Error',
+          'operation' : 'SetExpressCheckout'
+        }
+        
+        return self.response.out.write(rendering.render_static('unknown_error.html', template_values))
+
+      # Redirect to PayPal and allow user to confirm payment details.
+      # Then PayPal redirects back to the /get_ec_details or /cancel_ec endpoints.
+      # Assuming /get_ec_details, we complete the transaction with pp.get_express_checkout_details
+      # and pp.do_express_checkout_payment
+
+      redirect_url = pp.generate_express_checkout_redirect_url(response.TOKEN)
+      return self.redirect(redirect_url)
+
+
+    else:
+      logging.error("Unknown mode for POST request!")
+
+  @instrumentation.timed
+  def get(self, mode=""):
+    if mode == "get_ec_details":
+      pp = self._getPayPal()
+      with self.timer.span("paypal:GetExpressCheckoutDetails"):
+        response = pp.get_express_checkout_details(self.request.get("token"))
+
+      if not response.success:
+        logging.error("Failure for GetExpressCheckoutDetails")
+
+        template_values = {
+          'title' : 'Error',
+          'operation' : 'GetExpressCheckoutDetails'
+        }
+        
+        return self.response.out.write(rendering.render_static('unknown_error.html', template_values))
+
+      product = self._getProduct()
+
+      template_values = {
+        'title' : 'Confirm Purchase',
+        'quantity' : product['quantity'], 
+        'units' : product['units'], 
+        'email' : response.EMAIL, 
+        'amount' : response.AMT,
+        'query_string_params' : self.request.query_string
+      }
+
+      self.response.out.write(rendering.render('confirm_purchase.html', template_values))
+
+    elif mode == "do_ec_payment":
+
+      user_info = get_session(self.request.get("sid"))
+
+      if user_info is not None: # Without an account reference, we can't credit the purchase
+        pp = self._getPayPal()
+        payerid = self.request.get("PayerID")
+
+        product = self._getProduct()
+
+        with self.timer.span("paypal:DoExpressCheckoutPayment"):
+          response = pp.do_express_checkout_payment(self.request.get("token"), payerid=payerid, amt=str(product['price']), paymentaction='Sale')
+
+        if not response.success:
+          logging.error("Failure for DoExpressCheckoutPayment")
+
+          template_values = {
+            'title' : 'Error',
+            'operation' : 'DoExpressCheckoutPayment'
+          }
+        
+          return self.response.out.write(rendering.render_static('unknown_error.html', template_values))
+
+        # Recharge the user's account with logins
+
+        twitter_username = user_info['username']
+        query = User.all().filter("twitter_username =", twitter_username)
+        user = query.get()
+        product = self._getProduct()
+        user.requests_remaining = product['quantity']
+        with self.timer.span("datastore:put"):
+          db.put(user)
+
+        template_values = {
+          'title' : 'Successful Payment',
+          'quantity' : product['quantity'],
+          'units' : product['units']
+        }
+        
+        self.response.out.write(rendering.render('successful_payment.html', template_values))
+
+      else:
+        logging.error("Invalid/expired session in /do_ec_payment")
+        metrics.incr("session.expired.do_ec_payment")
+
+        template_values = {
+          'title' : 'Session Expired',
+        }
+
+        self.response.out.write(rendering.render_static('session_expired.html', template_values))
+
+    elif mode == "cancel_ec":
+      template_values = {
+        'title' : 'Cancel Purchase',
+      }
+
+      self.response.out.write(rendering.render_static('cancel_purchase.html', template_values))
+
+# Built once per instance; App Engine caches this module (and so the application) between requests
+
+application = webapp.WSGIApplication([('/(set_ec)', PaymentHandler),
+                                      ('/(get_ec_details)', PaymentHandler),
+                                      ('/(do_ec_payment)', PaymentHandler),
+                                      ('/(cancel_ec)', PaymentHandler)],
+                                     debug=True)
+
+def main():
+  util.run_wsgi_app(application)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,186 @@
+"""Profiling.
+
+On-demand profiling of single requests, for when a request is slow for
+reasons that depend on its inputs (say, one user's timelines) and can't be
+reproduced elsewhere. With PROFILING_ENABLED in config.py, an app admin can
+add a profile=1 parameter or an X-Profile: 1 header to any request served by
+a handler method decorated with @instrumentation.timed, and the method runs
+under cProfile. The TOP_N functions with the most cumulative time and the
+TOP_N with the most time of their own, each with its heaviest callers, are
+stored in memcache under the request's id. That id is returned in an
+X-Profile-Id header, and /admin/profiles (see main.py) serves the profile
+back:
+
+  POST /tasks/refresh?username=someone&profile=1   ->   X-Profile-Id: 5f3a...
+  GET /admin/profiles?id=5f3a...
+
+Requests from anyone but a signed in app admin are never profiled. With
+profiling disabled, @timed doesn't wrap handler methods for it at all, so it
+costs nothing. That means PROFILING_ENABLED is read when the handlers are
+defined, which is after bootstrap.py has configured this module.
+"""
+
+import os
+import time
+import random
+import pstats
+
+try:
+  import cProfile
+except ImportError:
+  import profile as cProfile
+
+try:
+  from google.appengine.api import memcache
+  from google.appengine.api import users
+except ImportError:
+  memcache = users = None
+
+PARAM = "profile"
+HEADER_NAME = "X-Profile"
+ID_HEADER_NAME = "X-Profile-Id"
+
+PROFILE_KEY = "profile_%s"
+PROFILE_TTL = 60*60*24 # seconds
+
+# The ids of the most recent profiles, newest first, for /admin/profiles to list
+
+RECENT_KEY = "profile_recent"
+MAX_RECENT = 20
+
+# Callers listed with each function
+
+MAX_CALLERS = 3
+
+# Set via configure(), normally from PROFILING_ENABLED and PROFILE_TOP_N in config.py
+
+ENABLED = False
+TOP_N = 30
+
+_root = os.path.dirname(os.path.abspath(__file__)) + os.sep
+
+
+def configure(enabled=False, top_n=TOP_N):
+  global ENABLED, TOP_N
+
+  ENABLED = enabled
+  TOP_N = top_n
+
+
+def requested(handler):
+  """True if handler's request asks to be profiled and is an admin's."""
+
+  if not (handler.request.get(PARAM) or handler.request.headers.get(HEADER_NAME)):
+    return False
+
+  return users is not None and users.is_current_user_admin()
+
+
+def _label(function):
+  filename, line, name = function
+  if filename.startswith(_root):
+    filename = filename[len(_root):]
+  return "%s:%d(%s)" % (filename, line, name)
+
+
+def _cost(value):
+
+  # cProfile records each caller's (calls, primitive calls, own time, cumulative time), the
+  # profile module just its number of calls
+
+  if isinstance(value, tuple):
+    return value[3]
+  return value
+
+
+def top_functions(stats, n=None):
+  """Top Functions.
+
+  Returns (by cumulative time, by own time): the n functions of a
+  pstats.Stats with the most of each, as dicts of the function's calls,
+  primitive (non-recursive) calls, own and cumulative ms and heaviest
+  callers.
+  """
+
+  n = n or TOP_N
+
+  functions = []
+  for function, (primitive_calls, calls, own, cumulative, callers) in stats.stats.items():
+    heaviest = sorted(callers.items(), key=lambda (caller, value): _cost(value), reverse=True)[:MAX_CALLERS]
+    functions.append({'function' : _label(function), 'calls' : calls, 'primitive_calls' : primitive_calls,
+                      'own_ms' : round(own * 1000, 3), 'cumulative_ms' : round(cumulative * 1000, 3),
+                      'callers' : [_label(caller) for (caller, value) in heaviest]})
+
+  by_cumulative = sorted(functions, key=lambda f: f['cumulative_ms'], reverse=True)[:n]
+  by_own = sorted(functions, key=lambda f: f['own_ms'], reverse=True)[:n]
+  return by_cumulative, by_own
+
+
+def request_id():
+  """Returns the id App Engine logged the current request under, or a
+  random one outside App Engine."""
+
+  return os.environ.get('REQUEST_LOG_ID') or "%016x" % random.getrandbits(64)
+
+
+def save(profile):
+  memcache.set(PROFILE_KEY % profile['id'], profile, time=PROFILE_TTL)
+
+  recent = memcache.get(RECENT_KEY) or []
+  recent = [profile['id']] + [profile_id for profile_id in recent if profile_id != profile['id']]
+  memcache.set(RECENT_KEY, recent[:MAX_RECENT], time=PROFILE_TTL)
+
+
+def get(profile_id):
+  """Returns the stored profile for profile_id, or None."""
+
+  return memcache.get(PROFILE_KEY % profile_id)
+
+
+def recent():
+  """Returns the stored profiles of the most recent profiled requests,
+  without their functions, newest first."""
+
+  ids = memcache.get(RECENT_KEY) or []
+  profiles = memcache.get_multi(ids, key_prefix=PROFILE_KEY % '')
+
+  summaries = []
+  for profile_id in ids:
+    profile = profiles.get(profile_id)
+    if profile is not None:
+      summaries.append(dict([(key, value) for (key, value) in profile.items()
+                             if key not in ('cumulative', 'own')]))
+
+  return summaries
+
+
+def profiled(method):
+  """Wraps a RequestHandler method to run under cProfile when its request
+  asks to be (see requested()). instrumentation.timed applies this when
+  profiling is enabled."""
+
+  def wrapper(handler, *args, **kwargs):
+    if not requested(handler):
+      return method(handler, *args, **kwargs)
+
+    profiler = cProfile.Profile()
+    start = time.time()
+    try:
+      return profiler.runcall(method, handler, *args, **kwargs)
+    finally:
+      elapsed = time.time() - start
+
+      stats = pstats.Stats(profiler)
+      by_cumulative, by_own = top_functions(stats)
+
+      profile = {'id' : request_id(), 'request' : "%s %s" % (handler.request.method, handler.request.path),
+                 'query' : handler.request.query_string, 'created' : time.time(),
+                 'ms' : round(elapsed * 1000, 2), 'calls' : stats.total_calls,
+                 'cumulative' : by_cumulative, 'own' : by_own}
+      save(profile)
+
+      handler.response.headers[ID_HEADER_NAME] = profile['id']
+
+  wrapper.__name__ = method.__name__
+  wrapper.__doc__ = method.__doc__
+  return wrapper
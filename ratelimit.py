@@ -0,0 +1,184 @@
+"""Rate Limits.
+
+Twitter meters API calls per access token and reports where a token stands
+in the X-RateLimit-Limit, X-RateLimit-Remaining and X-RateLimit-Reset (epoch
+seconds) headers of every response. RateLimits keeps the latest of these for
+each token, plus an adaptive backoff for each token and for the app as a
+whole (when Twitter is overloaded or tells us to calm down, every token is
+affected), so that page fetches can be budgeted before they're made instead
+of discovered to have failed afterwards (see scheduler.py).
+
+State is kept in process and, if a store is given (anything with cache.py's
+get/set, e.g. the cache module itself), shared with other instances through
+it.
+"""
+
+import time
+import hashlib
+import logging
+
+import metrics
+
+LIMIT_HEADER = "X-RateLimit-Limit"
+REMAINING_HEADER = "X-RateLimit-Remaining"
+RESET_HEADER = "X-RateLimit-Reset"
+RETRY_AFTER_HEADER = "Retry-After"
+
+APP = "app"
+
+# Calls per token that page fetches leave alone, e.g. for verify_credentials at the next login
+
+RESERVE = 2
+
+# Backoff after a rate-limited or failed call doubles from BASE_BACKOFF up to MAX_BACKOFF
+# seconds, and resets after a success. A few 5xx in a row are needed to back the app off, since
+# the odd one is normal
+
+BASE_BACKOFF = 5
+MAX_BACKOFF = 15*60
+ERROR_THRESHOLD = 3
+
+# Twitter's v1 API answers a token's rate-limited calls with a 400 (and no calls remaining) or a
+# 429. 420 (Enhance Your Calm) and 5xx mean the app as a whole should back off
+
+ENHANCE_YOUR_CALM = 420
+
+STATE_TTL = 60*60 # seconds
+
+
+def _header(response, name):
+  headers = getattr(response, 'headers', None) or {}
+  value = headers.get(name)
+  if value is None:
+    for key in headers.keys():
+      if key.lower() == name.lower():
+        return headers[key]
+  return value
+
+
+def _int(value):
+  try:
+    return int(value)
+  except (TypeError, ValueError):
+    return None
+
+
+class RateLimits(object):
+
+  def __init__(self, store=None):
+    self.store = store
+    self.states = {}
+    self.dirty = set()
+
+  def _key(self, name):
+    if name == APP:
+      return "ratelimit_app"
+    return "ratelimit_%s" % hashlib.sha1(name.encode("utf-8")).hexdigest()[:16]
+
+  def state(self, name):
+    """Returns the state for a token (or APP): a dict with limit, remaining,
+    reset, failures and backoff_until, any of which may be None."""
+
+    # A state this instance saved stays in its local cache for STATE_TTL, so go straight to the
+    # store to see other instances' backoffs and counts
+
+    state = self.states.get(name)
+    if state is None and self.store is not None:
+      state = self.store.get(self._key(name), local=False)
+      if state is not None:
+        state = dict(state)
+    if state is None:
+      state = {'limit' : None, 'remaining' : None, 'reset' : None, 'failures' : 0, 'backoff_until' : None}
+
+    self.states[name] = state
+    return state
+
+  def budget(self, token, now=None):
+    """Budget.
+
+    Returns how many calls can be made with token right now: 0 while the
+    token or the app is backing off, None if nothing is known about the
+    token's limit (so the caller's own cap applies).
+    """
+
+    now = now or time.time()
+
+    for name in (APP, token):
+      backoff_until = self.state(name)['backoff_until']
+      if backoff_until and backoff_until > now:
+        return 0
+
+    state = self.state(token)
+    if state['remaining'] is None or (state['reset'] and state['reset'] <= now):
+      return None
+
+    return max(state['remaining'] - RESERVE, 0)
+
+  def low(self, token, fraction=0.1):
+    """True if less than fraction of token's hourly limit is left."""
+
+    state = self.state(token)
+    if state['remaining'] is None or not state['limit']:
+      return False
+
+    return state['remaining'] < fraction * state['limit']
+
+  def update(self, token, response, now=None):
+    """Records what response (to a call made with token) says about its limits."""
+
+    now = now or time.time()
+    state = self.state(token)
+
+    remaining = _int(_header(response, REMAINING_HEADER))
+    if remaining is not None:
+      state['remaining'] = remaining
+      state['limit'] = _int(_header(response, LIMIT_HEADER)) or state['limit']
+      state['reset'] = _int(_header(response, RESET_HEADER)) or state['reset']
+    elif state['remaining']:
+      state['remaining'] -= 1
+
+    retry_after = _int(_header(response, RETRY_AFTER_HEADER))
+    if retry_after is not None:
+      retry_after += now
+
+    status = response.status_code
+    if status == 429 or (status == 400 and remaining == 0):
+      metrics.incr("ratelimit.limited")
+      self._back_off(token, now, retry_after or state['reset'])
+    elif status == ENHANCE_YOUR_CALM:
+      self._back_off(APP, now, retry_after)
+    elif status >= 500:
+      self._back_off(APP, now, retry_after, ERROR_THRESHOLD)
+    elif status == 200 and (state['failures'] or self.state(APP)['failures']):
+      state['failures'] = 0
+      self.state(APP)['failures'] = 0
+      self.dirty.add(APP)
+
+    self.dirty.add(token)
+
+  def _back_off(self, name, now, until=None, threshold=1):
+    state = self.state(name)
+    state['failures'] += 1
+    self.dirty.add(name)
+
+    if state['failures'] < threshold:
+      return
+
+    delay = min(BASE_BACKOFF * 2 ** (state['failures'] - threshold), MAX_BACKOFF)
+    if until and until > now:
+      delay = max(delay, until - now)
+
+    state['backoff_until'] = now + delay
+
+    metrics.incr("ratelimit.backoff")
+    logging.warning("Backing off %s for %ds after %d failure(s)" % (name == APP and APP or "a token",
+                                                                    delay, state['failures']))
+
+  def save(self):
+    """Writes changed states to the store."""
+
+    if self.store is not None:
+      for name in self.dirty:
+        self.store.set(self._key(name), self.states[name], time=STATE_TTL)
+
+    self.dirty.clear()
@@ -0,0 +1,380 @@
+"""Background Refresh.
+
+Keeps each active user's ranked timeline warm in memcache (under
+RANKED_KEY % username) so that /app only has to do the OAuth exchange and
+metering before redirecting to the client. The ranking itself runs in a task
+queue task (see TaskHandler in main.py), and a cron job re-enqueues users who
+have logged in within the last ACTIVE_DAYS.
+
+/data serves whatever ranked result is cached and flags it as stale when a
+refresh requested after it was computed hasn't finished yet, so the client
+knows fresher results are coming. Each ranked result also carries an inverted
+index of its tweets' terms (see termindex.py) for /data's q= filter.
+"""
+
+from __future__ import with_statement
+
+import re
+import time
+import logging
+
+try:
+  from google.appengine.api import taskqueue
+except ImportError:
+  try:
+    from google.appengine.api.labs import taskqueue
+  except ImportError:
+    taskqueue = None
+
+import topk
+import cache
+import metrics
+import packing
+import normalize
+import termindex
+import singleflight
+
+from instrumentation import NULL_TIMER
+
+RANKED_KEY = "ranked_%s"
+RANKED_TTL = 60*60*24 # seconds
+
+REFRESH_URL = "/tasks/refresh"
+
+# With approximate term counting (see topk.py), the counts of the terms of all of a user's
+# favorites seen so far, and the ids of the most recently counted ones, are kept so that
+# favorites that have since dropped out of the fetched pages still count. memcache won't keep
+# them for longer than 30 days
+
+FAVORITE_TERMS_KEY = "favorite_terms_%s"
+FAVORITE_TERMS_TTL = 60*60*24*30 # seconds
+
+# Favorites come newest favorited first, not in tweet id order (an old tweet can be favorited
+# today), so the ids counted are remembered rather than the newest one. This many is well over
+# the number of favorites a refresh fetches, so a favorite is never forgotten while it can still
+# be fetched again
+
+MAX_COUNTED_FAVORITES = 1000
+
+# Users who have logged in within this many days are kept warm by the cron job
+
+ACTIVE_DAYS = 7
+
+# The version of each user's ranking that /data last sent their client is kept so that it can
+# send just the changes since then (see delta()). Only that one is kept: the cron job makes a
+# new version every time an active user's ranking changes, and a client only ever asks for the
+# changes since the one it has. It's kept for as long as the cron job keeps the user warm
+
+SYNCED_KEY = "ranked_synced_%s"
+SYNCED_TTL = 60*60*24*ACTIVE_DAYS # seconds
+
+# At most one refresh task is enqueued per user per this many seconds
+
+DEDUP_WINDOW = 60
+
+
+def get_ranked(username, local=True):
+  """Get Ranked.
+
+  Returns the cached {'packed', 'index', 'updated', 'version'} for username,
+  or None. The ranked tweets are packed with packing.encode (see
+  ranked_tweets()) and index is their termindex.encode'd terms.
+  Pass local=False to skip this instance's copy and see a newer refresh made
+  by another instance.
+  """
+
+  return cache.get(RANKED_KEY % username, ttl=RANKED_TTL, local=local)
+
+
+# Coalesces concurrent refreshes of the same user, e.g. a login's and the cron job's
+
+flights = singleflight.SingleFlight()
+
+
+def refresh(client, username, token, secret, timer=NULL_TIMER, language=None):
+  """Refresh.
+
+  Fetches and ranks username's timelines with the stored access token and
+  secret and caches the result. language picks the stopwords and stemming
+  the terms are normalized with (see normalize.py). If another refresh of
+  username is already running, waits for it and returns its ranking instead
+  of fetching and ranking again (see singleflight.py).
+  """
+
+  led = {}
+
+  def lead():
+    led['ranked'] = _refresh(client, username, token, secret, timer, language)
+    return led['ranked'] and led['ranked']['version']
+
+  flights.do("refresh_" + username, lead)
+
+  if 'ranked' in led:
+    return led['ranked']
+
+  return get_ranked(username, local=False)
+
+
+def _refresh(client, username, token, secret, timer, language):
+
+  # Imported here rather than with the module since /data, which only reads rankings, imports
+  # this module too and shouldn't have to load the fetching and ranking stack (urlfetch et al.)
+
+  import ratelimit
+  import relevance
+
+  # Rate limits are shared with other instances through the cache
+
+  limits = ratelimit.RateLimits(cache)
+
+  data = relevance.fetch_timelines(client, token, secret, timer=timer, language=language, limits=limits)
+
+  previous = get_ranked(username, local=False)
+
+  # Nothing came back (e.g. the token is out of calls until its limit resets), so keep serving the
+  # last ranking rather than replacing it with an empty one. The cron job will try again
+
+  if not data['home_timeline']:
+    logging.warning("No home timeline pages fetched for %s; keeping the previous ranking" % username)
+    return previous
+
+  # If neither timeline has changed since the last ranking (a returning user with a quiet
+  # timeline, or a cron refresh right after a login's), ranking again would give the same result,
+  # so reuse it. It's re-stashed as updated now so that /data doesn't keep flagging it as stale,
+  # but keeps its version, since clients that have it are up to date
+
+  fingerprint = relevance.fingerprint(data['home_timeline'], data['favorites_timeline'], language)
+
+  if previous is not None and previous.get('fingerprint') == fingerprint:
+    metrics.incr("rank.memo.hit")
+    ranked = dict(previous, updated=time.time())
+    with timer.span("memcache:set"):
+      cache.set(RANKED_KEY % username, ranked, time=RANKED_TTL)
+    return ranked
+
+  metrics.incr("rank.memo.miss")
+
+  favorites = data['favorites_timeline']
+  counter = None
+  if topk.ENABLED:
+    counter, favorites, counted = favorite_terms(username, favorites, language)
+
+  relevant_tweets, top_n_terms = relevance.rank(data['home_timeline'], favorites, timer=timer, counter=counter)
+
+  if counter is not None:
+    with timer.span("memcache:set"):
+      cache.set(FAVORITE_TERMS_KEY % username, {'counts' : counter.encode(), 'counted' : counted,
+                                                'normalizer' : normalize.get(language).name},
+                time=FAVORITE_TERMS_TTL)
+
+  # Useful for gaining intuition into how the trivial algorithm works
+
+  logging.info("\n\nTOP N TERMS FROM FAVORITES FOR %s:" % username)
+  logging.info(top_n_terms)
+  logging.info("\n\n")
+
+  # Pack the ranked tweets so that they take up less of memcache (and of the local cache) and
+  # are cheaper to load on every /data request, and index their terms for /data's filters
+
+  ranked = relevance.ranked_entry(relevant_tweets, data['home_timeline'], language, timer, fingerprint)
+
+  with timer.span("memcache:set"):
+    cache.set(RANKED_KEY % username, ranked, time=RANKED_TTL)
+
+  return ranked
+
+
+def favorite_terms(username, favorites, language=None):
+  """Favorite Terms.
+
+  Returns the topk.SpaceSaving that's counted username's favorites so far
+  (a new one if there isn't one), those of favorites (a list of (terms,
+  projected status) entries) that it hasn't counted yet and the ids of the
+  MAX_COUNTED_FAVORITES most recently counted favorites, newest first, which
+  are stored with the counter once it's counted them. The terms are those of
+  language's normalization pipeline.
+  """
+
+  # Another instance may have counted favorites since this one's local copy was made, so go
+  # straight to memcache rather than count them again
+
+  state = cache.get(FAVORITE_TERMS_KEY % username, ttl=60, local=False)
+
+  counter = None
+  counted = []
+  if state is not None:
+    try:
+      counter = topk.decode(state['counts'])
+      counted = state['counted']
+    except (topk.TopKError, KeyError), e:
+      logging.warning("Discarding %s's favorite term counts: %s" % (username, e))
+      counter = None
+
+  # A change of capacity, or of how terms are normalized (e.g. hashing them), starts the counts over
+
+  if counter is None or counter.capacity != topk.CAPACITY or state.get('normalizer') != normalize.get(language).name:
+    counter = topk.SpaceSaving()
+    counted = []
+
+  seen = set(counted)
+  new = [(terms, tweet) for (terms, tweet) in favorites if tweet.get('id') not in seen]
+  counted = [tweet.get('id') for (terms, tweet) in new] + counted
+
+  return counter, new, counted[:MAX_COUNTED_FAVORITES]
+
+
+def store_many(rankings):
+  """Store Many.
+
+  Caches many rankings at once, given a dict of username -> ranked entry
+  (see relevance.ranked_entry), e.g. from an offline re-rank. Returns the
+  list of usernames whose rankings couldn't be set.
+  """
+
+  mapping = {}
+  usernames = {}
+  for username, ranked in rankings.items():
+    mapping[RANKED_KEY % username] = ranked
+    usernames[RANKED_KEY % username] = username
+
+  return [usernames[key] for key in cache.set_multi(mapping, time=RANKED_TTL)]
+
+
+def ranked_tweets(ranked):
+  """Returns the list of ranked tweets in a get_ranked() result."""
+
+  return packing.decode(ranked['packed'])
+
+
+def filter_tweets(ranked, q=None, min_score=None):
+  """Filter Tweets.
+
+  Returns the ranked tweets in a get_ranked() result that contain all of the
+  terms in the query q (normalized like the tweets were) and that have a
+  relevance of at least min_score, answered from the ranked result's index
+  and scores so that only the matching tweets are decoded. A query with no
+  terms left once it's normalized (e.g. only stopwords) doesn't filter.
+  """
+
+  positions = None
+
+  if q:
+    index = termindex.TermIndex(ranked['index'])
+    terms = normalize.get(index.language)(q)
+    if terms:
+      positions = index.search(terms)
+
+  if min_score is not None:
+    scores = packing.decode_scores(ranked['packed'])
+    if positions is None:
+      positions = xrange(len(scores))
+    positions = [i for i in positions if scores[i][1] >= min_score]
+
+  return packing.decode(ranked['packed'], positions)
+
+
+def get_version(username, version):
+  """Returns the packed ranked tweets of an earlier version, or None if it
+  isn't the version username's client was last sent (see mark_synced())."""
+
+  # Whichever instance served the user last stored it, so skip this instance's copy
+
+  synced = cache.get(SYNCED_KEY % username, local=False)
+  if synced is None or synced['version'] != version:
+    return None
+
+  return synced['packed']
+
+
+def mark_synced(username, ranked):
+  """Keeps ranked (a get_ranked() result) as the version username's client
+  has, replacing the one it had before."""
+
+  cache.set(SYNCED_KEY % username, {'version' : ranked['version'], 'packed' : ranked['packed']},
+            time=SYNCED_TTL)
+
+
+def delta(old_packed, tweets):
+  """Delta.
+
+  Compares tweets to an earlier packed ranking and returns the tweets that
+  were added, the ids (id_str) of the ones that were removed and the new
+  scores of the ones that were re-scored, keyed by id. A tweet whose
+  collapsed count changed is both removed and added, so that the client
+  replaces it.
+  """
+
+  old_scores = dict(packing.decode_scores(old_packed))
+  old_counts = packing.decode_collapsed(old_packed)
+
+  added = []
+  replaced = []
+  rescored = {}
+  for tweet in tweets:
+    score = old_scores.pop(tweet['id_str'], None)
+    if score is None:
+      added.append(tweet)
+    elif tweet.get('collapsed', 0) != old_counts.get(tweet['id_str'], 0):
+      added.append(tweet)
+      replaced.append(tweet['id_str'])
+    elif score != tweet['relevance']:
+      rescored[tweet['id_str']] = tweet['relevance']
+
+  return {'added' : added, 'removed' : old_scores.keys() + replaced, 'rescored' : rescored}
+
+
+class TaskQueue(object):
+  """Enqueues refreshes on the App Engine task queue."""
+
+  def add(self, username, dedup=True):
+    """Enqueues a refresh of username's rankings. Returns False if one was
+    already enqueued in the current DEDUP_WINDOW (those starting at multiples
+    of it), True otherwise. Pass dedup=False for a refresh that an earlier
+    one can't stand in for, e.g. after a settings change."""
+
+    # Twitter usernames are [A-Za-z0-9_], but be safe since task names are restrictive
+
+    name = None
+    if dedup:
+      name = "refresh-%s-%d" % (re.sub(r'[^A-Za-z0-9_-]', '-', username), int(time.time() / DEDUP_WINDOW))
+
+    try:
+      taskqueue.add(url=REFRESH_URL, params={'username' : username}, name=name)
+    except (taskqueue.TaskAlreadyExistsError, taskqueue.TombstonedTaskError):
+      return False
+
+    return True
+
+
+class LocalQueue(object):
+  """Local stand-in for TaskQueue.
+
+  If run is given, each refresh is run inline by calling run(username);
+  otherwise usernames are collected in pending until run_pending() is called.
+  """
+
+  def __init__(self, run=None):
+    self.run = run
+    self.pending = []
+
+  def add(self, username, dedup=True):
+    if self.run is not None:
+      self.run(username)
+    else:
+      self.pending.append(username)
+
+    return True
+
+  def run_pending(self, run):
+    pending, self.pending = self.pending, []
+    for username in pending:
+      run(username)
+
+
+# The queue used by /app and the cron job. main.py swaps in a LocalQueue when
+# the task queue API isn't available
+
+if taskqueue is not None:
+  queue = TaskQueue()
+else:
+  queue = LocalQueue()
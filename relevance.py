@@ -0,0 +1,308 @@
+"""Relevance.
+
+The trivial relevance algorithm that AppHandler uses to rank a user's home
+timeline, pulled out of the request handler so that each stage (fetch,
+tokenize, rank) can be called on its own, e.g. by the offline benchmarks in
+bench/.
+
+For this trivial algorithm, we compute the most frequent terms for the
+logged in user's favorite tweets and rank tweets in the home timeline as
+being more relevant if they contain those terms. Obviously, you could be much
+more creative, but this basic idea should get you on your way.
+"""
+
+from __future__ import with_statement
+
+import re
+import time
+import hashlib
+import operator
+
+try:
+  from django.utils import simplejson as json
+except ImportError:
+  import json
+
+import topk
+import dedup
+import metrics
+import packing
+import normalize
+import ratelimit
+import termindex
+
+from scheduler import FetchScheduler
+from instrumentation import NULL_TIMER
+from tweetcache import TweetCache
+
+# Fetch some data to be displayed and used in the relevance ranking. See
+# http://dev.twitter.com/doc for a full API listing
+
+DATA_URLS = {
+  "home_timeline" : "http://api.twitter.com/1/statuses/home_timeline.json",
+  "favorites_timeline" : "http://api.twitter.com/1/favorites.json",
+}
+
+# Fetch the first 5 pages of results for the data urls. (More pages could be requested.)
+# By default, there are 20 tweets per page for favorites and the home timeline
+
+NUM_PAGES = 5
+
+# How many of the most frequent terms from the favorites count as "relevant"
+
+TOP_N = 200
+
+# Identifies the ranking algorithm in fingerprint()s. Bump it whenever a change to tokenizing,
+# collapsing or scoring would rank the same timelines differently, so that cached rankings made
+# the old way aren't reused
+
+RANKING_VERSION = 1
+
+
+def tokenize(text, language=None):
+  """Tokenize.
+
+  Splits out the terms of a tweet with the normalization pipeline for
+  language (see normalize.py), which drops URLs, mentions, punctuation,
+  emoji and the language's stopwords.
+  """
+
+  return normalize.get(language)(text)
+
+
+# Tokenized terms and projected fields of recently seen statuses, shared by all users'
+# rankings on this instance (see tweetcache.py)
+
+tweet_cache = TweetCache()
+
+# The simplejson bundled with django on App Engine only takes raw_decode's offset as idx=
+
+_decoder = json.JSONDecoder()
+_whitespace = re.compile(r'[ \t\n\r]*')
+
+
+def iter_statuses(content):
+  """Iter Statuses.
+
+  Yields the statuses in a page of results (a JSON array) one at a time, so
+  that the whole page never has to be materialized as a list of full status
+  objects.
+  """
+
+  skip = _whitespace.match
+
+  i = skip(content, 0).end()
+  if content[i:i+1] != '[':
+    raise ValueError("Expected a JSON array")
+
+  i = skip(content, i+1).end()
+  if content[i:i+1] == ']':
+    return
+
+  while True:
+    status, i = _decoder.raw_decode(content, idx=i)
+    yield status
+
+    i = skip(content, i).end()
+    c = content[i:i+1]
+    if c == ',':
+      i = skip(content, i+1).end()
+    elif c == ']':
+      return
+    else:
+      raise ValueError("Expected ',' or ']' at offset %d" % i)
+
+
+def tokenize_statuses(statuses, language=None):
+  """Tokenize Statuses.
+
+  Returns a list of (terms, projected status) entries for statuses (see
+  tweetcache.py), which is what rank() consumes.
+  """
+
+  normalizer = normalize.get(language)
+  return [tweet_cache.lookup(status, normalizer) for status in statuses]
+
+
+# Rate limits seen by fetches that aren't given their own (see ratelimit.py)
+
+local_limits = ratelimit.RateLimits()
+
+
+def fetch_timelines(client, token, secret, num_pages=NUM_PAGES, timer=NULL_TIMER, language=None,
+                    limits=None, deadline=None):
+  """Fetch Timelines.
+
+  Fetches up to num_pages pages of each of the DATA_URLS with client, as the
+  token's rate limits and the deadline (seconds overall) allow (see
+  scheduler.py), and returns a dict of timeline name -> list of (terms,
+  projected status) entries. Each page is parsed one status at a time as it
+  arrives and each status goes straight into the tweet cache, so only the
+  slim entries are kept across pages. Page fetches are recorded as
+  "fetch:<name>" spans on timer, the time spent waiting for them as "wait"
+  and parsing and tokenizing as "tokenize". Terms
+  are normalized for the user's language.
+  """
+
+  normalizer = normalize.get(language)
+  scheduler = FetchScheduler(client, limits or local_limits, timer, deadline)
+
+  # Pages can arrive in any order, so keep each page's entries apart until they're all in
+
+  pages = dict([(name, {}) for name in DATA_URLS])
+  for name, page, content in scheduler.fetch(DATA_URLS, token, secret, num_pages):
+    with timer.span("tokenize"):
+      pages[name][page] = [tweet_cache.lookup(status, normalizer) for status in iter_statuses(content)]
+
+  data = {}
+  for name, entries in pages.items():
+    data[name] = []
+    for page in sorted(entries):
+      data[name].extend(entries[page])
+
+  return data
+
+
+def top_terms(term_lists, n=TOP_N, counter=None):
+  """Top Terms.
+
+  Builds a frequency map over term_lists and returns the set of the n most
+  frequent terms. If counter (a topk.SpaceSaving, e.g. one that has already
+  counted earlier favorites) is given or approximate counting is enabled
+  (see topk.py), the terms are counted with it instead, in fixed memory.
+  """
+
+  if counter is None and topk.ENABLED:
+    counter = topk.SpaceSaving()
+
+  if counter is not None:
+    counter.update(term_lists)
+    return set([term for (term, count, error) in counter.top(n)])
+
+  freqs = {}
+  for terms in term_lists:
+    for term in terms:
+      freqs[term] = freqs.get(term, 0) + 1
+
+  sorted_terms = sorted(freqs.iteritems(), key=operator.itemgetter(1), reverse=True)
+
+  return set([term for (term, freq) in sorted_terms[:n]])
+
+
+def score_tweets(tweets, term_lists, top_n_terms):
+  """Score Tweets.
+
+  Returns copies of tweets with a relevance score assigned to each, based
+  upon the ratio of how many of the top N frequent terms appeared in the
+  tweet. (Copies, because tweets may be shared with other users' rankings
+  through the tweet cache.)
+  """
+
+  scored = []
+  for tweet, terms in zip(tweets, term_lists):
+    tweet_terms = set(terms)
+
+    tweet = dict(tweet)
+    if tweet_terms:
+      tweet['relevance'] = 1.0*len(tweet_terms.intersection(top_n_terms))/len(tweet_terms)
+    else:
+      tweet['relevance'] = 0.0
+    scored.append(tweet)
+
+    # You could optionally do any number of other things like normalize tweet scores at this point,
+    # boost relevance scores based upon additional criteria, throw in a random amount of serendipity
+    # into scores, etc. The sky is the limit
+
+  return scored
+
+
+def relevant_tweets(tweets):
+  """Relevant Tweets.
+
+  Filters out any tweet without a positive relevance score.
+  """
+
+  relevant = [tweet for tweet in tweets if tweet['relevance'] > 0]
+
+  metrics.incr("rank.runs")
+
+  # For purposes of not frustrating users of this sample code who don't have any favorites (and would
+  # hence not have any "relevant tweets", check to make sure at least one relevant tweet exists and
+  # if it doesn't, just go ahead and assign all tweets as relevant since we have no information to
+  # otherwise make a decision
+
+  if len(relevant) == 0:
+    metrics.incr("rank.fallback_all")
+    relevant = tweets
+
+  return relevant
+
+
+def rank(home, favorites, n=TOP_N, timer=NULL_TIMER, counter=None):
+  """Rank.
+
+  Ranks the home timeline entries against the favorites entries (both as
+  returned by fetch_timelines or tokenize_statuses), recording a "rank" span
+  on timer. Retweets and near-duplicates in the home timeline are collapsed
+  first (see dedup.py), recorded as a "dedup" span; each group is ranked as
+  its newest tweet, which carries a 'collapsed' count of the others. The
+  favorites' terms are counted with counter, if given (see top_terms()).
+  Returns a (relevant tweets, top N terms) tuple; the relevant tweets are
+  projected down to the fields the client uses.
+  """
+
+  with timer.span("dedup"):
+    home, counts = dedup.collapse(home)
+
+  with timer.span("rank"):
+    top_n_terms = top_terms([terms for (terms, tweet) in favorites], n, counter)
+    scored = score_tweets([tweet for (terms, tweet) in home], [terms for (terms, tweet) in home], top_n_terms)
+    for tweet, count in zip(scored, counts):
+      if count:
+        tweet['collapsed'] = count
+    relevant = relevant_tweets(scored)
+
+  return relevant, top_n_terms
+
+
+def fingerprint(home, favorites, language=None, n=TOP_N):
+  """Fingerprint.
+
+  Returns a str that identifies the inputs of a ranking: a hash of the
+  tweet ids of the home and favorites timelines (as returned by
+  fetch_timelines), in order, plus everything else that decides how they
+  rank (RANKING_VERSION, n and the normalization, collapsing and counting
+  settings).
+  Ranking inputs with the same fingerprint gives the same result, so a
+  deleted tweet, or a favorite added or removed anywhere in the timeline,
+  changes it.
+  """
+
+  parts = [RANKING_VERSION, n, normalize.get(language).name, dedup.ENABLED and dedup.MAX_DISTANCE,
+           topk.ENABLED and topk.CAPACITY]
+  for entries in (home, favorites):
+    ids = ','.join([str(tweet.get('id') or 0) for (terms, tweet) in entries])
+    parts.append(hashlib.md5(ids).hexdigest()[:16])
+
+  return ':'.join([str(part) for part in parts])
+
+
+def ranked_entry(relevant, home, language=None, timer=NULL_TIMER, fingerprint=None):
+  """Ranked Entry.
+
+  Returns what's cached for a ranking: {'packed', 'index', 'updated',
+  'version', 'fingerprint'}, where packed is the relevant tweets packed with
+  packing.encode, index is the termindex.encode'd terms of the home
+  timeline entries they came from, by position, and fingerprint is the
+  fingerprint() of the ranking's inputs, if given. Indexing is recorded as
+  an "index" span.
+  """
+
+  with timer.span("index"):
+    terms = dict([(tweet.get('id'), terms) for (terms, tweet) in home])
+    index = termindex.encode([terms.get(tweet.get('id'), ()) for tweet in relevant],
+                             normalize.get(language).language)
+
+  updated = time.time()
+  return {'packed' : packing.encode(relevant), 'index' : index, 'updated' : updated,
+          'version' : "%d" % (updated * 1000), 'fingerprint' : fingerprint}
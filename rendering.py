@@ -0,0 +1,80 @@
+"""Template Registry.
+
+Resolves and compiles each template in the templates directory once per
+process and renders from the compiled template objects. Pages that are
+always rendered with the same template values (cancel, session expired, the
+landing page, etc.) are rendered once and then served as pre-rendered bytes.
+
+The template stack (webapp's template module and Django) is slow to import,
+so it's loaded on first use rather than with this module. A pre-rendered page
+doesn't need it at all, and warmup.py loads it ahead of time.
+"""
+
+import os
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), 'templates')
+
+# name -> compiled template
+
+_compiled = {}
+
+# (name, template values) -> rendered utf-8 bytes
+
+_prerendered = {}
+
+template = None
+Context = None
+
+
+def load():
+  """Imports the template stack, if it hasn't been already."""
+
+  global template, Context
+
+  if template is None:
+    from google.appengine.ext.webapp import template as webapp_template
+    from django.template import Context as DjangoContext
+    template, Context = webapp_template, DjangoContext
+
+
+def get_template(name):
+  """Get Template.
+
+  Returns the compiled template for name, compiling it on first use.
+  """
+
+  t = _compiled.get(name)
+  if t is None:
+    load()
+    t = template.load(os.path.join(TEMPLATE_DIR, name))
+    _compiled[name] = t
+
+  return t
+
+
+def render(name, template_values):
+  """Render.
+
+  Renders the compiled template for name with template_values.
+  """
+
+  return get_template(name).render(Context(template_values))
+
+
+def render_static(name, template_values):
+  """Render Static.
+
+  Renders a page whose template values are constants. The result is cached as
+  bytes, so only pass values that don't vary by request.
+  """
+
+  key = (name, tuple(sorted(template_values.items())))
+
+  page = _prerendered.get(key)
+  if page is None:
+    page = render(name, template_values)
+    if isinstance(page, unicode):
+      page = page.encode('utf-8')
+    _prerendered[key] = page
+
+  return page
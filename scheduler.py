@@ -0,0 +1,326 @@
+"""Fetch Scheduler.
+
+Fetches the pages of a user's timelines in order of value: the first page of
+every timeline, then the second, and so on, since the newest tweets matter
+most to the ranking. Before any call is made the token's budget (see
+ratelimit.py) decides how many of those pages to fetch. Pages beyond the
+budget are skipped, and while the token is low on calls only the first
+LOW_BUDGET_PAGES of each timeline are fetched, leaving the rest of the hour's
+calls for later refreshes. The pages that are fetched are requested
+concurrently with make_async_request.
+
+Every response's rate limit headers are fed back into the RateLimits, so
+later fetches (on any instance, if the limits are backed by a store) see the
+limit coming instead of running into it.
+
+A fetch gets an overall deadline (FETCH_DEADLINE in config.py, or DEADLINE
+seconds) rather than a fixed one per call. While it lasts, pages that fail
+with a 5xx or a fetch error are retried after a jittered backoff, and a page
+that's been in flight longer than the p95 latency of its timeline gets a
+hedged duplicate request, whichever comes back first wins. Retries and
+hedges only spend calls the rate limit budget has to spare. When the
+deadline passes, the fetch ends with whatever pages arrived in time.
+
+The App Engine runtime can block until the first of several RPCs finishes
+but not with a timeout, so while a hedge or retry is due the scheduler polls
+the RPCs' states instead (see wait_any()).
+"""
+
+from __future__ import with_statement
+
+import time
+import random
+import logging
+
+try:
+  from google.appengine.api import urlfetch
+  from google.appengine.api import apiproxy_rpc
+  FETCH_ERRORS = (urlfetch.Error,)
+  FINISHING = apiproxy_rpc.RPC.FINISHING
+except ImportError:
+  FETCH_ERRORS = (IOError,)
+  FINISHING = None
+
+import metrics
+
+from instrumentation import NULL_TIMER
+
+# Pages per timeline fetched while a token has less than a tenth of its hourly calls left
+
+LOW_BUDGET_PAGES = 1
+
+# Overall seconds a fetch may take, unless config.py sets FETCH_DEADLINE. That's read when a
+# FetchScheduler is made rather than by bootstrap.py, since importing this module loads urlfetch,
+# which /data (and so bootstrap.py) shouldn't have to
+
+DEADLINE = 8.0
+
+# Attempts per page (the first try plus retries), and the backoff before the nth retry, which
+# is drawn uniformly from 0 to RETRY_BACKOFF * 2**n seconds
+
+MAX_ATTEMPTS = 3
+RETRY_BACKOFF = 0.25
+
+# Page latencies (seconds) remembered per timeline, and how many are needed before hedging
+
+LATENCY_SAMPLES = 100
+MIN_SAMPLES = 20
+
+# Seconds between checks of the RPCs' states while waiting with a timeout
+
+POLL_INTERVAL = 0.005
+
+_latencies = {}
+
+
+def configured_deadline():
+  """Returns FETCH_DEADLINE from config.py, or DEADLINE if it has none."""
+
+  try:
+    import config
+  except ImportError:
+    return DEADLINE
+
+  return getattr(config, 'FETCH_DEADLINE', DEADLINE)
+
+
+def plan(urls, num_pages):
+  """Returns the (name, url, page) tuples for num_pages pages of each of urls
+  (a dict of timeline name -> url), most valuable first."""
+
+  names = sorted(urls)
+  return [(name, urls[name], page) for page in range(1, num_pages+1) for name in names]
+
+
+def observe(name, latency):
+  samples = _latencies.setdefault(name, [])
+  samples.append(latency)
+  if len(samples) > LATENCY_SAMPLES:
+    del samples[0]
+
+
+def p95(name):
+  """Returns the p95 latency of name's pages, or None if too few are known."""
+
+  samples = _latencies.get(name)
+  if not samples or len(samples) < MIN_SAMPLES:
+    return None
+
+  samples = sorted(samples)
+  return samples[int(0.95 * (len(samples) - 1))]
+
+
+def finished(rpc):
+  """True if rpc's result is in (so get_result() won't block)."""
+
+  done = getattr(rpc, 'done', None)
+  if done is not None:
+    return done()
+
+  return FINISHING is not None and getattr(rpc, 'state', None) == FINISHING
+
+
+def wait_any(rpcs, timeout=None):
+  """Wait Any.
+
+  Returns one of rpcs that has finished, waiting up to timeout seconds (or,
+  if timeout is None, as long as it takes) for the first to. Returns None if
+  the timeout passes first.
+  """
+
+  if timeout is None:
+
+    # UserRPC.wait_any needs a recent SDK; older ones just wait in order
+
+    wait = getattr(type(rpcs[0]), 'wait_any', None)
+    if wait is None:
+      return rpcs[0]
+    return wait(rpcs)
+
+  end = time.time() + timeout
+  while True:
+    for rpc in rpcs:
+      if finished(rpc):
+        return rpc
+
+    remaining = end - time.time()
+    if remaining <= 0:
+      return None
+    time.sleep(min(POLL_INTERVAL, remaining))
+
+
+class FetchScheduler(object):
+
+  def __init__(self, client, limits, timer=NULL_TIMER, deadline=None):
+    self.client = client
+    self.limits = limits
+    self.timer = timer
+    self.deadline = deadline or configured_deadline()
+
+  def budget(self, token, pages):
+    """Returns the prefix of pages (as planned by plan()) to fetch now, and
+    how many more calls the budget allows (None if there's no known limit)."""
+
+    if self.limits.low(token):
+      pages = [p for p in pages if p[2] <= LOW_BUDGET_PAGES]
+
+    budget = self.limits.budget(token)
+    if budget is None:
+      return pages, None
+
+    return pages[:budget], max(budget - len(pages), 0)
+
+  def fetch(self, urls, token, secret, num_pages):
+    """Fetch.
+
+    Fetches up to num_pages pages of each of urls and yields the (name,
+    page, content) of each page that comes back with a 200, as it arrives.
+    Each request's latency, from when it was issued until it was first seen
+    to have finished, is recorded as a "fetch:<name>" span on the timer (so
+    concurrent requests' spans overlap), and the time spent blocked waiting
+    for them as "wait".
+    """
+
+    planned = plan(urls, num_pages)
+    pages, spare = self.budget(token, planned)
+
+    skipped = len(planned) - len(pages)
+    if skipped:
+      metrics.incr("scheduler.skipped", skipped)
+      logging.warning("Rate limit budget allows %d of %d pages; skipping the rest" % (len(pages), len(planned)))
+
+    stop = time.time() + self.deadline
+
+    inflight = {} # rpc -> (page, time issued, hedge?)
+    completed = {} # rpc -> time first seen finished
+    attempts = {}
+    hedged = set()
+    retries = [] # (time due, page)
+    done = set()
+
+    def issue(page, hedge=False):
+      name, url, number = page
+      rpc = self.client.make_async_request(url=url, token=token, secret=secret, additional_params={'page' : number},
+                                           deadline=max(stop - time.time(), 0.1))
+      inflight[rpc] = (page, time.time(), hedge)
+      attempts[page] = attempts.get(page, 0) + 1
+
+    for page in pages:
+      issue(page)
+
+    try:
+      while inflight or retries:
+        now = time.time()
+        if now >= stop:
+          break
+
+        # Pages are yielded one at a time and the caller processes each before asking for the
+        # next, so note when each RPC finished rather than time it to when it's processed
+
+        for rpc in inflight:
+          if rpc not in completed and finished(rpc):
+            completed[rpc] = now
+
+        # Send the retries that are due and hedge pages that have been out for longer than their
+        # timeline's p95, as long as the rate limit budget can spare the calls
+
+        for due, page in sorted(retries):
+          if due <= now and (spare is None or spare > 0):
+            retries.remove((due, page))
+            issue(page)
+            metrics.incr("scheduler.retries")
+            if spare is not None:
+              spare -= 1
+
+        # Meanwhile, note when the next hedge or retry will be due so the wait can end then. The
+        # budget only shrinks, so once it's spent no retry can be sent and none is waited for
+
+        if spare is not None and spare <= 0:
+          wake = []
+        else:
+          wake = [due for (due, page) in retries]
+
+        for rpc, (page, issued, hedge) in inflight.items():
+          if page in hedged or (spare is not None and spare <= 0):
+            continue
+          threshold = p95(page[0])
+          if threshold is None:
+            continue
+          if now - issued <= threshold:
+            wake.append(issued + threshold)
+          elif not finished(rpc):
+            hedged.add(page)
+            issue(page, hedge=True)
+            metrics.incr("scheduler.hedges")
+            if spare is not None:
+              spare -= 1
+
+        if not inflight:
+          if spare is not None and spare <= 0:
+            break
+          with self.timer.span("wait"):
+            time.sleep(max(min(min(wake), stop) - now, 0))
+          continue
+
+        # Wait until the next hedge or retry is due (or the deadline), which may be right away
+
+        if wake:
+          timeout = max(min(min(wake), stop) - time.time(), 0)
+        else:
+          timeout = None
+
+        with self.timer.span("wait"):
+          rpc = wait_any(inflight.keys(), timeout)
+        if rpc is None:
+          continue
+
+        page, issued, hedge = inflight.pop(rpc)
+        name, url, number = page
+
+        try:
+          response = rpc.get_result()
+        except FETCH_ERRORS, e:
+          response = None
+          metrics.incr("upstream.error")
+          logging.warning("Fetching page %d of %s failed: %s" % (number, url, e))
+
+        if page in done:
+          continue
+
+        latency = completed.pop(rpc, time.time()) - issued
+        self.timer.record("fetch:" + name, latency)
+
+        if response is not None:
+          self.limits.update(token, response)
+
+        if response is not None and response.status_code == 200:
+          observe(name, latency)
+          done.add(page)
+          if hedge:
+            metrics.incr("scheduler.hedge_wins")
+
+          # The other copy of a hedged page is no longer needed
+
+          for other, (other_page, other_issued, other_hedge) in inflight.items():
+            if other_page == page:
+              del inflight[other]
+
+          yield name, number, response.content
+          continue
+
+        if response is not None:
+          metrics.incr("upstream.non200.%d" % response.status_code)
+          logging.error("Expected 200 response but received %d for page %d of %s" % (response.status_code, number, url))
+
+        # Retry 5xx and fetch errors (not e.g. rate limited calls), unless a hedge is still out
+
+        retryable = response is None or response.status_code >= 500
+        if retryable and attempts[page] < MAX_ATTEMPTS and page not in [p for (p, i, h) in inflight.values()]:
+          retries.append((time.time() + random.uniform(0, RETRY_BACKOFF * 2 ** attempts[page]), page))
+    finally:
+      self.limits.save()
+
+      lost = len(pages) - len(done)
+      if lost:
+        metrics.incr("scheduler.lost", lost)
+        logging.warning("%d of %d pages didn't arrive within the %.1fs deadline or failed" % (lost, len(pages), self.deadline))
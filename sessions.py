@@ -0,0 +1,21 @@
+"""Sessions.
+
+Look up the user_info stashed in memcache for a session id (see login() in
+main.py), keeping track of hits and misses. Sessions are read and written
+through cache.py so that a warm instance doesn't need an RPC.
+"""
+
+import cache
+import metrics
+
+SESSION_TTL = 60*10 # seconds
+
+
+def get_session(sid):
+  user_info = cache.get(sid, ttl=SESSION_TTL)
+  if user_info is None:
+    metrics.incr("memcache.sid.miss")
+  else:
+    metrics.incr("memcache.sid.hit")
+
+  return user_info
@@ -0,0 +1,148 @@
+"""Single Flight.
+
+Coalesces concurrent calls that would do the same work, e.g. a double-tapped
+login or two tabs opened at once, so that the work runs once. The first
+caller for a key takes a lease with memcache's add() (which only one caller
+can win) and runs the work; its result is stashed for the others, which poll
+for it instead of repeating the work. A result is also reused by callers
+that arrive within a window of seconds after it was stashed.
+
+Leases expire, so a leader that dies only holds its followers up until then;
+a follower that sees the lease gone without a result does the work itself.
+If add() fails without anyone holding the lease (memcache is unavailable),
+the caller does the work straight away rather than wait for a leader that
+doesn't exist.
+
+  flights = SingleFlight()
+  outcome = flights.do("login_" + username, lambda: login(user_info), window=30)
+"""
+
+import time
+import random
+
+try:
+  from google.appengine.api import memcache
+except ImportError:
+  memcache = None
+
+import metrics
+
+LEASE_KEY = "flight_lease_%s"
+RESULT_KEY = "flight_result_%s"
+
+# Results are kept at least this many seconds, so followers polling for them can't miss them
+
+MIN_RESULT_TTL = 5
+
+_now = time.time
+
+
+class LocalStore(object):
+  """Local stand-in for the memcache calls a SingleFlight makes, for the
+  bench and for running without App Engine."""
+
+  def __init__(self):
+    self.data = {}
+
+  def get(self, key):
+    entry = self.data.get(key)
+    if entry is None:
+      return None
+    value, expires = entry
+    if expires and expires < _now():
+      del self.data[key]
+      return None
+    return value
+
+  def set(self, key, value, time=0):
+    self.data[key] = (value, time and _now() + time or 0)
+    return True
+
+  def add(self, key, value, time=0):
+    if self.get(key) is not None:
+      return False
+    return self.set(key, value, time)
+
+  def delete(self, key):
+    self.data.pop(key, None)
+    return 2
+
+
+class SingleFlight(object):
+
+  def __init__(self, store=None, lease_ttl=30, wait=None, poll_interval=0.1):
+    """Constructor.
+
+    store defaults to memcache (or a LocalStore without App Engine).
+    lease_ttl bounds how long a leader can hold its followers up and wait
+    how long a follower polls for the leader's result before giving up and
+    doing the work itself, by default as long as the lease lasts.
+    """
+
+    if store is None:
+      store = memcache or LocalStore()
+
+    self.store = store
+    self.lease_ttl = lease_ttl
+    self.wait = wait is None and lease_ttl or wait
+    self.poll_interval = poll_interval
+
+  def do(self, key, fn, window=0):
+    """Do.
+
+    Returns fn()'s result, running fn only if no other caller is running it
+    for key and no result for key was stashed within the last window
+    seconds. fn's result must be picklable, and isn't shared if it's None.
+    """
+
+    result = self.store.get(RESULT_KEY % key)
+    if result is not None:
+      metrics.incr("singleflight.reused")
+      return result
+
+    lease = "%x" % random.getrandbits(64)
+    if self.store.add(LEASE_KEY % key, lease, time=self.lease_ttl):
+      try:
+        result = fn()
+        if result is not None:
+          self.store.set(RESULT_KEY % key, result, time=max(int(window), MIN_RESULT_TTL))
+        return result
+      finally:
+        if self.store.get(LEASE_KEY % key) == lease:
+          self.store.delete(LEASE_KEY % key)
+
+    # add() also fails when memcache does. Then no one holds the lease and no result is coming
+
+    if self.store.get(LEASE_KEY % key) is None:
+      result = self.store.get(RESULT_KEY % key)
+      if result is not None:
+        metrics.incr("singleflight.reused")
+        return result
+
+      metrics.incr("singleflight.unleased")
+      return fn()
+
+    # Someone else is doing the work; wait for their result
+
+    metrics.incr("singleflight.followed")
+
+    end = time.time() + self.wait
+    while time.time() < end:
+      time.sleep(self.poll_interval)
+
+      result = self.store.get(RESULT_KEY % key)
+      if result is not None:
+        metrics.incr("singleflight.reused")
+        return result
+
+      if self.store.get(LEASE_KEY % key) is None:
+        result = self.store.get(RESULT_KEY % key)
+        if result is not None:
+          metrics.incr("singleflight.reused")
+          return result
+        break
+
+    # The leader gave up (or is taking too long), so do the work after all
+
+    metrics.incr("singleflight.fallback")
+    return fn()
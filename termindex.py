@@ -0,0 +1,148 @@
+"""Term Index.
+
+A compact inverted index over a user's ranked tweets, built when they're
+ranked (see refresh.py) and cached alongside them, so that /data can answer
+"tweets about X" queries without rescanning the tweets' text.
+
+Term ids are the positions of the terms in the sorted term table; each term
+id maps to a sorted posting array of the positions of the tweets containing
+it in the ranked (packed) list. Layout (little endian):
+
+  header    magic "TI", version, flags, language length, term count, term
+            table byte length, posting count
+  language  the normalize.py language the terms were normalized for
+  terms     the utf-8 terms, sorted and separated by newlines (or, with
+            FLAG_HASHED, the sorted uint32 term hashes, see normalize.py)
+  offsets   term count + 1 uint32 offsets into the postings
+  postings  uint16 tweet positions (uint32 with FLAG_WIDE)
+
+TermIndex reads posting arrays straight out of the encoded str, so a query
+only costs a bisect and an unpack per term.
+"""
+
+import bisect
+import struct
+
+MAGIC = "TI"
+VERSION = 1
+
+# Postings are uint32 rather than uint16 (more than 65535 tweets)
+
+FLAG_WIDE = 1
+
+# Terms are hashed ints rather than strings
+
+FLAG_HASHED = 2
+
+_HEADER = struct.Struct('<2sBBBIII')
+
+
+class TermIndexError(Exception):
+  pass
+
+
+def encode(term_lists, language):
+  """Encode.
+
+  Returns the index of term_lists, where term_lists[i] holds the terms of
+  the tweet at position i, packed into a str.
+  """
+
+  postings = {}
+  for position, terms in enumerate(term_lists):
+    for term in set(terms):
+      postings.setdefault(term, []).append(position)
+
+  terms = sorted(postings)
+
+  offsets = [0]
+  positions = []
+  for term in terms:
+    positions.extend(postings[term])
+    offsets.append(len(positions))
+
+  flags = 0
+  fmt = 'H'
+  if len(term_lists) > 0xffff:
+    flags |= FLAG_WIDE
+    fmt = 'I'
+
+  language = (language or '').encode('utf-8')
+
+  if terms and not isinstance(terms[0], basestring):
+    flags |= FLAG_HASHED
+    table = struct.pack('<%dI' % len(terms), *terms)
+  else:
+    table = u'\n'.join(terms).encode('utf-8')
+
+  return ''.join([
+    _HEADER.pack(MAGIC, VERSION, flags, len(language), len(terms), len(table), len(positions)),
+    language,
+    table,
+    struct.pack('<%dI' % len(offsets), *offsets),
+    struct.pack('<%d%s' % (len(positions), fmt), *positions),
+  ])
+
+
+class TermIndex(object):
+  """A decoded (well, lazily decoded) index from encode()."""
+
+  def __init__(self, data):
+    try:
+      magic, version, flags, language_length, num_terms, table_length, num_postings = _HEADER.unpack_from(data)
+    except struct.error:
+      raise TermIndexError("Truncated header")
+
+    if magic != MAGIC or version != VERSION:
+      raise TermIndexError("Not a v%d term index" % VERSION)
+
+    offset = _HEADER.size
+    self.language = data[offset:offset+language_length].decode('utf-8') or None
+    offset += language_length
+
+    if flags & FLAG_HASHED:
+      self.terms = list(struct.unpack_from('<%dI' % num_terms, data, offset))
+    else:
+      table = data[offset:offset+table_length].decode('utf-8')
+      self.terms = num_terms and table.split(u'\n') or []
+    offset += table_length
+
+    self.data = data
+    self.offsets = offset
+    self.postings = offset + 4 * (num_terms + 1)
+    self.fmt, self.size = flags & FLAG_WIDE and ('I', 4) or ('H', 2)
+
+  def term_id(self, term):
+    """Returns the id of term, or None if no tweet contains it."""
+
+    i = bisect.bisect_left(self.terms, term)
+    if i < len(self.terms) and self.terms[i] == term:
+      return i
+
+    return None
+
+  def positions(self, term):
+    """Returns the sorted positions of the tweets that contain term."""
+
+    i = self.term_id(term)
+    if i is None:
+      return ()
+
+    start, end = struct.unpack_from('<2I', self.data, self.offsets + 4 * i)
+    return struct.unpack_from('<%d%s' % (end - start, self.fmt), self.data, self.postings + self.size * start)
+
+  def search(self, terms):
+    """Returns the sorted positions of the tweets that contain all of terms."""
+
+    if not terms:
+      return []
+
+    postings = sorted([self.positions(term) for term in set(terms)], key=len)
+
+    matches = set(postings[0])
+    for positions in postings[1:]:
+      if not matches:
+        break
+      matches.intersection_update(positions)
+
+    return sorted(matches)
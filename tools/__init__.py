@@ -0,0 +1,7 @@
+"""Offline tools.
+
+Operational commands that run outside of App Engine against captured or
+stored data. Run them from the project root, e.g.
+
+  python -m tools.rerank captures.jsonl --out ranked.jsonl
+"""
@@ -0,0 +1,198 @@
+"""Batch Re-rank.
+
+Re-ranks many users' timelines at once, e.g. after a change to the relevance
+algorithm, so users see the new ranking without waiting for their next login
+or the refresh cron job. Input is a capture dump in the bench.replay JSONL
+format (one object per line with "home_timeline", "favorites_timeline", a
+"username" and optionally a "language"). Lines are ranked in parallel with a
+multiprocessing pool using the same relevance code as refresh.py; each
+worker only sends back the small packed ranking, so the work scales with the
+number of cores.
+
+Rankings carry the same fingerprint as refresh.py's, so the next refresh of
+an unchanged timeline reuses them. The workers rank from the dump alone, with
+exact favorite term counts: with APPROXIMATE_TERM_COUNTS on, where the app
+ranks with each user's stored counts instead, they get no fingerprint, and
+the next refresh re-ranks.
+
+Results are written in batches either to a JSONL file (with the packed
+ranking and index base64 encoded) or, with --remote, straight into the
+app's memcache through remote_api (which needs the App Engine SDK on the
+path and "remote_api: on" in app.yaml's builtins). Like the app, it reads its
+settings from config.py.
+
+  python -m tools.rerank captures.jsonl --out ranked.jsonl -p 8
+  python -m tools.rerank captures.jsonl --remote tweet-relevance.appspot.com
+"""
+
+import sys
+import time
+import base64
+import getpass
+import logging
+import optparse
+import itertools
+import multiprocessing
+
+try:
+  import json
+except ImportError:
+  from django.utils import simplejson as json
+
+import bootstrap
+import topk
+import relevance
+
+
+def rank_line(line):
+  """Ranks the capture on a line of the dump.
+
+  Returns a (username, ranked entry, error) tuple, with error set (and the
+  ranked entry None) if the line couldn't be ranked.
+  """
+
+  try:
+    capture = json.loads(line)
+    username = capture['username']
+    language = capture.get('language')
+
+    home = relevance.tokenize_statuses(capture['home_timeline'], language)
+    favorites = relevance.tokenize_statuses(capture['favorites_timeline'], language)
+
+    fingerprint = None
+    if not topk.ENABLED:
+      fingerprint = relevance.fingerprint(home, favorites, language)
+
+    relevant_tweets, top_n_terms = relevance.rank(home, favorites)
+    return username, relevance.ranked_entry(relevant_tweets, home, language, fingerprint=fingerprint), None
+  except Exception, e:
+    return None, None, "%s: %s" % (e.__class__.__name__, e)
+
+
+def read_lines(path):
+  for line in open(path):
+    if line.strip():
+      yield line
+
+
+class FileWriter(object):
+  """Writes rankings to a JSONL file."""
+
+  def __init__(self, path):
+    self.out = path == '-' and sys.stdout or open(path, 'w')
+
+  def write(self, rankings):
+    """Returns the usernames that couldn't be written: none."""
+
+    lines = []
+    for username, ranked in rankings.items():
+      lines.append(json.dumps({'username' : username, 'version' : ranked['version'],
+                               'updated' : ranked['updated'],
+                               'packed' : base64.b64encode(ranked['packed']),
+                               'index' : base64.b64encode(ranked['index'])}) + "\n")
+    self.out.write(''.join(lines))
+    return []
+
+  def close(self):
+    self.out.flush()
+
+
+class RemoteWriter(object):
+  """Writes rankings to the app's memcache through remote_api."""
+
+  def __init__(self, host):
+    from google.appengine.ext.remote_api import remote_api_stub
+
+    def auth():
+      return raw_input("Email: "), getpass.getpass("Password: ")
+
+    remote_api_stub.ConfigureRemoteApi(None, '/_ah/remote_api', auth, host)
+
+    # Imported here because refresh needs the App Engine APIs that remote_api just set up
+
+    import refresh
+    self.refresh = refresh
+
+  def write(self, rankings):
+    """Returns the usernames whose rankings couldn't be set."""
+
+    return self.refresh.store_many(rankings)
+
+  def close(self):
+    pass
+
+
+def rerank(lines, writer, processes=None, batch_size=100, chunk_size=4):
+  """Rerank.
+
+  Ranks every line in lines with a pool of processes (one per core by
+  default) and writes the results with writer, batch_size users at a time.
+  Returns a (ranked, failed) tuple of counts of users.
+  """
+
+  if processes == 1:
+    pool = None
+    results = itertools.imap(rank_line, lines)
+  else:
+    pool = multiprocessing.Pool(processes)
+    results = pool.imap_unordered(rank_line, lines, chunk_size)
+
+  ranked = failed = 0
+  batch = {}
+
+  try:
+    for username, entry, error in results:
+      if error is not None:
+        failed += 1
+        logging.error("Couldn't rank a capture: %s" % error)
+        continue
+
+      batch[username] = entry
+      if len(batch) >= batch_size:
+        unwritten = len(writer.write(batch))
+        failed += unwritten
+        ranked += len(batch) - unwritten
+        batch = {}
+
+    if batch:
+      unwritten = len(writer.write(batch))
+      failed += unwritten
+      ranked += len(batch) - unwritten
+  finally:
+    if pool is not None:
+      pool.close()
+      pool.join()
+    writer.close()
+
+  return ranked, failed
+
+
+def main(argv=None):
+  parser = optparse.OptionParser(usage="%prog [options] captures.jsonl")
+  parser.add_option("-p", "--processes", type="int", default=None,
+                    help="worker processes (default: one per core)")
+  parser.add_option("--batch", type="int", default=100,
+                    help="users per bulk write")
+  parser.add_option("--out", help="write rankings to this JSONL file ('-' for stdout)")
+  parser.add_option("--remote", help="write rankings to this app's memcache via remote_api")
+  options, args = parser.parse_args(argv)
+
+  if len(args) != 1 or bool(options.out) == bool(options.remote):
+    parser.error("give a captures file and exactly one of --out or --remote")
+
+  if options.remote:
+    writer = RemoteWriter(options.remote)
+  else:
+    writer = FileWriter(options.out)
+
+  start = time.time()
+  ranked, failed = rerank(read_lines(args[0]), writer, options.processes, options.batch)
+  elapsed = time.time() - start
+
+  sys.stderr.write("%d users ranked, %d failed in %.2fs (%.1f users/sec, %d processes)\n" % (ranked,
+                   failed, elapsed, elapsed and ranked / elapsed or 0.0,
+                   options.processes or multiprocessing.cpu_count()))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,209 @@
+"""Approximate Top-K.
+
+An alternative to counting every term of the favorites exactly (see
+relevance.top_terms), for when the favorites go back further than a
+frequency map of their whole vocabulary should: SpaceSaving keeps counts for
+at most capacity terms, so its memory and its encoded state (see encode())
+stay the same size however many terms are counted.
+
+Space-Saving (Metwally et al., "Efficient Computation of Frequent and Top-k
+Elements in Data Streams") counts the terms it's tracking exactly. A term
+that isn't tracked while all capacity slots are taken replaces the tracked
+term with the smallest count, inheriting that count (which is recorded as
+the new term's error). So a count is at most its error over the true count,
+never under it, every term with a true count over total / capacity is
+tracked, and with a skewed distribution like that of words the top terms
+come out right as long as capacity is around ten times the number wanted
+(see bench/counting.py).
+
+Terms with equal counts are kept together in buckets (the "stream summary"),
+so counting an occurrence of a term is O(1).
+
+Layout of an encoded state (little endian):
+
+  header    magic "SS", version, flags, capacity, term count, total count,
+            term table byte length
+  terms     the utf-8 terms, separated by newlines (or, with FLAG_HASHED,
+            uint32 term hashes, see normalize.py)
+  counts    term count uint32 counts
+  errors    term count uint32 errors
+"""
+
+import struct
+
+MAGIC = "SS"
+VERSION = 2
+
+# Terms are hashed ints rather than strings
+
+FLAG_HASHED = 1
+
+_HEADER = struct.Struct('<2sBBIIQI')
+
+# Set via configure(), normally from APPROXIMATE_TERM_COUNTS and TERM_COUNT_CAPACITY in config.py
+
+ENABLED = False
+CAPACITY = 2000
+
+
+class TopKError(Exception):
+  pass
+
+
+def configure(enabled=False, capacity=CAPACITY):
+  global ENABLED, CAPACITY
+
+  ENABLED = enabled
+  CAPACITY = capacity
+
+
+class SpaceSaving(object):
+
+  def __init__(self, capacity=None):
+    self.capacity = capacity or CAPACITY
+    self.total = 0
+    self.counts = {} # term -> count
+    self.errors = {} # term -> overestimate it may carry
+    self.buckets = {} # count -> set of terms
+    self.min_count = 0
+
+  def __len__(self):
+    return len(self.counts)
+
+  def _move(self, term, old, new):
+    if old:
+      bucket = self.buckets[old]
+      bucket.discard(term)
+      if not bucket:
+        del self.buckets[old]
+
+    self.buckets.setdefault(new, set()).add(term)
+    self.counts[term] = new
+
+    # Every other term counts at least the old minimum, so once its bucket is empty the next
+    # bucket up (there is one after a unit increment) holds the new minimum
+
+    floor = self.min_count
+    if not floor or new < floor:
+      self.min_count = new
+    elif floor not in self.buckets:
+      self.min_count = floor + 1 in self.buckets and floor + 1 or min(self.buckets)
+
+  def add(self, term, count=1):
+    """Counts count more occurrences of term."""
+
+    self.total += count
+
+    old = self.counts.get(term)
+    if old is not None:
+      self._move(term, old, old + count)
+      return
+
+    if len(self.counts) < self.capacity:
+      self.errors[term] = 0
+      self._move(term, 0, count)
+      return
+
+    # Full: the new term takes over a slot with the smallest count
+
+    floor = self.min_count
+    evicted = self.buckets[floor].pop()
+    if not self.buckets[floor]:
+      del self.buckets[floor]
+    del self.counts[evicted]
+    del self.errors[evicted]
+
+    self.errors[term] = floor
+    self._move(term, 0, floor + count)
+
+  def update(self, term_lists, batch_size=100):
+    """Update.
+
+    Counts every term in term_lists (an iterable of lists of terms). The
+    terms of each batch_size lists are tallied exactly first and added with
+    their tallies, which is both faster and (since a batch's terms are
+    counted exactly) no less accurate than adding them one at a time.
+    """
+
+    add = self.add
+    tally = {}
+    for i, terms in enumerate(term_lists):
+      for term in terms:
+        tally[term] = tally.get(term, 0) + 1
+
+      if (i + 1) % batch_size == 0:
+        for term, count in tally.iteritems():
+          add(term, count)
+        tally.clear()
+
+    for term, count in tally.iteritems():
+      add(term, count)
+
+  def top(self, n):
+    """Returns the (term, count, error) of the n terms with the highest
+    counts, highest first."""
+
+    ranked = sorted(self.counts.iteritems(), key=lambda (term, count): (-count, term))[:n]
+    return [(term, count, self.errors[term]) for (term, count) in ranked]
+
+  def guaranteed(self, n):
+    """Returns the terms among the top n whose counts (less their errors)
+    guarantee that they belong there."""
+
+    top = self.top(n + 1)
+    if len(top) <= n:
+      return [term for (term, count, error) in top]
+
+    threshold = top[n][1]
+    return [term for (term, count, error) in top[:n] if count - error >= threshold]
+
+  def encode(self):
+    """Returns the counter's state packed into a str (see decode())."""
+
+    terms = self.counts.keys()
+
+    flags = 0
+    if terms and not isinstance(terms[0], basestring):
+      flags |= FLAG_HASHED
+      table = struct.pack('<%dI' % len(terms), *terms)
+    else:
+      table = u'\n'.join(terms).encode('utf-8')
+
+    return ''.join([
+      _HEADER.pack(MAGIC, VERSION, flags, self.capacity, len(terms), self.total, len(table)),
+      table,
+      struct.pack('<%dI' % len(terms), *[self.counts[term] for term in terms]),
+      struct.pack('<%dI' % len(terms), *[self.errors[term] for term in terms]),
+    ])
+
+
+def decode(data):
+  """Returns the SpaceSaving whose state encode() packed into data."""
+
+  try:
+    magic, version, flags, capacity, n, total, table_length = _HEADER.unpack_from(data)
+  except struct.error:
+    raise TopKError("Truncated header")
+
+  if magic != MAGIC or version != VERSION:
+    raise TopKError("Not a v%d Space-Saving state" % VERSION)
+
+  offset = _HEADER.size
+  if flags & FLAG_HASHED:
+    terms = struct.unpack_from('<%dI' % n, data, offset)
+  else:
+    terms = n and data[offset:offset+table_length].decode('utf-8').split(u'\n') or []
+  offset += table_length
+
+  counts = struct.unpack_from('<%dI' % n, data, offset)
+  errors = struct.unpack_from('<%dI' % n, data, offset + 4 * n)
+
+  counter = SpaceSaving(capacity)
+  counter.total = total
+  for term, count, error in zip(terms, counts, errors):
+    counter.counts[term] = count
+    counter.errors[term] = error
+    counter.buckets.setdefault(count, set()).add(term)
+  counter.min_count = counter.buckets and min(counter.buckets) or 0
+
+  return counter
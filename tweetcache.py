@@ -0,0 +1,65 @@
+"""Tweet Cache.
+
+Many users follow the same accounts, so the same statuses show up in many
+users' timelines. TweetCache keeps the tokenized terms and a projection of
+the fields the client actually uses for each status, keyed by tweet id (and
+by the normalization pipeline the terms came from, see normalize.py), so a
+status is tokenized once per instance rather than once per user.
+
+The projected dicts are shared between users, so callers must copy one
+before adding anything user-specific (like a relevance score) to it.
+"""
+
+import metrics
+
+from lru import LRUCache
+
+# The fields of a status (and of its user) that TweetView displays
+
+FIELDS = ('id', 'id_str', 'text', 'created_at', 'from_user', 'profile_image_url')
+USER_FIELDS = ('screen_name', 'name', 'profile_image_url')
+
+
+def project(status):
+  """Returns a slim copy of status with only FIELDS and USER_FIELDS."""
+
+  slim = {}
+  for field in FIELDS:
+    if field in status:
+      slim[field] = status[field]
+
+  user = status.get('user')
+  if user is not None:
+    slim['user'] = dict([(field, user.get(field)) for field in USER_FIELDS])
+
+  # The id of the status a retweet retweets, so that retweets of the same status can be
+  # collapsed (see dedup.py). Only used server side; packing.py doesn't keep it
+
+  retweeted = status.get('retweeted_status')
+  if retweeted is not None and retweeted.get('id') is not None:
+    slim['retweeted_id'] = retweeted['id']
+
+  return slim
+
+
+class TweetCache(object):
+
+  def __init__(self, capacity=20000, ttl=60*60):
+    self.cache = LRUCache(capacity, ttl)
+
+  def lookup(self, status, normalizer):
+    """Returns a (terms, projected status) tuple for status, with the terms
+    produced by normalizer (a normalize.Normalizer)."""
+
+    key = (normalizer.name, status.get('id'))
+    entry = self.cache.get(key)
+
+    if entry is None:
+      metrics.incr("tweetcache.miss")
+      entry = (tuple(normalizer(status['text'])), project(status))
+      if key[1] is not None:
+        self.cache.set(key, entry)
+    else:
+      metrics.incr("tweetcache.hit")
+
+    return entry
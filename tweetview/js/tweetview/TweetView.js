@@ -20,7 +20,11 @@ dojo.declare("tweetview.TweetView", [dojox.mobile.ScrollableView, tweetview._Vie
 	'<div class="tweetviewContent"> ' +
 		'<div class="tweetviewUser">${user}</div>' + 
 		'<div class="tweetviewText">${text}</div>' + 
+		'${collapsed}' +
 	'</div><div class="tweetviewClear"></div>',
+
+	// Shown under a tweet that retweets or near-duplicates of it were collapsed into
+	collapsedTemplateString: '<div class="tweetviewCollapsed">+${count} similar</div>',
 	
 	// Icon for loading...
 	iconLoading: dojo.moduleUrl("tweetview", "resources/images/loading.gif"),
@@ -29,6 +33,27 @@ dojo.declare("tweetview.TweetView", [dojox.mobile.ScrollableView, tweetview._Vie
 	// URL to pull tweets from
 	serviceUrl: "",
 
+	// URL of the user's settings (see SettingsHandler in main.py)
+	settingsUrl: "/settings",
+
+	// How often (and how many times) to check back while /data says fresher results are coming
+	staleRetryDelay: 2000,
+	maxStaleRetries: 10,
+	staleRetries: 0,
+
+	// How many list items to render per animation frame, and how many tweets to render
+	// initially / each time the user scrolls near the end of the list
+	renderChunkSize: 20,
+	renderPageSize: 50,
+	renderLimit: 50,
+
+	// localStorage key prefix for the last ranked payload of each user (and, under
+	// storageKey + "lastUser", the user it was for)
+	storageKey: "tweetview.ranked.",
+
+	// The session's sid, from the page's ?sid=
+	sid: null,
+
 	// When the widgets have started....
 	startup: function() {
 
@@ -50,6 +75,15 @@ dojo.declare("tweetview.TweetView", [dojox.mobile.ScrollableView, tweetview._Vie
 		
 		// Hide the list because it's not populated with list items yet
 		this.showListNode(false);
+
+		// List items by tweet id, recycled list items, and a counter used to abandon stale renders
+		this._items = {};
+		this._itemPool = [];
+		this._renderToken = 0;
+
+		// Render more tweets as the user scrolls towards the end of the list
+		dojo.connect(this, "onTouchEnd", this, "_onScroll");
+		dojo.connect(this, "onFlickAnimationEnd", this, "_onScroll");
 		
 		// Get localization for tweet times
 		// Get the i18n
@@ -63,8 +97,68 @@ dojo.declare("tweetview.TweetView", [dojox.mobile.ScrollableView, tweetview._Vie
 			},this);
 		}),60000);
 
+        var uri = document.location.href;
+        this.sid = dojo.queryToObject(uri.substring(uri.indexOf("?") + 1, uri.length)).sid;
+
+        // Ask /data for what changed since whatever we stored last time. Only paint that right
+        // away if it was stored in this same session: on a shared device it may be another
+        // user's, and whose session this is isn't known until /data answers
+        this._stored = this.loadStored();
+        if(this._stored && this._stored.sid == this.sid) {
+            this.updateContent(this.sortTweets(this._stored.tweets));
+        }
+
         // Manually trigger initial loading of content by simulating a "refresh"
         this.refresh();
+
+        this.loadSettings();
+	},
+
+	// Fills the language picker with the languages there are stopword packs for, and switches
+	// the user's language when another one is picked
+	loadSettings: function() {
+		this.languageNode = this.getElements("tweetviewLanguage", this.domNode)[0];
+		if(!this.languageNode) {
+			return;
+		}
+
+		dojo.xhrGet({
+			url : this.settingsUrl,
+			content : {sid : this.sid},
+			handleAs : "json",
+			load : dojo.hitch(this, function(settings) {
+				// Empty means whatever the user's Twitter account is set to
+				var languages = [""].concat(settings.languages);
+				this.languageNode.innerHTML = "";
+				dojo.forEach(languages, function(language) {
+					dojo.create("option", {value: language, innerHTML: language || "auto"}, this.languageNode);
+				}, this);
+				this.languageNode.value = settings.language || "";
+				return settings;
+			}),
+			error : function(error) {
+				console.error(error);
+				return error;
+			}
+		});
+
+		dojo.connect(this.languageNode, "onchange", this, function() {
+			dojo.xhrPost({
+				url : this.settingsUrl,
+				content : {sid : this.sid, language : this.languageNode.value},
+				handleAs : "json",
+				// The timeline is re-ranked in the background; /data says it's stale until then
+				load : dojo.hitch(this, function(settings) {
+					this.staleRetries = 0;
+					this.refresh();
+					return settings;
+				}),
+				error : function(error) {
+					console.error(error);
+					return error;
+				}
+			});
+		});
 	},
 	
 	// Contacts twitter to receive tweets
@@ -76,29 +170,28 @@ dojo.declare("tweetview.TweetView", [dojox.mobile.ScrollableView, tweetview._Vie
 		this.refreshButton.select();
 	
         // Use sid to fetch data computed during previous call to /app
-        var uri = document.location.href;
-        var query = uri.substring(uri.indexOf("?") + 1, uri.length);
-        var queryObject = dojo.queryToObject(query);
         var dataUrl = "/data";
 
         dojo.xhrGet({
             url : dataUrl,
-            content : {sid : queryObject.sid},
+            content : {sid : this.sid, since : this._stored && this._stored.version},
             handleAs : "json",
             load : dojo.hitch(this, function(response) {
                 // Set the refresh icon back
                 this.refreshButton.iconNode.src = this.iconImage;
                 this.refreshButton.select(true);
 
-                // Sort by date tweeted
-                response.sort(function(a, b) {
-                    var atime = new Date(a.created_at),
-                        btime = new Date(b.created_at);
-                    console.log(atime - btime);
-                    return atime - btime;
-                });
+                var tweets = this.applyResponse(response);
+
+                this.updateContent(this.sortTweets(tweets));
 
-                this.updateContent(response);
+                // The server is still ranking in the background; check back shortly
+                if(response.stale && this.staleRetries < this.maxStaleRetries) {
+                    this.staleRetries++;
+                    setTimeout(dojo.hitch(this, "refresh"), this.staleRetryDelay);
+                } else {
+                    this.staleRetries = 0;
+                }
 
                 return response
             }),
@@ -109,32 +202,204 @@ dojo.declare("tweetview.TweetView", [dojox.mobile.ScrollableView, tweetview._Vie
         });
 	},
 	
-	// Fires when tweets are received from the controller
+	// Sort by date tweeted, newest first (parsing each date only once)
+	sortTweets: function(tweets) {
+		dojo.forEach(tweets, function(tweet) {
+			tweet._time = new Date(tweet.created_at).getTime();
+		});
+		return tweets.sort(function(a, b) {
+			return b._time - a._time;
+		});
+	},
+
+	// Returns the tweets a /data response describes: either all of them, or the changes
+	// since the version we stored. Stores the result for the next time the app opens.
+	applyResponse: function(response) {
+		var stored = this._stored, tweets;
+
+		if(response.full || !stored || stored.user != response.user || stored.version != response.since) {
+			tweets = response.tweets;
+		} else {
+			var removed = {};
+			dojo.forEach(response.removed, function(id) {
+				removed[id] = true;
+			});
+			tweets = dojo.filter(stored.tweets, function(tweet) {
+				return !removed[tweet.id_str];
+			});
+			dojo.forEach(tweets, function(tweet) {
+				if(tweet.id_str in response.rescored) {
+					tweet.relevance = response.rescored[tweet.id_str];
+				}
+			});
+			tweets = tweets.concat(response.added);
+		}
+
+		if(response.version) {
+			this._stored = {user: response.user, sid: this.sid, version: response.version, tweets: tweets};
+			this.saveStored(this._stored);
+		}
+
+		return tweets;
+	},
+
+	// Returns the last stored payload ({user, sid, version, tweets}), if any
+	loadStored: function() {
+		try {
+			var user = window.localStorage.getItem(this.storageKey + "lastUser");
+			return user ? dojo.fromJson(window.localStorage.getItem(this.storageKey + user)) : null;
+		} catch(e) {
+			// No localStorage (or a corrupt entry): start from scratch
+			return null;
+		}
+	},
+
+	saveStored: function(stored) {
+		try {
+			window.localStorage.setItem(this.storageKey + stored.user, dojo.toJson(stored));
+			window.localStorage.setItem(this.storageKey + "lastUser", stored.user);
+		} catch(e) {
+			// Out of quota or private browsing; we'll just fetch everything next time
+		}
+	},
+
+	// Fires when tweets are received from the controller. Tweets arrive newest first.
+	// List items are kept across refreshes (keyed by tweet id), so only new or changed
+	// tweets are rendered; items for tweets that dropped out are recycled. Rendering
+	// happens in chunks of renderChunkSize per animation frame so the UI stays responsive,
+	// and only the first renderLimit tweets get list items until the user scrolls down.
 	updateContent: function(rawTweetData) {
-		// For every tweet received....
+		// Any render still in progress is for stale data
+		var token = ++this._renderToken;
+
+		this._tweets = rawTweetData;
+
+		// Release the items of tweets that are no longer in the list
+		var wanted = {};
 		dojo.forEach(rawTweetData, function(tweet) {
-			// Get the user's screen name
-			var screenName = tweet.user.screen_name;
-			
-			// Create a new list item, inject into list
-			var item = new dojox.mobile.ListItem({
-				"class": "tweetviewListItem user-" + screenName
-			}).placeAt(this.listNode,"first");
-			
-			// Update the list item's content using our template for tweets
-			item.containerNode.innerHTML = this.substitute(this.tweetTemplateString, {
-				text: this.formatTweet(tweet.text),
-				user: tweet.from_user || screenName,
-				name: tweet.from_user || tweet.user.name,
-				avatar: tweet.profile_image_url || tweet.user.profile_image_url,
-				time: this.formatTime(tweet.created_at),
-				created_at: tweet.created_at,
-				id: tweet.id
-			});
-		}, this);
-        
+			wanted[tweet.id_str || tweet.id] = true;
+		});
+		for(var id in this._items) {
+			if(!wanted[id]) {
+				this._releaseItem(this._items[id]);
+				delete this._items[id];
+			}
+		}
+
+		this._renderFrom(0, null, token);
+	},
+
+	// Renders (or moves into place) the items for this._tweets[index...renderLimit), a chunk at a time
+	_renderFrom: function(index, previousNode, token) {
+		if(token != this._renderToken) {
+			return;
+		}
+
+		var tweets = this._tweets,
+			stop = Math.min(tweets.length, this.renderLimit, index + this.renderChunkSize);
+
+		for(; index < stop; index++) {
+			var item = this._renderItem(tweets[index]);
+
+			// Only touch the DOM when the item isn't already in the right place
+			if(previousNode ? item.domNode.previousSibling !== previousNode : item.domNode !== this.listNode.firstChild) {
+				dojo.place(item.domNode, previousNode || this.listNode, previousNode ? "after" : "first");
+			}
+			previousNode = item.domNode;
+		}
+
 		// Show the list now that we have content for it
 		this.showListNode(true);
+
+		if(index < Math.min(tweets.length, this.renderLimit)) {
+			this._nextFrame(dojo.hitch(this, "_renderFrom", index, previousNode, token));
+		} else {
+			// Anything after previousNode belongs to tweets beyond renderLimit from a previous refresh
+			var node;
+			while((node = previousNode ? previousNode.nextSibling : this.listNode.firstChild)) {
+				var widget = dijit.byNode(node);
+				delete this._items[widget._tweetId];
+				this._releaseItem(widget);
+			}
+		}
+	},
+
+	// Returns the list item for a tweet, reusing its existing item or a recycled one
+	_renderItem: function(tweet) {
+		var id = tweet.id_str || tweet.id,
+			screenName = tweet.user.screen_name,
+			item = this._items[id];
+
+		// Everything shown except the time, which formatTime keeps current
+		var signature = [tweet.text, screenName, tweet.user.name, tweet.user.profile_image_url, tweet.created_at, tweet.collapsed].join("\n");
+
+		if(item && item._tweetSignature == signature) {
+			return item;
+		}
+
+		if(!item) {
+			item = this._itemPool.pop() || new dojox.mobile.ListItem({
+				"class": "tweetviewListItem"
+			});
+			this._items[id] = item;
+		}
+
+		// Update the user class, which may have belonged to another tweet's author
+		if(item._userClass) {
+			dojo.removeClass(item.domNode, item._userClass);
+		}
+		item._userClass = "user-" + screenName;
+		dojo.addClass(item.domNode, item._userClass);
+
+		item._tweetId = id;
+		item._tweetSignature = signature;
+
+		// Update the list item's content using our template for tweets
+		item.containerNode.innerHTML = this.substitute(this.tweetTemplateString, {
+			text: this.formatTweet(tweet.text),
+			user: tweet.from_user || screenName,
+			name: tweet.from_user || tweet.user.name,
+			avatar: tweet.profile_image_url || tweet.user.profile_image_url,
+			time: this.formatTime(tweet.created_at),
+			created_at: tweet.created_at,
+			collapsed: tweet.collapsed ? this.substitute(this.collapsedTemplateString, {count: tweet.collapsed}) : "",
+			id: tweet.id
+		});
+
+		return item;
+	},
+
+	// Takes an item out of the list and keeps it for reuse
+	_releaseItem: function(item) {
+		if(item.domNode.parentNode) {
+			item.domNode.parentNode.removeChild(item.domNode);
+		}
+		item._tweetId = item._tweetSignature = null;
+		this._itemPool.push(item);
+	},
+
+	// Renders more of the list once the user scrolls close to the end of what's rendered
+	_onScroll: function() {
+		if(!this._tweets || this.renderLimit >= this._tweets.length) {
+			return;
+		}
+
+		// dim.o.h is how far the list can scroll and pos.y (<= 0) how far it has, so this is
+		// "less than a screenful left"
+		var dim = this.getDim(), pos = this.getPos();
+		if(dim.o.h + pos.y < dim.d.h) {
+			this.renderLimit += this.renderPageSize;
+			this._renderFrom(0, null, ++this._renderToken);
+		}
+	},
+
+	_nextFrame: function(callback) {
+		var raf = window.requestAnimationFrame || window.webkitRequestAnimationFrame || window.mozRequestAnimationFrame;
+		if(raf) {
+			raf(callback);
+		} else {
+			setTimeout(callback, 16);
+		}
 	},
 	
 	// Adds the proper tweet linkification to a string
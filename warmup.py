@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+##################################################################################################
+# Handles App Engine's warmup requests (see inbound_services in app.yaml), which are sent to a
+# new instance before it's given user traffic. Everything a cold instance would otherwise load
+# on its first requests is loaded here instead: the other handler scripts and what they import
+# lazily (the template stack, PayPal's client), the compiled templates and pre-rendered pages,
+# and the normalization pipelines.
+##################################################################################################
+
+import os
+import time
+import logging
+
+from google.appengine.ext import webapp
+from google.appengine.ext.webapp import util
+
+import bootstrap
+import normalize
+import rendering
+
+# Pages that are always rendered with the same values, as the handlers render them
+
+STATIC_PAGES = [('root.html', {'title' : 'Tweet Relevance'}),
+                ('cancel_purchase.html', {'title' : 'Cancel Purchase'}),
+                ('session_expired.html', {'title' : 'Session Expired'})]
+
+def warm():
+
+  # The scripts themselves are run separately by App Engine; importing them here loads what they
+  # import, which is the bulk of their cold start
+
+  import main
+  import datahandler
+  import payments
+
+  payments.load_paypal()
+
+  # Importing the modules that refresh.py loads lazily keeps a /tasks/refresh from paying for it
+
+  import relevance
+
+  for name in os.listdir(rendering.TEMPLATE_DIR):
+    if name.endswith('.html'):
+      rendering.get_template(name)
+
+  for name, template_values in STATIC_PAGES:
+    rendering.render_static(name, template_values)
+
+  for language in normalize.LANGUAGES:
+    normalize.get(language)
+
+class WarmupHandler(webapp.RequestHandler):
+
+  def get(self):
+    start = time.time()
+    warm()
+    logging.info("Warmed up in %.3fs" % (time.time() - start))
+
+application = webapp.WSGIApplication([('/_ah/warmup', WarmupHandler)], debug=True)
+
+def main():
+  util.run_wsgi_app(application)
+
+if __name__ == '__main__':
+  main()